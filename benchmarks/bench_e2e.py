@@ -0,0 +1,274 @@
+"""End-to-end benchmark of the worker loop, offline.
+
+Runs the real `main.finish_all_tasks` / `process_msg` / `cog_handler` code
+against an in-memory Supabase, a fake docker client whose containers are
+local cog stubs with configurable setup and predict latencies, and a stub
+of the storage service. Outputs are published to the local sync backend
+every `--sync-interval` seconds while a pollen runs.
+
+With `--slots`, several slots poll in their own threads like `main.run_slots`,
+each with its own container pool, so the locking of claims, the pools and
+the journal is exercised under contention.
+
+For every workload it reports pollens/hour, the mean seconds per phase from
+the pollen traces, the overhead (everything but the prediction) and how
+often a model had to be started.
+
+    PYTHONPATH=. python benchmarks/bench_e2e.py --workload interleaved \\
+        --pollens 30 --setup 2 --predict 0.2 --claims atomic
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from functools import partial
+
+from benchmarks.fakes import FakeDockerClient, FakeSupabase, StorageStub, free_port
+from pollinator import cog_handler, constants, main, process_msg, storage
+from pollinator.cache import ContentCache
+from pollinator.claim import SupabaseClaims
+from pollinator.postprocess import PostProcessQueue
+from pollinator.prefetch import Prefetcher
+from pollinator.registry import ModelRegistry
+from pollinator.slots import Slot
+
+TABLE = "pollen_bench"
+IMAGES = ["bench/model-a", "bench/model-b", "bench/model-c"]
+
+
+def single(db, pollens):
+    for _ in range(pollens):
+        db.insert_pollen(TABLE, IMAGES[0])
+
+
+def interleaved(db, pollens):
+    """Two models requested in turns, all submitted at once"""
+    for i in range(pollens):
+        db.insert_pollen(TABLE, IMAGES[i % 2], submitted=f"2022-01-01T00:00:{i:02d}")
+
+
+def mixed(db, pollens):
+    """Three models with random priorities"""
+    rng = random.Random(0)
+    for i in range(pollens):
+        db.insert_pollen(TABLE, rng.choice(IMAGES), priority=rng.choice([0, 0, 1]))
+
+
+def trickle(db, pollens, interval=0.1):
+    """Pollens of two models arriving one after another while the worker runs"""
+
+    def feed():
+        for i in range(pollens):
+            db.insert_pollen(TABLE, IMAGES[i % 2])
+            time.sleep(interval)
+
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    return thread
+
+
+WORKLOADS = {
+    "single": single,
+    "interleaved": interleaved,
+    "mixed": mixed,
+    "trickle": trickle,
+}
+
+
+@contextmanager
+def patched(target, **values):
+    """Set module attributes (or mapping items) and restore them afterwards,
+    including lazy attributes of constants that were not loaded yet"""
+    namespace = target if isinstance(target, MutableMapping) else vars(target)
+    missing = object()
+    previous = {name: namespace.get(name, missing) for name in values}
+    namespace.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is missing:
+                namespace.pop(name, None)
+            else:
+                namespace[name] = value
+
+
+def bench_registry(docker_client, concurrency=1):
+    registry = ModelRegistry(None, "bench", docker_client)
+    registry.metadata = {
+        image: {"meta": {"pollinator_group": ["bench"], "concurrency": concurrency}}
+        for image in IMAGES
+    }
+    registry.refresh_local_images()
+    registry.started = True  # nothing to refresh in the background
+    return registry
+
+
+def run(
+    workload,
+    pollens,
+    setup,
+    predict,
+    output_bytes,
+    claims,
+    prefetch,
+    sync_interval,
+    concurrency=1,
+    slots=1,
+):
+    """Process a workload and return the numbers of the run"""
+    profile = dict(
+        setup_seconds=setup, predict_seconds=predict, output_bytes=output_bytes
+    )
+    docker_client = FakeDockerClient({image: profile for image in IMAGES})
+    db = FakeSupabase()
+    storage_stub = StorageStub()
+    with tempfile.TemporaryDirectory() as root, patched(
+        constants,
+        supabase=db,
+        docker_client=docker_client,
+        model_registry=bench_registry(docker_client, concurrency),
+        hostname="bench-worker",
+        ip="127.0.0.1",
+        has_gpu=False,
+        supabase_id="bench",
+        db_name=TABLE,
+        pollinator_group="bench",
+        ipfs_root=root,
+        input_cid_path=os.path.join(root, "input_cid"),
+        attempt_path=os.path.join(root, "attempt"),
+        prefetch_cid_path=os.path.join(root, "prefetch_cid"),
+        setup_durations_path=os.path.join(root, ".setup_durations.json"),
+        cache_path=os.path.join(root, ".cache"),
+        storage_service_endpoint=storage_stub.url,
+        poll_interval=0.05,
+        sync_backend="local",
+        sync_local_path=os.path.join(root, ".store"),
+        sync_interval=sync_interval,
+    ), patched(
+        storage, content_cache=ContentCache(os.path.join(root, ".cache"), 100)
+    ), patched(
+        process_msg,
+        postprocess_queue=PostProcessQueue(
+            os.path.join(root, ".postprocess"), run=lambda cmd: 0
+        ),
+    ), patched(
+        vars(process_msg.journal), path=os.path.join(root, ".journal.jsonl")
+    ):
+        slots = [Slot(index, num_slots=slots) for index in range(slots)]
+        for slot in slots:
+            slot.pool = cog_handler.ContainerPool(
+                name=f"bench-cog{slot.index}", base_port=free_port()
+            )
+            if prefetch:
+                slot.prefetcher = Prefetcher(
+                    partial(main.claim_ahead, slot),
+                    main.release_message,
+                    slot.prefetch_cid_path,
+                )
+        process_msg.postprocess_queue.start()
+        with patched(
+            main,
+            discovery=None,
+            slots=slots,
+            claims=SupabaseClaims(db, TABLE) if claims == "atomic" else None,
+        ):
+            feeder = WORKLOADS[workload](db, pollens)
+
+            def poll(slot):
+                while len(db.unfinished(TABLE)) > 0 or (feeder and feeder.is_alive()):
+                    main.finish_all_tasks(slot)
+                    main.wait_for_work()
+
+            threads = [threading.Thread(target=poll, args=(slot,)) for slot in slots]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds = time.monotonic() - start
+        process_msg.postprocess_queue.stop()
+        for slot in slots:
+            slot.pool.shutdown()
+    storage_stub.stop()
+    docker_client.shutdown()
+    traces = [update["trace"] for update in db.updates if "trace" in update]
+    return {
+        "seconds": seconds,
+        "pollens": len(traces),
+        "succeeded": sum(1 for row in db.tables[TABLE] if row["success"]),
+        "starts": len(docker_client.started),
+        "slots": len(slots),
+        "traces": traces,
+    }
+
+
+def mean_phases(traces):
+    totals = {}
+    for trace in traces:
+        for phase, seconds in trace.items():
+            if isinstance(seconds, (int, float)):
+                totals[phase] = totals.get(phase, 0) + seconds
+    return {phase: total / len(traces) for phase, total in totals.items()}
+
+
+def report(workload, result):
+    phases = mean_phases(result["traces"])
+    per_hour = result["pollens"] / result["seconds"] * 3600
+    overhead = phases.get("total", 0) - phases.get("predict", 0)
+    # every slot starts its first model
+    swaps = max(0, result["starts"] - result["slots"])
+    print(
+        f"{workload}: {result['succeeded']}/{result['pollens']} pollens in "
+        f"{result['seconds']:.1f}s = {per_hour:.0f} pollens/hour, "
+        f"{result['starts']} model starts ({swaps} swaps), "
+        f"overhead {overhead:.3f}s/pollen"
+    )
+    for phase, seconds in sorted(phases.items(), key=lambda item: -item[1]):
+        print(f"  {phase:>14}: {seconds:.3f}s")
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", choices=[*WORKLOADS, "all"], default="all")
+    parser.add_argument("--pollens", type=int, default=20)
+    parser.add_argument("--setup", type=float, default=1.0, help="seconds")
+    parser.add_argument("--predict", type=float, default=0.2, help="seconds")
+    parser.add_argument("--output-bytes", type=int, default=100_000)
+    parser.add_argument("--claims", choices=["atomic", "lock"], default="atomic")
+    parser.add_argument("--prefetch", action="store_true")
+    parser.add_argument("--sync-interval", type=float, default=0.5, help="seconds")
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="predictions per container"
+    )
+    parser.add_argument(
+        "--slots", type=int, default=1, help="slots polling in parallel"
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    workloads = list(WORKLOADS) if args.workload == "all" else [args.workload]
+    for workload in workloads:
+        result = run(
+            workload,
+            args.pollens,
+            args.setup,
+            args.predict,
+            args.output_bytes,
+            args.claims,
+            args.prefetch,
+            args.sync_interval,
+            args.concurrency,
+            args.slots,
+        )
+        report(workload, result)
+
+
+if __name__ == "__main__":
+    main_()
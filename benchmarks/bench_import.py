@@ -0,0 +1,78 @@
+"""Measure how long it takes to import the worker.
+
+Every restart of the worker pays for the import of `pollinator.main`, so it
+must not touch the network, docker or subprocesses. Each run imports the
+module in a fresh interpreter without Supabase credentials and reports the
+slowest modules from `-X importtime`. Exits with 1 if the median exceeds
+`--max-seconds`, so it can run in CI.
+
+    python benchmarks/bench_import.py --runs 5 --max-seconds 1
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def offline_env():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for key in ("SUPABASE_URL", "SUPABASE_API_KEY", "SUPABASE_ID"):
+        env.pop(key, None)
+    return env
+
+
+def import_seconds(module):
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(module=module)],
+        env=offline_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_modules(module, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=offline_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # import time:  self [us] | cumulative [us] | module
+        self_us, _, name = line[len("import time:") :].split("|")
+        rows.append((int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="pollinator.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+    runs = [import_seconds(args.module) for _ in range(args.runs)]
+    median = statistics.median(runs)
+    print(f"import {args.module}: median {median:.3f}s, max {max(runs):.3f}s")
+    for self_us, name in slowest_modules(args.module, top=10):
+        print(f"{self_us / 1000:8.1f} ms  {name}")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"slower than {args.max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare the in-memory and the streaming decoder of cog responses.
+
+Builds a synthetic prediction response with large data URI outputs and
+measures wall time and peak python memory (tracemalloc) of both decoders.
+
+    PYTHONPATH=. python benchmarks/bench_output_decode.py --outputs 4 --megabytes 50
+"""
+
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from pollinator.output_stream import (
+    stream_http_response_files,
+    write_http_response_files,
+)
+
+
+class SyntheticResponse:
+    """Response-like object over a body that is already in memory"""
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+
+def make_body(outputs, megabytes):
+    content = os.urandom(megabytes * 2**20)
+    uri = "data:video/mp4;base64," + base64.b64encode(content).decode()
+    return json.dumps({"status": "succeeded", "output": [uri] * outputs}).encode()
+
+
+def measure(decoder, body):
+    with tempfile.TemporaryDirectory() as output_path:
+        response = SyntheticResponse(body)
+        tracemalloc.start()
+        start = time.perf_counter()
+        decoder(response, output_path)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        written = sum(
+            os.path.getsize(os.path.join(output_path, name))
+            for name in os.listdir(output_path)
+        )
+    return seconds, peak, written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outputs", type=int, default=4)
+    parser.add_argument("--megabytes", type=int, default=25)
+    args = parser.parse_args()
+    body = make_body(args.outputs, args.megabytes)
+    print(f"response body: {len(body) / 2**20:.0f} MB")
+    for name, decoder in [
+        ("in-memory", write_http_response_files),
+        ("streaming", stream_http_response_files),
+    ]:
+        seconds, peak, written = measure(decoder, body)
+        print(
+            f"{name:>10}: {seconds:6.2f}s  peak {peak / 2**20:8.1f} MB  "
+            f"written {written / 2**20:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""In-process stand-ins for Supabase, docker and cog.
+
+They implement just the parts of the client APIs the worker uses, so the
+real `main`, `process_msg` and `cog_handler` code can run without network,
+database or docker daemon.
+"""
+
+import base64
+import json
+import queue
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import docker
+
+from pollinator.claim import claim_order
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Chainable query on one table of FakeSupabase"""
+
+    def __init__(self, db, table, action, payload=None):
+        self.db = db
+        self.table = table
+        self.action = action
+        self.payload = payload
+        self.filters = []
+        self.orders = []
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def execute(self):
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.action == "insert":
+                rows.append(dict(self.payload))
+                return FakeResponse([dict(self.payload)])
+            matches = [row for row in rows if all(f(row) for f in self.filters)]
+            if self.action == "update":
+                for row in matches:
+                    row.update(self.payload)
+                self.db.updates.append(dict(self.payload))
+            for column, desc in reversed(self.orders):
+                matches.sort(key=lambda row: row.get(column) or 0, reverse=desc)
+            return FakeResponse([dict(row) for row in matches])
+
+
+class FakeRpc:
+    def __init__(self, db, params):
+        self.db = db
+        self.params = params
+
+    def execute(self):
+        params = self.params
+        with self.db.lock:
+            candidates = [
+                row
+                for row in self.db.tables.setdefault(params["table_name"], [])
+                if not row["processing_started"] and row["image"] in params["images"]
+            ]
+            if len(candidates) == 0:
+                return FakeResponse(None)
+            row = min(
+                candidates, key=lambda r: claim_order(r, params["preferred_images"])
+            )
+            row.update(
+                processing_started=True,
+                worker=params["worker_name"],
+                pollinator_group=params["group_name"],
+            )
+            return FakeResponse(dict(row))
+
+
+class FakeSupabase:
+    """Tables are lists of dicts. `updates` records every update payload"""
+
+    def __init__(self):
+        self.tables = {}
+        self.updates = []
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+    def rpc(self, name, params):
+        assert name == "claim_next_pollen", name
+        return FakeRpc(self, params)
+
+    def insert_pollen(self, table, image, priority=0, submitted=None):
+        cid = f"Qm{uuid.uuid4().hex}"
+        row = {
+            "input": cid,
+            "image": image,
+            "priority": priority,
+            "request_submit_time": submitted or time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "processing_started": False,
+            "attempt": 0,
+            "output": f"bafy{cid[2:]}",
+            "success": None,
+        }
+        self.table(table).insert(row).execute()
+        return cid
+
+    def unfinished(self, table):
+        with self.lock:
+            return [row for row in self.tables.get(table, []) if row["success"] is None]
+
+
+class FakeTable:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def select(self, *columns):
+        return FakeQuery(self.db, self.name, "select")
+
+    def update(self, payload):
+        return FakeQuery(self.db, self.name, "update", payload)
+
+    def insert(self, payload):
+        return FakeQuery(self.db, self.name, "insert", payload)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def data_uri(size):
+    return "data:image/png;base64," + base64.b64encode(b"\0" * size).decode()
+
+
+class StubCog:
+    """HTTP server that behaves like a cog container: /health-check reports
+    STARTING for `setup_seconds`, predictions take `predict_seconds`"""
+
+    def __init__(self, port, setup_seconds, predict_seconds, output_bytes):
+        self.ready_at = time.monotonic() + setup_seconds
+        self.predict_seconds = predict_seconds
+        self.output = json.dumps(
+            {"status": "succeeded", "output": [data_uri(output_bytes)]}
+        ).encode()
+        self.predictions = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ready = time.monotonic() >= stub.ready_at
+                stub.reply(self, {"status": "READY" if ready else "STARTING"})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.predict_seconds)
+                stub.predictions += 1
+                stub.reply(self, None, body=stub.output)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("localhost", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reply(self, handler, payload, body=None):
+        body = body if body is not None else json.dumps(payload).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StorageStub:
+    """Serves {"input": {...}} for every CID, like store.pollinations.ai"""
+
+    def __init__(self):
+        stub = self
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                cid = self.path.rstrip("/").split("/")[-1]
+                body = json.dumps({"input": {"Prompt": cid}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("localhost", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_port}/ipfs/"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeImage:
+    def __init__(self, name):
+        self.id = f"sha256:{uuid.uuid5(uuid.NAMESPACE_URL, name).hex}"
+        self.tags = [f"{name}:latest"]
+        self.attrs = {"RepoDigests": []}
+
+
+class FakeContainer:
+    def __init__(self, client, name, image, cog):
+        self.client = client
+        self.name = name
+        self.image = image
+        self.cog = cog
+        self.status = "running"
+
+    def kill(self):
+        if self.status == "running":
+            self.cog.stop()
+        self.status = "exited"
+
+    def wait(self, timeout=None):
+        return {"StatusCode": 0}
+
+    def remove(self):
+        self.client.containers.remove(self.name)
+
+    def stats(self, stream=False):
+        return {"memory_stats": {"usage": 2 * 2**30}}
+
+    def logs(self, stream=False, **kwargs):
+        log = f"{self.cog.predictions} predictions\n".encode()
+        return iter([log]) if stream else log
+
+
+class FakeContainers:
+    def __init__(self, client):
+        self.client = client
+        self.running = {}
+
+    def run(self, image_name, name, ports, **kwargs):
+        if name in self.running:
+            raise docker.errors.APIError(f"Conflict: {name} is in use")
+        profile = self.client.profiles[image_name]
+        cog = StubCog(ports["5000/tcp"], **profile)
+        container = FakeContainer(
+            self.client, name, self.client.images.get(image_name), cog
+        )
+        self.running[name] = container
+        self.client.started.append(image_name)
+        return container
+
+    def get(self, name):
+        try:
+            return self.running[name]
+        except KeyError:
+            raise docker.errors.NotFound(f"No such container: {name}")
+
+    def remove(self, name):
+        self.running.pop(name, None)
+
+
+class FakeImages:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, name):
+        if name not in self.client.profiles:
+            raise docker.errors.ImageNotFound(name)
+        return FakeImage(name)
+
+    def list(self):
+        return [FakeImage(name) for name in self.client.profiles]
+
+
+class FakeEvents:
+    """Event stream that never reports anything until it is closed"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while (event := self.queue.get()) is not None:
+            yield event
+
+    def close(self):
+        self.queue.put(None)
+
+
+class FakeDockerClient:
+    """`profiles` maps image names to the keyword arguments of StubCog.
+    `started` lists the image of every container that was started"""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.started = []
+        self.containers = FakeContainers(self)
+        self.images = FakeImages(self)
+
+    def events(self, decode=True, filters=None):
+        return FakeEvents()
+
+    def shutdown(self):
+        for container in list(self.containers.running.values()):
+            container.kill()
@@ -0,0 +1,204 @@
+"""Asynchronous cog predictions with progressive outputs.
+
+The prediction is created with `Prefer: respond-async` and a webhook that
+points to a small HTTP server in the worker. Cog calls the webhook when the
+prediction starts, when it yields outputs, when it logs and when it is
+completed. Every webhook writes the outputs that are new since the last one,
+and the logs so far, into the output folder. The sync watching that folder
+publishes them while the model keeps running.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from pollinator import http_client
+from pollinator.output_stream import DataURIFile
+
+TERMINAL_STATES = ("succeeded", "failed", "canceled")
+
+
+class WebhookReceiver:
+    """HTTP server that hands webhook calls to the prediction they belong to"""
+
+    def __init__(self, host, port=0, public_host="host.docker.internal"):
+        self.handlers = {}
+        self.public_host = public_host
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                self.send_response(200)
+                self.end_headers()
+                prediction_id = self.path.rstrip("/").split("/")[-1]
+                handler = receiver.handlers.get(prediction_id)
+                if handler is not None:
+                    handler(json.loads(body))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, prediction_id):
+        return f"http://{self.public_host}:{self.port}/webhook/{prediction_id}"
+
+    def register(self, prediction_id, handler):
+        self.handlers[prediction_id] = handler
+
+    def unregister(self, prediction_id):
+        self.handlers.pop(prediction_id, None)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class AsyncPrediction:
+    # seconds between status requests, in case a webhook gets lost
+    poll_interval = 30
+
+    def __init__(self, cog_url, output_path, receiver):
+        self.cog_url = cog_url
+        self.output_path = output_path
+        self.receiver = receiver
+        self.id = uuid.uuid4().hex
+        self.prediction = {}
+        self.outputs_written = 0
+        self.started = None
+        self.first_output = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def status(self):
+        return self.prediction.get("status")
+
+    @property
+    def status_code(self):
+        """Status code the synchronous prediction would have returned. Only a
+        prediction whose outcome cog never reported is a 500, a failed or
+        canceled one left the cog server working"""
+        if self.status == "succeeded":
+            return 200
+        if self.status in ("failed", "canceled"):
+            return 422
+        return 500
+
+    @property
+    def text(self):
+        return json.dumps(self.prediction)
+
+    def start(self, inputs):
+        """Create the prediction. Returns False if cog does not support
+        async predictions, so the caller can fall back to a sync request"""
+        self.receiver.register(self.id, self.on_webhook)
+        self.started = time.monotonic()
+        response = http_client.request(
+            "cog_control",
+            "PUT",
+            f"{self.cog_url}/predictions/{self.id}",
+            json={
+                "id": self.id,
+                "input": inputs,
+                "webhook": self.receiver.url(self.id),
+                "webhook_events_filter": ["start", "output", "logs", "completed"],
+            },
+            headers={"Prefer": "respond-async"},
+        )
+        if response.status_code not in (200, 201, 202):
+            logging.info(f"Async prediction not supported: {response.status_code}")
+            self.receiver.unregister(self.id)
+            return False
+        return True
+
+    def on_webhook(self, prediction):
+        with self.lock:
+            if self.done.is_set():
+                return  # a late webhook must not overwrite the final state
+            self.prediction = prediction
+            self.write_outputs(prediction.get("output"))
+            if prediction.get("logs"):
+                write_atomic(self.output_path, "prediction_log", prediction["logs"])
+        if prediction.get("status") in TERMINAL_STATES:
+            self.done.set()
+
+    def write_outputs(self, output):
+        if output is None:
+            return
+        if not isinstance(output, list):
+            # a single output only arrives with the completed webhook
+            output = [output]
+        for index in range(self.outputs_written, len(output)):
+            encoded = output[index]
+            if isinstance(encoded, dict):
+                encoded = encoded.get("file", "")
+            if isinstance(encoded, str):
+                data_file = DataURIFile(self.output_path, index)
+                data_file.write(encoded.encode())
+                data_file.close()
+        if len(output) > self.outputs_written and self.first_output is None:
+            self.first_output = time.monotonic() - self.started
+            logging.info(f"First output after {self.first_output:.2f}s")
+            write_atomic(self.output_path, "time_first_output", str(int(time.time())))
+        self.outputs_written = len(output)
+
+    def wait(self, timeout):
+        """Wait for completion, cancel the prediction on timeout. Stops early
+        if cog can no longer be reached, leaving the outcome unknown"""
+        deadline = time.monotonic() + timeout
+        try:
+            while not self.done.wait(
+                max(0, min(self.poll_interval, deadline - time.monotonic()))
+            ):
+                if time.monotonic() >= deadline:
+                    self.cancel()
+                    self.done.wait(10)
+                elif self.poll():
+                    continue
+                break
+        finally:
+            self.receiver.unregister(self.id)
+        return self.status
+
+    def poll(self):
+        """Fetch the state of the prediction, in case a webhook got lost.
+        Returns False if the cog server cannot be reached"""
+        try:
+            response = http_client.get(
+                "cog_control", f"{self.cog_url}/predictions/{self.id}"
+            )
+            if response.status_code == 200:
+                self.on_webhook(response.json())
+        except requests.exceptions.ConnectionError as e:
+            logging.error(f"Prediction {self.id}: cog is unreachable: {e}")
+            return False
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.warning(f"Polling prediction {self.id} failed: {e}")
+        return True
+
+    def cancel(self):
+        logging.info(f"Cancelling prediction {self.id}")
+        try:
+            http_client.post(
+                "cog_control", f"{self.cog_url}/predictions/{self.id}/cancel"
+            )
+        except Exception as e:  # noqa
+            logging.error(f"Cancelling {self.id} failed: {e}")
+
+
+def write_atomic(path, key, value):
+    """Write via a temporary file so the sync never sees half a file"""
+    tmp_path = os.path.join(path, f".{key}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(value)
+    os.replace(tmp_path, os.path.join(path, key))
@@ -0,0 +1,158 @@
+"""Content-addressed on-disk cache for input documents and referenced files.
+
+IPFS content never changes, so anything addressed by a CID can be kept as
+long as there is space: the input json of a pollen (requested again on
+every retry) and the files its inputs link to. The cache is limited to
+`budget_mb` and the least recently used entries are removed first. The
+folder is bind-mounted into the cog containers, so models can read cached
+files instead of downloading them again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from pollinator import http_client
+from pollinator.metrics import Counter
+
+cache_hits = Counter("pollinator_cache_hits_total", "Content cache hits by kind")
+cache_misses = Counter("pollinator_cache_misses_total", "Content cache misses by kind")
+
+
+def is_immutable(url):
+    """Only content addressed URLs can be cached without revalidation"""
+    return isinstance(url, str) and url.startswith("http") and "/ipfs/" in url
+
+
+def name_for_url(url):
+    extension = posixpath.splitext(urlparse(url).path)[1][:10]
+    return hashlib.sha256(url.encode()).hexdigest()[:40] + extension
+
+
+class ContentCache:
+    def __init__(self, root, budget_mb):
+        self.root = root
+        self.budget = budget_mb * 1024 * 1024
+        self.entries = OrderedDict()  # name -> size, least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Pick up the entries of a previous run, oldest first"""
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue  # unfinished download
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.entries[name] = size
+            self.size += size
+        self._evict()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def lookup(self, name, kind):
+        with self.lock:
+            if name not in self.entries:
+                cache_misses.inc(kind=kind)
+                return None
+            self.entries.move_to_end(name)
+        cache_hits.inc(kind=kind)
+        try:
+            os.utime(self.path(name))  # keeps the order after a restart
+        except FileNotFoundError:
+            pass
+        return self.path(name)
+
+    def store(self, name, write):
+        """Call `write(path)` to create the entry and add it to the cache"""
+        tmp_path = self.path(f".{name}.{threading.get_ident()}.tmp")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self.path(name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        size = os.path.getsize(self.path(name))
+        with self.lock:
+            self.size += size - self.entries.pop(name, 0)
+            self.entries[name] = size
+            self._evict()
+        return self.path(name)
+
+    def _evict(self):
+        # the most recent entry is kept even if it alone exceeds the budget
+        while self.size > self.budget and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            logging.info(f"Evicted {name} ({size} bytes) from the cache")
+
+    def get_json(self, cid, fetch, valid=lambda data: True):
+        """Json document of `cid`, fetched with `fetch(cid)` on a miss.
+        Documents for which `valid` is False, e.g. errors, are not stored"""
+        name = f"{hashlib.sha256(cid.encode()).hexdigest()[:40]}.json"
+        path = self.lookup(name, "input")
+        if path is not None:
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass  # evicted in the meantime or corrupt, fetch again
+        data = fetch(cid)
+        if not valid(data):
+            return data
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+
+        self.store(name, write)
+        return data
+
+    def get_file(self, url):
+        """Name of the cached copy of `url` in the cache folder"""
+        name = name_for_url(url)
+        if self.lookup(name, "file") is not None:
+            return name
+
+        def download(tmp_path):
+            response = http_client.get("storage", url, stream=True)
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=2**16):
+                    f.write(chunk)
+
+        self.store(name, download)
+        return name
+
+    def localize(self, inputs, mount_path):
+        """Replace immutable URLs in the inputs by the path of their cached
+        copy as the cog container sees it. URLs that fail to download are
+        left as they are, the model can still try to fetch them."""
+        localized = {}
+        for key, value in inputs.items():
+            if isinstance(value, dict):
+                value = self.localize(value, mount_path)
+            elif is_immutable(value):
+                try:
+                    value = f"{mount_path}/{self.get_file(value)}"
+                except Exception as e:  # noqa
+                    logging.info(f"Could not cache {value}: {e}")
+            localized[key] = value
+        return localized
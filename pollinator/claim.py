@@ -0,0 +1,83 @@
+"""Claim the next pollen in a single round trip.
+
+`SupabaseClaims` calls the `claim_next_pollen` postgres function from
+sql/claim_next_pollen.sql, which selects and locks the best row with
+`FOR UPDATE SKIP LOCKED`. `LocalClaims` implements the same semantics in
+memory so the behaviour under contention can be tested without a database.
+"""
+
+import threading
+
+
+class ClaimUnavailable(Exception):
+    """The database does not provide the claim function"""
+
+
+def claim_order(row, preferred_images=()):
+    """Sort key: highest priority, then preferred (loaded) images, then oldest"""
+    return (
+        -(row.get("priority") or 0),
+        row["image"] not in preferred_images,
+        row.get("request_submit_time") or "",
+    )
+
+
+class SupabaseClaims:
+    def __init__(self, supabase, table):
+        self.supabase = supabase
+        self.table = table
+
+    def claim_next(self, images, preferred_images, worker, group):
+        from postgrest.exceptions import APIError
+
+        try:
+            response = self.supabase.rpc(
+                "claim_next_pollen",
+                {
+                    "table_name": self.table,
+                    "images": list(images),
+                    "preferred_images": list(preferred_images),
+                    "worker_name": worker,
+                    "group_name": group,
+                },
+            ).execute()
+        except APIError as e:
+            if getattr(e, "code", None) in ("PGRST202", "42883"):
+                raise ClaimUnavailable(str(e))
+            raise
+        return response.data or None
+
+
+class LocalClaims:
+    """In-memory stand-in for the pollen table and its claim function"""
+
+    def __init__(self, rows=()):
+        self.lock = threading.Lock()
+        self.rows = {}
+        for row in rows:
+            self.insert(row)
+
+    def insert(self, row):
+        row = {"priority": 0, "attempt": 0, **row}
+        row.setdefault("processing_started", False)
+        with self.lock:
+            self.rows[row["input"]] = row
+
+    def claim_next(self, images, preferred_images, worker, group):
+        with self.lock:
+            candidates = [
+                row
+                for row in self.rows.values()
+                if not row["processing_started"] and row["image"] in images
+            ]
+            if len(candidates) == 0:
+                return None
+            row = min(candidates, key=lambda r: claim_order(r, preferred_images))
+            row.update(processing_started=True, worker=worker, pollinator_group=group)
+            return dict(row)
+
+    def release(self, input_cid):
+        with self.lock:
+            self.rows[input_cid].update(
+                processing_started=False, worker=None, pollinator_group=None
+            )
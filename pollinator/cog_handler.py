@@ -1,68 +1,349 @@
-import base64
 import datetime as dt
+import glob
 import json
 import logging
+import os
+import threading
 import time
-from mimetypes import guess_extension
 
 import docker
 import requests
 
-from pollinator import constants
+from pollinator import constants, http_client, tracing
+from pollinator.async_prediction import AsyncPrediction, WebhookReceiver
+from pollinator.logstream import LogFollower, NoLogs
+from pollinator.metrics import Counter, Histogram
+from pollinator.output_stream import stream_http_response_files
+from pollinator.readiness import (  # noqa: F401
+    UnhealthyCogContainer,
+    load_setup_durations,
+    record_setup_duration,
+    setup_durations,
+    wait_until_ready,
+)
+from pollinator.recycling import RecyclePolicy, Vitals, gpu_memory_mb, sample
 from pollinator.storage import write_folder
 
-docker_client = docker.from_env()
+load_setup_durations(constants.setup_durations_path)
 
 
-class UnhealthyCogContainer(Exception):
-    pass
+memory_usage = {}  # image -> MB a resident container of that image used
+gpu_memory_usage = {}  # image -> MB of GPU memory its last start took
+recycle_policy = RecyclePolicy(
+    memory_growth=constants.recycle_memory_growth,
+    gpu_memory_growth=constants.recycle_gpu_memory_growth,
+    latency_drift=constants.recycle_latency_drift,
+    cpu_percent=constants.recycle_cpu_percent,
+    max_pollen=constants.recycle_max_pollen,
+)
 
+cold_starts = Counter("pollinator_cold_starts_total", "Cog containers started by image")
+cold_start_seconds = Histogram(
+    "pollinator_cold_start_seconds", "Seconds until a started cog container was ready"
+)
+prediction_seconds = Histogram(
+    "pollinator_prediction_seconds", "Duration of cog predictions by image and outcome"
+)
+output_bytes = Counter(
+    "pollinator_output_bytes_total", "Bytes of prediction outputs written by image"
+)
+recycles = Counter(
+    "pollinator_container_recycles_total", "Degraded cog containers restarted by reason"
+)
 
-loaded_model = None
-MAX_NUM_POLLEN_UNTIL_RESTART = 100
 
+class CogContainer:
+    """A resident cog container of the pool"""
 
-class RunningCogModel:
-    def __init__(self, image, output_path):
-        self.image_name = image
-        self.image = docker_client.images.get(image)
-        self.output_path = output_path
-        self.container = None
-        self.pollen_start_time = None
+    def __init__(self, image_name, image_id, name, port):
+        self.image_name = image_name
+        self.image_id = image_id
+        self.name = name
+        self.port = port
+        self.last_used = time.monotonic()
         self.pollen_since_container_start = 0
+        self.vitals = Vitals()
+        self.recycle_reason = None  # (kind, description) once it degraded
+        self.flagged_at = 0  # pollen served when it was flagged
+        self.in_flight = 0  # pollen using the container right now
 
-    def __enter__(self):
-        global loaded_model
-        # Check if the container is already running
-        self.pollen_start_time = dt.datetime.now()
-        try:
-            container_object = docker_client.containers.get("cogmodel")
-            running_image = container_object.image
-            logging.info(f"got running image from docker_client: {running_image} with status {container_object.status}")
+    @property
+    def url(self):
+        return f"http://localhost:{self.port}"
 
-            # check if image is created but not started. start in that case
-            if container_object.status == "created":
-                logging.info(f"container is created but not running. starting")
-                container_object.start()
+    @property
+    def memory_mb(self):
+        return memory_usage.get(self.image_name, constants.model_memory_mb)
 
-        except docker.errors.NotFound:
-            running_image = None
-        logging.info(f"Running image: {running_image}")
+    @property
+    def gpu_memory_mb(self):
+        return model_gpu_memory_mb(self.image_name)
+
+
+def model_gpu_memory_mb(image_name):
+    """GPU memory a container of the image takes: declared in its metadata,
+    else measured at its last start, else model_gpu_memory_mb"""
+    declared = constants.gpu_memory(image_name)
+    if declared is not None:
+        return declared
+    return gpu_memory_usage.get(image_name, constants.model_gpu_memory_mb)
+
+
+class ContainerPool:
+    """Keep several cog containers running on distinct ports.
+
+    The container on `base_port` is called `name`, the others `name-1`,
+    `name-2`, ... on the following ports. When starting another model would
+    exceed `memory_budget_mb`, or on a GPU `gpu_memory_budget_mb` (by default
+    the size of the GPU), the least recently used containers are killed.
+    With a budget of 0, only one container is resident at a time.
+    `device_ids` pins the containers to GPUs, by default any one GPU is used."""
 
+    def __init__(
+        self,
+        name="cogmodel",
+        base_port=5000,
+        memory_budget_mb=0,
+        device_ids=None,
+        gpu_memory_budget_mb=0,
+    ):
+        self.name = name
+        self.base_port = base_port
+        self.memory_budget_mb = memory_budget_mb
+        self._gpu_memory_budget_mb = gpu_memory_budget_mb
+        self.device_ids = device_ids
+        self.containers = {}  # image name -> CogContainer
+        self.policy = recycle_policy
+        # lanes of the slot acquire containers from their own threads
+        self.lock = threading.RLock()
+        self.released = threading.Condition(self.lock)
+        self.restarting = None  # thread restarting degraded containers
+
+    def container_name(self, index):
+        return self.name if index == 0 else f"{self.name}-{index}"
+
+    def loaded_images(self):
+        return set(self.containers)
+
+    def adopt_running_containers(self, handover=None):
+        """Register cog containers that survived a restart of the worker.
+        `handover` is the state the previous worker wrote when it drained."""
+        handover = handover or {}
+        for index in range(constants.max_resident_models):
+            try:
+                name = self.container_name(index)
+                container = constants.docker_client.containers.get(name)
+            except docker.errors.NotFound:
+                continue
+            image_name = image_name_of(container)
+            logging.info(f"Adopting running {container.name} with {image_name}")
+            if container.status == "created":
+                container.start()
+            cog = CogContainer(
+                image_name,
+                container.image.id,
+                container.name,
+                self.base_port + index,
+            )
+            state = handover.get(container.name)
+            if state is not None and state["image_id"] == container.image.id:
+                cog.pollen_since_container_start = state["pollen_since_container_start"]
+            self.containers[image_name] = cog
+
+    def handover_state(self):
+        """What the next worker needs to take over the containers"""
+        return [
+            {
+                "name": cog.name,
+                "image_name": cog.image_name,
+                "image_id": cog.image_id,
+                "port": cog.port,
+                "pollen_since_container_start": cog.pollen_since_container_start,
+            }
+            for cog in self.containers.values()
+        ]
+
+    def acquire(self, image_name, output_path):
+        """Return a healthy container for the image, starting it if needed.
+        Every acquire must be followed by a release."""
+        with self.lock:
+            cog = self._acquire(image_name, output_path)
+            cog.in_flight += 1
+            return cog
+
+    def release(self, cog):
+        with self.lock:
+            cog.in_flight -= 1
+            if cog.in_flight == 0 and cog_failed(cog):
+                self.recycle(cog)
+                self.released.notify_all()
+
+    def fail(self, cog):
+        """A prediction crashed the cog server. The container is stopped right
+        away, or by the last release if other pollen still use it. Until then,
+        new pollen of the image wait for it to stop."""
+        with self.lock:
+            if cog.in_flight > 1:
+                logging.info(f"{cog.name} failed, stopping it once it is idle")
+                cog.recycle_reason = ("failure", "a prediction failed")
+            else:
+                self.evict(cog)
+
+    def _acquire(self, image_name, output_path):
+        image = constants.docker_client.images.get(image_name)
+        cog = self.containers.get(image_name)
+        while cog is not None and cog_failed(cog):
+            self.released.wait()
+            cog = self.containers.get(image_name)
         if (
-            self.image == running_image
-            and self.pollen_since_container_start < MAX_NUM_POLLEN_UNTIL_RESTART
-            and running_image is not None
+            cog is not None
+            and cog.image_id == image.id
+            and not self.must_recycle(cog)
+            and self.is_running(cog)
         ):
-            self.pollen_since_container_start += 1
-            logging.info(f"Model already loaded: {self.image}")
-            loaded_model = self.image_name
-            return self
-        # Kill the running container if it is not the same model
-        self.kill_cog_model(logs=False)
-        self.pollen_since_container_start = 0
-        # Start the container
-        if constants.has_gpu:
+            logging.info(f"Model already loaded: {image_name} in {cog.name}")
+            tracing.tag("container_state", "reused")
+        else:
+            if cog is not None and cog.recycle_reason is not None:
+                self.recycle(cog)
+            elif cog is not None:
+                self.evict(cog)
+            cog = self.start(image_name, image, output_path)
+            tracing.tag("container_state", "started")
+        cog.pollen_since_container_start += 1
+        cog.last_used = time.monotonic()
+        return cog
+
+    def must_recycle(self, cog):
+        """A degraded container is restarted when the slot is idle, but if
+        the slot never idles, at the latest after recycle_defer_pollen pollen"""
+        return (
+            cog.recycle_reason is not None
+            and cog.vitals.pollen - cog.flagged_at >= constants.recycle_defer_pollen
+            and cog.in_flight == 0
+        )
+
+    def observe(self, cog, seconds):
+        """Record a prediction and sample the container in the background,
+        `docker stats` takes a second or two"""
+        cog.vitals.observe_latency(seconds)
+        threading.Thread(target=self.check_vitals, args=(cog,), daemon=True).start()
+
+    def check_vitals(self, cog):
+        try:
+            vitals = sample(constants.docker_client.containers.get(cog.name))
+        except (docker.errors.NotFound, docker.errors.APIError, KeyError):
+            return
+        # the GPU memory can only be attributed to a container that is alone
+        if constants.has_gpu and len(self.containers) == 1:
+            vitals["gpu_memory_mb"] = gpu_memory_mb(self.device_ids)
+        cog.vitals.observe_sample(vitals)
+        reason = self.policy.reason(cog.vitals)
+        with self.lock:
+            if reason is not None and cog.recycle_reason is None:
+                logging.info(f"{cog.name} with {cog.image_name} degraded: {reason[1]}")
+                cog.recycle_reason = reason
+                cog.flagged_at = cog.vitals.pollen
+
+    def recycle(self, cog):
+        logging.info(f"Recycling {cog.name}: {cog.recycle_reason[1]}")
+        recycles.inc(image=cog.image_name, reason=cog.recycle_reason[0])
+        self.evict(cog)
+
+    def recycle_degraded(self, output_path):
+        """Stop the degraded containers while there is nothing to do, and start
+        them again in the background, so the slot keeps polling for work"""
+        if self.restarting is not None and self.restarting.is_alive():
+            return
+        with self.lock:
+            degraded = [
+                cog
+                for cog in self.containers.values()
+                if cog.recycle_reason is not None and cog.in_flight == 0
+            ]
+            for cog in degraded:
+                self.recycle(cog)
+        if len(degraded) > 0:
+            self.restarting = threading.Thread(
+                target=self.restart,
+                args=([cog.image_name for cog in degraded], output_path),
+                daemon=True,
+            )
+            self.restarting.start()
+
+    def restart(self, image_names, output_path):
+        for image_name in image_names:
+            with self.lock:
+                if image_name in self.containers:
+                    continue  # a pollen started it meanwhile
+                try:
+                    image = constants.docker_client.images.get(image_name)
+                    self.start(image_name, image, output_path)
+                except (UnhealthyCogContainer, docker.errors.DockerException) as e:
+                    logging.error(f"Could not restart {image_name}: {e}")
+
+    def is_running(self, cog):
+        try:
+            container = constants.docker_client.containers.get(cog.name)
+        except docker.errors.NotFound:
+            return False
+        if container.status == "created":
+            logging.info("container is created but not running. starting")
+            container.start()
+        return container.status in ("created", "running")
+
+    @property
+    def gpu_memory_budget_mb(self):
+        """GPU memory the containers may take, None without GPU"""
+        if not constants.has_gpu:
+            return None
+        if self._gpu_memory_budget_mb <= 0:
+            # the containers of a pool without device_ids land on one GPU
+            devices = self.device_ids if self.device_ids is not None else ["0"]
+            size = gpu_memory_mb(devices, field="memory.total")
+            if size is None:
+                return None
+            self._gpu_memory_budget_mb = size
+        return self._gpu_memory_budget_mb
+
+    def exceeds_budget(self, image_name):
+        containers = self.containers.values()
+        if len(containers) >= constants.max_resident_models:
+            return True
+        needed = memory_usage.get(image_name, constants.model_memory_mb)
+        if sum(c.memory_mb for c in containers) + needed > self.memory_budget_mb:
+            return True
+        gpu_budget = self.gpu_memory_budget_mb
+        if gpu_budget is None:
+            return False
+        needed = model_gpu_memory_mb(image_name)
+        return sum(c.gpu_memory_mb for c in containers) + needed > gpu_budget
+
+    def make_room(self, image_name):
+        while len(self.containers) > 0 and self.exceeds_budget(image_name):
+            self.evict(min(self.containers.values(), key=lambda c: c.last_used))
+
+    def free_index(self):
+        used = {c.port - self.base_port for c in self.containers.values()}
+        return min(i for i in range(len(used) + 1) if i not in used)
+
+    def start(self, image_name, image, output_path):
+        self.make_room(image_name)
+        index = self.free_index()
+        cog = CogContainer(
+            image_name, image.id, self.container_name(index), self.base_port + index
+        )
+        # a leftover container with the same name would block the start
+        kill_container(cog.name)
+        gpu_before = gpu_memory_mb(self.device_ids) if constants.has_gpu else None
+        if constants.has_gpu and self.device_ids is not None:
+            gpus = [
+                docker.types.DeviceRequest(
+                    device_ids=self.device_ids,
+                    capabilities=[["gpu"]],
+                )
+            ]
+        elif constants.has_gpu:
             gpus = [
                 docker.types.DeviceRequest(
                     count=1,
@@ -71,94 +352,196 @@ class RunningCogModel:
             ]
         else:
             gpus = []
-        container = docker_client.containers.run(
-            self.image,
+        container = constants.docker_client.containers.run(
+            image_name,
             detach=True,
-            name="cogmodel",
-            ports={"5000/tcp": 5000},
-            volumes={self.output_path: {"bind": "/outputs", "mode": "rw"}},
+            name=cog.name,
+            ports={"5000/tcp": cog.port},
+            volumes={
+                output_path: {"bind": "/outputs", "mode": "rw"},
+                constants.cache_path: {
+                    "bind": constants.cache_mount_path,
+                    "mode": "ro",
+                },
+            },
             remove=True,
             auto_remove=True,
             device_requests=gpus,
             stderr=True,
             tty=True,
+            # lets the container reach the webhook receiver of async predictions
+            extra_hosts={"host.docker.internal": "host-gateway"},
             environment={
                 "SUPABASE_URL": constants.url,
                 "SUPABASE_API_KEY": constants.supabase_api_key,
                 "SUPABASE_ID": constants.supabase_id,
                 "OPENAI_API_KEY": constants.openai_api_key,
-                "WEB3STORAGE_TOKEN": constants.web3storage_token
+                "WEB3STORAGE_TOKEN": constants.web3storage_token,
             },
         )
-        logging.info(f"Starting {self.image}: {container}")
+        logging.info(f"Starting {image_name} as {cog.name}: {container}")
         # Wait for the container to start
-        self.wait_until_cogmodel_is_healthy()
-        loaded_model = self.image_name
+        logging.info(f"Waiting for {image_name} to start")
+        try:
+            with tracing.span("health_wait"):
+                seconds = wait_until_ready(constants.docker_client, cog.name, cog.url)
+        except UnhealthyCogContainer:
+            kill_container(cog.name)
+            raise
+        logging.info(f"Model healthy: {image_name}")
+        record_setup_duration(image_name, seconds, constants.setup_durations_path)
+        cold_starts.inc(image=image_name)
+        cold_start_seconds.observe(seconds, image=image_name)
+        self.measure_memory(cog, gpu_before)
+        self.containers[image_name] = cog
+        return cog
+
+    def measure_memory(self, cog, gpu_before=None):
+        try:
+            stats = constants.docker_client.containers.get(cog.name).stats(stream=False)
+            memory_usage[cog.image_name] = stats["memory_stats"]["usage"] / 2**20
+        except (docker.errors.NotFound, docker.errors.APIError, KeyError):
+            pass
+        # the weights sit in GPU memory: what the GPU gained while it started.
+        # The pool lock keeps other containers of the GPU from starting meanwhile
+        gpu_after = gpu_memory_mb(self.device_ids) if gpu_before is not None else None
+        if gpu_after is not None:
+            gpu_memory_usage[cog.image_name] = max(0, gpu_after - gpu_before)
+
+    def evict(self, cog):
+        logging.info(f"Evicting {cog.image_name} from {cog.name}")
+        self.containers.pop(cog.image_name, None)
+        kill_container(cog.name)
+
+    def shutdown(self):
+        if self.restarting is not None:
+            self.restarting.join()
+        for cog in list(self.containers.values()):
+            self.evict(cog)
+
+
+class RunningCogModel:
+    def __init__(self, image, slot):
+        self.image_name = image
+        self.pool = slot.pool
+        self.output_path = slot.output_path
+        self.cog = None
+        self.pollen_start_time = None
+
+    @property
+    def container_name(self):
+        return self.cog.name
+
+    @property
+    def port(self):
+        return self.cog.port
+
+    def __enter__(self):
+        self.pollen_start_time = dt.datetime.now()
+        with tracing.span("container"):
+            self.cog = self.pool.acquire(self.image_name, self.output_path)
         return self
 
     def __exit__(self, type, value, traceback):
-        # write container logs to output folder
-        self.write_logs()
+        self.pool.release(self.cog)
 
-    def write_logs(self):
-        try:
-            logs = (
-                docker_client.containers.get("cogmodel")
-                .logs(stdout=True, stderr=True, since=self.pollen_start_time)
-                .decode("utf-8")
-            )
-            write_folder(self.output_path, "log", logs)
-        except (docker.errors.NotFound, docker.errors.APIError):
-            pass
+    def follow_logs(self):
+        """Write the logs of this pollen to the output folder while they come.
+        The logs of a container that runs several pollen at once can not be
+        told apart, so they are only followed if it runs one at a time. Async
+        predictions still get their own logs from the webhooks."""
+        if constants.concurrency(self.image_name) > 1:
+            return NoLogs()
+        return LogFollower(
+            constants.docker_client.containers.get(self.container_name),
+            f"{self.output_path}/log",
+            since=self.pollen_start_time,
+            max_bytes=constants.log_max_bytes,
+            compress=constants.log_compress,
+        )
+
+    def predict(self, inputs):
+        start = time.monotonic()
+        response = send_to_cog_container(
+            inputs, self.output_path, self.port, self.image_name
+        )
+        if response.status_code == 200:
+            self.pool.observe(self.cog, time.monotonic() - start)
+        return response
 
     def shutdown(self):
-        self.write_logs()
-        self.kill_cog_model()
+        self.pool.fail(self.cog)
 
-    def kill_cog_model(self, logs=True):
-        # get cogmodel logs and write them to output folder and kill container
-        for i in range(5):
-            try:
-                logging.info(f"trying to kill and remove cogmodel container. attempt {i}")
-                container = docker_client.containers.get("cogmodel")
-                if logs:
-                    self.write_logs()
-                container.kill()
-                logging.info(f"Killed {self.image}")
-                time.sleep(1)
-                container.remove()
-            except docker.errors.NotFound:
-                return
-            except docker.errors.APIError:
-                time.sleep(1)
 
-    def wait_until_cogmodel_is_healthy(self, timeout=40 * 60):
-        # Wait for the container to start
-        logging.info(f"Waiting for {self.image} to start")
-        for i in range(timeout):
-            try:
-                assert (
-                    requests.get(
-                        "http://localhost:5000/",
-                    ).status_code
-                    == 200
-                )
-                logging.info(f"Model healthy: {self.image}")
-                return
-            except:  # noqa
-                time.sleep(1)
-        raise UnhealthyCogContainer(f"Model unhealthy: {self.image}")
+def cog_failed(cog):
+    return cog.recycle_reason is not None and cog.recycle_reason[0] == "failure"
+
 
+def image_name_of(container):
+    """Name of the image of a container without the tag, as in the model index"""
+    tags = container.image.tags
+    if len(tags) == 0:
+        return container.image.id
+    name, _, tag = tags[0].rpartition(":")
+    return name if "/" not in tag else tags[0]
 
-def send_to_cog_container(inputs, output_path):
+
+def kill_container(name):
+    for i in range(5):
+        try:
+            logging.info(f"trying to kill and remove {name} container. attempt {i}")
+            container = constants.docker_client.containers.get(name)
+            container.kill()
+            logging.info(f"Killed {name}")
+            container.wait(timeout=10)
+            container.remove()
+        except docker.errors.NotFound:
+            return
+        except (docker.errors.APIError, requests.exceptions.RequestException):
+            time.sleep(1)
+
+
+def send_to_cog_container(inputs, output_path, port=5000, image=None):
+    start = time.monotonic()
+    with tracing.span("predict"):
+        response = predict(inputs, output_path, port, image)
+    outcome = "success" if response.status_code == 200 else "failure"
+    prediction_seconds.observe(time.monotonic() - start, image=image, outcome=outcome)
+    output_bytes.inc(
+        sum(os.path.getsize(path) for path in glob.glob(f"{output_path}/out_*")),
+        image=image,
+    )
+    return response
+
+
+def predict(inputs, output_path, port, image):
     logging.info("Send to cog model", inputs)
     inputs = flatten_image_inputs(inputs)
-    
+
     # Send message to cog container
     payload = {"input": inputs}
-   
 
-    response = requests.post("http://localhost:5000/predictions", json=payload)
+    if constants.async_predictions(image):
+        prediction = AsyncPrediction(
+            f"http://localhost:{port}", output_path, webhook_receiver()
+        )
+        if prediction.start(inputs):
+            write_folder(output_path, "time_start", str(int(time.time())))
+            prediction.wait(constants.prediction_timeout(image))
+            logging.info(f"Prediction {prediction.id}: {prediction.status}")
+            if prediction.status_code != 200:
+                write_folder(output_path, "cog_response", json.dumps(prediction.text))
+                write_folder(output_path, "success", "false")
+            write_folder(output_path, "done", "true")
+            return prediction
+
+    response = http_client.post(
+        "cog_predict",
+        f"http://localhost:{port}/predictions",
+        json=payload,
+        timeout=(3, constants.prediction_timeout(image)),
+        stream=True,
+    )
     logging.info(f"response: {response}")
     write_folder(output_path, "time_start", str(int(time.time())))
     write_folder(output_path, "done", "true")
@@ -166,39 +549,35 @@ def send_to_cog_container(inputs, output_path):
         write_folder(output_path, "cog_response", json.dumps(response.text))
         write_folder(output_path, "success", "false")
     else:
-        write_http_response_files(response, output_path)
+        # decode the outputs while they are downloaded
+        with tracing.span("output_write"):
+            stream_http_response_files(response, output_path)
         write_folder(output_path, "done", "true")
         logging.info(f"Set done to true in {output_path}")
     return response
 
 
-def write_http_response_files(response, output_path):
-    try:
-        output = response.json()["output"]
-        if not isinstance(output, list):
-            output = [output]
-        for i, encoded_file in enumerate(output):
-            try:
-                encoded_file = encoded_file["file"]
-            except TypeError:
-                pass  # already a string
-            meta, encoded = encoded_file.split(";base64,")
-            extension = guess_extension(meta.split(":")[1])
-            with open(f"{output_path}/out_{i}{extension}", "wb") as f:
-                f.write(base64.b64decode(encoded))
-    except Exception as e:  # noqa
-        logging.info(f"http response not written to file: {type(e)} {e}")
+_webhook_receiver = None
+_webhook_receiver_lock = threading.Lock()
 
 
+def webhook_receiver():
+    """The webhook receiver is only started when the first async prediction
+    is sent, and shared by all slots"""
+    global _webhook_receiver
+    with _webhook_receiver_lock:
+        if _webhook_receiver is None:
+            _webhook_receiver = WebhookReceiver("0.0.0.0", constants.webhook_port)
+        return _webhook_receiver
 
-# transform dict of the form 
-# {"image": {"input1.png": "https://store.pollinations.ai/ipfs/Qm..."} } 
+
+# transform dict of the form
+# {"image": {"input1.png": "https://store.pollinations.ai/ipfs/Qm..."} }
 # to
-# {"image": "https://store.pollinations.ai/ipfs/Qm..."} 
-def flatten_image_inputs(content):  
+# {"image": "https://store.pollinations.ai/ipfs/Qm..."}
+def flatten_image_inputs(content):
     for key, value in content.items():
         # if value is object, it is a dict of the form {"input1.png": "https://store.pollinations.ai/ipfs/Qm..."}
         if isinstance(value, dict):
             content[key] = list(value.values())[1]
     return content
-
@@ -1,49 +1,130 @@
+"""Configuration of the pollinator.
+
+Settings from the environment are plain module attributes. Values that need
+the network, docker or a subprocess (the public IP and hostname, the GPU
+check, the Supabase and docker clients, the model registry) are created on
+first access through the module `__getattr__` (PEP 562), so importing the
+package is fast and works offline.
+"""
+
 import logging
 import os
 import random
 import socket
-import time
-from functools import lru_cache
+import threading
 
-import docker
 import requests
 from dotenv import load_dotenv
-from supabase import Client, create_client
 
 from pollinator import utils
 
-try:
-    ip = requests.get("http://ip.42.pl/raw").text
-except:  # noqa
-    ip = "?"
-try:
-    hostname, _, _ = socket.gethostbyaddr(ip)
-except:  # noqa
-    hostname = ip
-
-
 load_dotenv()
 url: str = os.environ.get("SUPABASE_URL")
 supabase_api_key: str = os.environ.get("SUPABASE_API_KEY")
-supabase: Client = create_client(url, supabase_api_key)
-supabase_id: str = os.environ["SUPABASE_ID"]
 storage_service_endpoint = "https://store.pollinations.ai/ipfs/"
 openai_api_key = os.environ.get("OPENAI_API_KEY")
 web3storage_token = os.environ.get("WEB3STORAGE_TOKEN")
 db_name = ""  # will be set by main.py or a test
 test_image = "no-gpu-test-image"
 i_am_busy = False
-has_gpu = utils.system("nvidia-smi >/dev/null 2>&1") == 0
-gpu_flag = "--gpus all" if has_gpu else ""
 pollinator_image = os.environ.get("POLLINATOR_IMAGE")
 input_cid_path = "/tmp/ipfs/input_cid"
 attempt_path = "/tmp/ipfs/attempt"
+prefetch_cid_path = "/tmp/ipfs/prefetch_cid"
 max_attempts = 3
 ipfs_root = os.path.abspath("/tmp/ipfs/")
 output_path = os.path.join(ipfs_root, "output")
 input_path = os.path.join(ipfs_root, "input")
+postprocess_queue_path = os.environ.get(
+    "POLLINATOR_POSTPROCESS_QUEUE", os.path.join(ipfs_root, ".postprocess")
+)
+setup_durations_path = os.path.join(ipfs_root, ".setup_durations.json")
+# steps of the pollen in flight, to resume them after a crash (pollinator/journal.py)
+journal_path = os.environ.get(
+    "POLLINATOR_JOURNAL", os.path.join(ipfs_root, ".journal.jsonl")
+)
+postprocess_workers = int(os.environ.get("POLLINATOR_POSTPROCESS_WORKERS", 2))
+# publish the folder of a slot with "pollinate-cli" (IPFS) or "local" (a content
+# addressed store in sync_local_path, for tests), every sync_interval seconds
+# while a pollen runs, in uploads of up to sync_batch_bytes (pollinator/sync.py)
+sync_backend = os.environ.get("POLLINATOR_SYNC_BACKEND", "pollinate-cli")
+sync_local_path = os.environ.get("POLLINATOR_SYNC_LOCAL_PATH", "/tmp/pollinator-store")
+sync_interval = float(os.environ.get("POLLINATOR_SYNC_INTERVAL", 4))
+sync_batch_bytes = int(os.environ.get("POLLINATOR_SYNC_BATCH_BYTES", 4 * 2**20))
+# the log of a pollen keeps its first and last log_max_bytes / 2 bytes,
+# gzipped to output/log.gz with POLLINATOR_LOG_COMPRESS=true
+log_max_bytes = int(os.environ.get("POLLINATOR_LOG_MAX_BYTES", 2**20))
+log_compress = os.environ.get("POLLINATOR_LOG_COMPRESS", "false").lower() == "true"
+# jsonb column for the phase timings of a pollen (sql/add_trace_column.sql),
+# empty to not store them in the db
+trace_column = os.environ.get("POLLINATOR_TRACE_COLUMN", "trace")
+# serve Prometheus metrics on this port, 0 disables the endpoint
+metrics_port = int(os.environ.get("POLLINATOR_METRICS_PORT", 0))
+# content-addressed cache of input documents and the files they link to,
+# mounted read-only into the cog containers at cache_mount_path. docker binds
+# host paths, so it lives in ipfs_root, which update_agent mounts at the same
+# path on the host. Hidden folders are not synced.
+# Rewriting input URLs to cached files needs models that accept local paths.
+cache_path = os.environ.get("POLLINATOR_CACHE", os.path.join(ipfs_root, ".cache"))
+cache_budget_mb = int(os.environ.get("POLLINATOR_CACHE_BUDGET_MB", 2048))
+cache_mount_path = "/cache"
+cache_referenced_files = os.environ.get("POLLINATOR_CACHE_FILES") == "true"
 
 pollinator_group = os.environ.get("POLLINATOR_GROUP", "T4")
+default_prediction_timeout = int(os.environ.get("POLLINATOR_PREDICTION_TIMEOUT", 3600))
+# create predictions with a webhook and write outputs while the model runs,
+# models can opt in or out with `async_predictions` in their metadata
+default_async_predictions = os.environ.get("POLLINATOR_ASYNC_PREDICTIONS") == "true"
+webhook_port = int(os.environ.get("POLLINATOR_WEBHOOK_PORT", 5099))
+# predictions in flight to one cog container, models set `concurrency` in their
+# metadata if their cog server takes several at once (pollinator/slots.py lanes).
+# Only for models that return their outputs over HTTP: the container mounts the
+# output folder of the lane that started it as /outputs, which all lanes share.
+default_concurrency = int(os.environ.get("POLLINATOR_CONCURRENCY", 1))
+max_concurrency = int(os.environ.get("POLLINATOR_MAX_CONCURRENCY", 8))
+
+# "realtime": subscribe to table changes and only resync every resync_interval
+# "poll": scan the table every poll_interval seconds
+discovery_mode = os.environ.get("POLLINATOR_DISCOVERY", "realtime")
+resync_interval = int(os.environ.get("POLLINATOR_RESYNC_INTERVAL", 30))
+poll_interval = 1
+# model affinity: seconds a cold start is assumed to cost until it was measured,
+# and seconds a pollen may wait longer than the pollen of the loaded model
+# before it is served even if that needs a swap
+swap_cost = int(os.environ.get("POLLINATOR_SWAP_COST", 60))
+max_wait = int(os.environ.get("POLLINATOR_MAX_WAIT", 300))
+# warm pool: keep up to max_resident_models cog containers as long as their
+# memory (measured, or model_memory_mb until measured) fits in the budget.
+# A budget of 0 keeps a single container. On a GPU, their GPU memory must also
+# fit in the GPU budget of each slot (0: the size of its GPU). The GPU memory of
+# a model is `gpu_memory_mb` of its metadata, else measured at its last start,
+# else model_gpu_memory_mb.
+memory_budget_mb = int(os.environ.get("POLLINATOR_MEMORY_BUDGET_MB", 0))
+model_memory_mb = int(os.environ.get("POLLINATOR_MODEL_MEMORY_MB", 8000))
+gpu_memory_budget_mb = int(os.environ.get("POLLINATOR_GPU_MEMORY_BUDGET_MB", 0))
+model_gpu_memory_mb = int(os.environ.get("POLLINATOR_MODEL_GPU_MEMORY_MB", 12000))
+max_resident_models = int(os.environ.get("POLLINATOR_MAX_RESIDENT_MODELS", 3))
+# recycle cog containers that degrade (pollinator/recycling.py): growth of their
+# memory and GPU memory over the baseline, slowdown of predictions, CPU use after
+# a prediction and pollen served. 0 disables a check. A degraded container is
+# restarted when its slot is idle, or after recycle_defer_pollen more pollen.
+recycle_memory_growth = float(os.environ.get("POLLINATOR_RECYCLE_MEMORY_GROWTH", 0.5))
+recycle_gpu_memory_growth = float(
+    os.environ.get("POLLINATOR_RECYCLE_GPU_MEMORY_GROWTH", 0.3)
+)
+recycle_latency_drift = float(os.environ.get("POLLINATOR_RECYCLE_LATENCY_DRIFT", 1.5))
+recycle_cpu_percent = float(os.environ.get("POLLINATOR_RECYCLE_CPU_PERCENT", 0))
+recycle_max_pollen = int(os.environ.get("POLLINATOR_RECYCLE_MAX_POLLEN", 0))
+recycle_defer_pollen = int(os.environ.get("POLLINATOR_RECYCLE_DEFER_POLLEN", 20))
+# number of pollen processed in parallel, "auto" for one per GPU
+num_slots = os.environ.get("POLLINATOR_SLOTS", "1")
+# claim the next pollen of the loaded model while the current one runs
+prefetch = os.environ.get("POLLINATOR_PREFETCH", "true").lower() == "true"
+# select and lock in one call via the claim_next_pollen function (sql/)
+atomic_claim = os.environ.get("POLLINATOR_ATOMIC_CLAIM", "true").lower() == "true"
+
+# seconds between checks for a new pollinator image, see pollinator/upgrade.py
+update_check_interval = int(os.environ.get("POLLINATOR_UPDATE_CHECK_INTERVAL", 60))
 
 polling_time = 60 * 60 * 6 + random.randint(
     0, 60 * 60 * 6
@@ -55,39 +136,126 @@ model_index = (
 )
 
 
-docker_client = docker.from_env()
+def _detect_ip():
+    try:
+        return requests.get("http://ip.42.pl/raw", timeout=5).text
+    except:  # noqa
+        return "?"
+
+
+def _detect_hostname():
+    try:
+        hostname, _, _ = socket.gethostbyaddr(_load("ip"))
+        return hostname
+    except:  # noqa
+        return _load("ip")
+
+
+def _create_supabase():
+    from supabase import create_client
+
+    return create_client(url, supabase_api_key)
+
+
+def _create_docker_client():
+    import docker
+
+    return docker.from_env()
+
+
+def _create_model_registry():
+    from pollinator.registry import ModelRegistry
+
+    return ModelRegistry(
+        model_index,
+        pollinator_group,
+        _load("docker_client"),
+        always_available=[test_image, "failing-model"],
+    )
+
+
+_lazy = {
+    "ip": _detect_ip,
+    "hostname": _detect_hostname,
+    "supabase": _create_supabase,
+    "supabase_id": lambda: os.environ["SUPABASE_ID"],
+    "has_gpu": lambda: utils.system("nvidia-smi >/dev/null 2>&1") == 0,
+    "gpu_flag": lambda: "--gpus all" if _load("has_gpu") else "",
+    # the one docker client shared by all modules
+    "docker_client": _create_docker_client,
+    "model_registry": _create_model_registry,
+}
+_lazy_lock = threading.RLock()
+
+
+def _load(name):
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = _lazy[name]()
+    return globals()[name]
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _load(name)
 
 
 def image_exists(image_name):
+    import docker
+
     try:
-        docker_client.images.get(image_name)
+        _load("docker_client").images.get(image_name)
         return True
     except docker.errors.ImageNotFound:
         return False
 
 
-def get_ttl_hash(seconds=300):
-    """Return the same value withing `seconds` time period"""
-    return round(time.time() / seconds)
+def available_models():
+    """Images of the model index in our group that are pulled locally.
+    Served from memory, the registry refreshes in the background"""
+    registry = _load("model_registry")
+    registry.start()
+    return registry.available()
 
 
-@lru_cache()
-def available_models_(ttl_hash=None):
-    del ttl_hash  # to emphasize we don't use it and to shut pylint up
-    metadata = requests.get(model_index).json()
-    supported = []
-    for image, meta in metadata.items():
-        try:
-            if pollinator_group in meta["meta"]["pollinator_group"]:
-                if image_exists(image):
-                    supported += [image]
-        except KeyError:
-            pass
-    return supported + [test_image, "failing-model"]
+def prediction_timeout(image):
+    """Read timeout for a prediction: `prediction_timeout` in the model index
+    metadata of the image, or POLLINATOR_PREDICTION_TIMEOUT seconds"""
+    try:
+        meta = _load("model_registry").metadata[image]["meta"]
+        return int(meta["prediction_timeout"])
+    except (KeyError, TypeError, ValueError):
+        return default_prediction_timeout
 
 
-def available_models():
-    return available_models_(get_ttl_hash())
+def gpu_memory(image):
+    """MB of GPU memory a container of the image takes according to
+    `gpu_memory_mb` in its model index metadata, None if not declared"""
+    try:
+        meta = _load("model_registry").metadata[image]["meta"]
+        return float(meta["gpu_memory_mb"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def async_predictions(image):
+    """Whether predictions of the image should be sent asynchronously"""
+    try:
+        meta = _load("model_registry").metadata[image]["meta"]
+        return bool(meta["async_predictions"])
+    except (KeyError, TypeError):
+        return default_async_predictions
+
+
+def concurrency(image):
+    """How many pollen of the image may run in the same container at once"""
+    try:
+        meta = _load("model_registry").metadata[image]["meta"]
+        wanted = int(meta["concurrency"])
+    except (KeyError, TypeError, ValueError):
+        wanted = default_concurrency
+    return max(1, min(wanted, max_concurrency))
 
 
 if __name__ == "__main__":
@@ -95,6 +263,6 @@ if __name__ == "__main__":
     logging.info(f"Pollinator image: {pollinator_image}")
     logging.info(f"Available models: {available_models()}")
     logging.info(f"DB (env): {os.environ.get('DB_NAME')}")
-    logging.info(f"IP: {ip}")
-    logging.info(f"hostname: {hostname}")
-    logging.info(f"GPU: {has_gpu}")
+    logging.info(f"IP: {_load('ip')}")
+    logging.info(f"hostname: {_load('hostname')}")
+    logging.info(f"GPU: {_load('has_gpu')}")
@@ -0,0 +1,191 @@
+"""Push-based discovery of pending pollens.
+
+Instead of scanning the pollen table once a second, the worker keeps a local
+view of the unclaimed rows. The view is filled by one full query on start and
+then kept up to date by a notifier that reports inserted, updated and deleted
+rows. A slow full resync stays in place as a fallback in case events get lost
+or the subscription drops.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+
+class PendingPollens:
+    """Thread safe local view of the rows that are not claimed yet"""
+
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+
+    def replace(self, rows):
+        with self.lock:
+            self.rows = {row["input"]: row for row in rows}
+        self.changed.set()
+
+    def upsert(self, row):
+        with self.lock:
+            if row.get("processing_started"):
+                self.rows.pop(row["input"], None)
+                return
+            self.rows[row["input"]] = row
+        self.changed.set()
+
+    def discard(self, input_cid):
+        with self.lock:
+            self.rows.pop(input_cid, None)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.rows.values())
+
+    def wait(self, timeout):
+        """Block until a pollen was inserted or released, or until timeout"""
+        woken = self.changed.wait(timeout)
+        self.changed.clear()
+        return woken
+
+
+class InMemoryNotifier:
+    """Local stand-in for the realtime subscription, used in tests"""
+
+    def __init__(self):
+        self.callback = None
+        self.healthy = False
+
+    def start(self, callback):
+        self.callback = callback
+        self.healthy = True
+
+    def stop(self):
+        self.healthy = False
+
+    def publish(self, event, record=None, old_record=None):
+        if self.callback is not None:
+            self.callback(event, record, old_record)
+
+
+class RealtimeNotifier:
+    """Subscribe to postgres changes of the pollen table via supabase realtime.
+
+    The websocket runs in its own event loop in a daemon thread. `healthy` is
+    only true while the channel is subscribed, so callers know when they have
+    to fall back to polling."""
+
+    def __init__(self, supabase_url, api_key, table):
+        self.url = (
+            supabase_url.replace("https://", "wss://").replace("http://", "ws://")
+            + "/realtime/v1"
+        )
+        self.api_key = api_key
+        self.table = table
+        self.callback = None
+        self.healthy = False
+        self.thread = None
+        self.loop = None
+        self.stopped = None
+
+    def start(self, callback):
+        self.callback = callback
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.healthy = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.stopped = asyncio.Event()
+        try:
+            self.loop.run_until_complete(self._listen())
+        except Exception as e:  # noqa
+            logging.error(f"Realtime subscription failed, falling back to polling: {e}")
+        self.healthy = False
+
+    async def _listen(self):
+        from realtime import AsyncRealtimeClient
+
+        client = AsyncRealtimeClient(
+            self.url, self.api_key, params={"apikey": self.api_key}
+        )
+        await client.connect()
+        channel = client.channel(f"pollinator-{self.table}")
+        await channel.on_postgres_changes(
+            "*", schema="public", table=self.table, callback=self._on_payload
+        ).subscribe(self._on_subscribe)
+        await self.stopped.wait()
+        await client.close()
+
+    def _on_subscribe(self, status, error):
+        logging.info(f"Realtime subscription status: {status} {error or ''}")
+        self.healthy = str(getattr(status, "value", status)) == "SUBSCRIBED"
+
+    def _on_payload(self, payload):
+        data = payload["data"]
+        event = str(getattr(data["type"], "value", data["type"]))
+        self.callback(event, data.get("record"), data.get("old_record"))
+
+
+class Discovery:
+    """Combine a notifier with a slow full resync to keep `pending` up to date.
+
+    `fetch_rows` is called for the full resync and must return all unclaimed
+    rows. While the notifier is unhealthy, every call to `candidates` resyncs,
+    which is the old polling behaviour."""
+
+    def __init__(self, fetch_rows, notifier=None, resync_interval=30):
+        self.fetch_rows = fetch_rows
+        self.notifier = notifier
+        self.resync_interval = resync_interval
+        self.pending = PendingPollens()
+        self.last_resync = None
+
+    def start(self):
+        if self.notifier is not None:
+            self.notifier.start(self.on_change)
+        self.resync()
+
+    def stop(self):
+        if self.notifier is not None:
+            self.notifier.stop()
+
+    @property
+    def subscribed(self):
+        return self.notifier is not None and self.notifier.healthy
+
+    def resync(self):
+        self.pending.replace(self.fetch_rows())
+        self.last_resync = time.monotonic()
+
+    def on_change(self, event, record, old_record):
+        if event in ("INSERT", "UPDATE") and record:
+            self.pending.upsert(record)
+        elif event == "DELETE" and old_record:
+            self.pending.discard(old_record["input"])
+
+    def candidates(self):
+        if (
+            not self.subscribed
+            or self.last_resync is None
+            or time.monotonic() - self.last_resync > self.resync_interval
+        ):
+            self.resync()
+        return self.pending.snapshot()
+
+    def discard(self, input_cid):
+        """Forget a row we know is taken, e.g. after losing a lock race"""
+        self.pending.discard(input_cid)
+
+    def wait_for_work(self, poll_interval=1):
+        """Sleep until something changes. Without a working subscription this
+        degrades to sleeping `poll_interval` seconds."""
+        if not self.subscribed:
+            time.sleep(poll_interval)
+            return
+        timeout = max(0, self.resync_interval - (time.monotonic() - self.last_resync))
+        self.pending.wait(timeout)
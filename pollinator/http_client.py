@@ -0,0 +1,65 @@
+"""Shared HTTP sessions with keep-alive, timeouts and metrics per endpoint.
+
+Every endpoint (the cog containers, the storage service, the model index)
+gets its own pooled `requests.Session`, so repeated calls reuse the TCP
+connection. Requests get the (connect, read) timeout of their endpoint
+unless one is passed explicitly, and are counted and timed per endpoint.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pollinator.metrics import Counter, Histogram
+
+TIMEOUTS = {
+    "cog_health": (1, 2),
+    "cog_predict": (3, 60 * 60),
+    "cog_control": (1, 10),
+    "storage": (3, 20),
+    "model_index": (3, 10),
+}
+
+requests_total = Counter(
+    "pollinator_http_requests_total", "HTTP requests by endpoint and outcome"
+)
+request_seconds = Histogram(
+    "pollinator_http_request_seconds", "HTTP request latency by endpoint"
+)
+
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def session_for(endpoint):
+    with sessions_lock:
+        if endpoint not in sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessions[endpoint] = session
+        return sessions[endpoint]
+
+
+def request(endpoint, method, url, timeout=None, **kwargs):
+    timeout = timeout or TIMEOUTS[endpoint]
+    start = time.monotonic()
+    outcome = "error"
+    try:
+        response = session_for(endpoint).request(method, url, timeout=timeout, **kwargs)
+        outcome = str(response.status_code)
+        return response
+    finally:
+        requests_total.inc(endpoint=endpoint, outcome=outcome)
+        request_seconds.observe(time.monotonic() - start, endpoint=endpoint)
+
+
+def get(endpoint, url, **kwargs):
+    return request(endpoint, "GET", url, **kwargs)
+
+
+def post(endpoint, url, **kwargs):
+    return request(endpoint, "POST", url, **kwargs)
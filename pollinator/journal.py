@@ -0,0 +1,107 @@
+"""Write-ahead journal of the pollen this worker is working on.
+
+Every step of a pollen is appended to a json lines file and flushed to disk
+before the worker moves on:
+
+    claimed -> inputs_fetched -> predicting -> outputs_written
+        -> db_updated -> postprocessed
+
+A pollen that was given back to the queue ends with `released`. After a
+crash, the worker replays the journal and continues every pollen that did
+not reach a final step after its last durable one: outputs that were
+written are published and stored in the db instead of being predicted
+again. Several pollen can be in flight at the same time, e.g. one per slot.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+STEPS = (
+    "claimed",
+    "inputs_fetched",
+    "predicting",
+    "outputs_written",
+    "db_updated",
+    "postprocessed",
+)
+FINAL_STEPS = {"postprocessed", "released"}
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(self, input_cid, step, **details):
+        """Append a step of a pollen. `details` are kept with the pollen,
+        e.g. the slot it runs in or the output cid"""
+        record = {"input": input_cid, "step": step, "time": time.time(), **details}
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def replay(self):
+        """Input cid -> state of every pollen in the journal, ordered by their
+        last step. The state holds the details of all its records, `step` is
+        the last one and `prepared_at` when its inputs were written."""
+        pollens = {}
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return pollens
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line is torn if the worker died while writing it
+                logging.error(f"Skipping broken journal line: {line!r}")
+                continue
+            state = pollens.pop(record["input"], {})
+            state.update(record)
+            if record["step"] == "inputs_fetched":
+                state["prepared_at"] = record["time"]
+            pollens[record["input"]] = state
+        return pollens
+
+    def in_flight(self):
+        """States of the pollen that did not reach a final step"""
+        return [
+            state
+            for state in self.replay().values()
+            if state["step"] not in FINAL_STEPS
+        ]
+
+    def last_prepared(self, slot_index):
+        """Input cid of the pollen whose inputs were written last in the slot.
+        Only its outputs can still be in the output folder of the slot."""
+        prepared = [
+            state
+            for state in self.replay().values()
+            if state.get("slot") == slot_index and "prepared_at" in state
+        ]
+        if len(prepared) == 0:
+            return None
+        return max(prepared, key=lambda state: state["prepared_at"])["input"]
+
+    def compact(self):
+        """Rewrite the journal with one record per pollen in flight"""
+        with self.lock:
+            pending = [
+                state
+                for state in self.replay().values()
+                if state["step"] not in FINAL_STEPS
+            ]
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                for state in pending:
+                    f.write(json.dumps(state) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
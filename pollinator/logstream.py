@@ -0,0 +1,158 @@
+"""Follow the logs of a cog container into the output folder.
+
+`LogFollower` reads the log stream of the container through the docker SDK
+in a thread, and `CappedLog` writes it to the file as it arrives. Chatty
+models can write megabytes of logs that IPFS would have to sync, so the file
+keeps at most `max_bytes`: the beginning of the log is written right away,
+of the rest only the last bytes are kept, with a note how much was skipped
+in between. The finished log can be gzipped.
+"""
+
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+
+from pollinator import tracing
+from pollinator.storage import wait_until
+
+
+class CappedLog:
+    """A log file of at most `max_bytes` (plus the note about skipped bytes).
+    The first half is the head of the log, the second half its tail, which is
+    rewritten at most every `flush_interval` seconds."""
+
+    def __init__(self, path, max_bytes=2**20, flush_interval=1):
+        self.path = path
+        self.head_bytes = max_bytes // 2
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.flush_interval = flush_interval
+        self.received = 0
+        self.head_written = 0
+        self.tail = bytearray()
+        self.last_flush = 0
+        self.file = open(path, "wb")
+
+    @property
+    def skipped(self):
+        return self.received - self.head_written - len(self.tail)
+
+    def write(self, data):
+        if self.file.closed:
+            return
+        self.received += len(data)
+        if self.head_written < self.head_bytes:
+            head = data[: self.head_bytes - self.head_written]
+            self.file.write(head)
+            self.head_written += len(head)
+            data = data[len(head) :]
+        if len(data) > 0:
+            self.tail += data
+            del self.tail[: max(0, len(self.tail) - self.tail_bytes)]
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.seek(self.head_written)
+        if self.skipped > 0:
+            self.file.write(f"\n[... {self.skipped} bytes skipped ...]\n".encode())
+        self.file.write(self.tail)
+        self.file.truncate()
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self, compress=False):
+        """Returns the path of the log, which ends with .gz if compressed"""
+        if self.file.closed:
+            return self.path
+        self.flush()
+        self.file.close()
+        if compress:
+            with open(self.path, "rb") as src, gzip.open(
+                f"{self.path}.gz", "wb"
+            ) as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+            self.path = f"{self.path}.gz"
+        return self.path
+
+
+class NoLogs:
+    """Stands in for a LogFollower when the logs are not followed"""
+
+    waited = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+class LogFollower:
+    """Stream the logs of `container` since `since` into a CappedLog at
+    `path` while the context is open. On exit, the follower waits up to
+    `wait_before_exit` seconds until the logs were quiet for `quiet_for`
+    seconds, and adds the wait to the trace of the pollen as `log_flush`."""
+
+    def __init__(
+        self,
+        container,
+        path,
+        since=None,
+        max_bytes=2**20,
+        compress=False,
+        wait_before_exit=3,
+        quiet_for=0.25,
+    ):
+        self.container = container
+        self.path = path
+        self.since = since
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.wait_before_exit = wait_before_exit
+        self.quiet_for = quiet_for
+        self.lock = threading.Lock()
+        self.waited = 0
+
+    def __enter__(self):
+        self.log = CappedLog(self.path, self.max_bytes)
+        self.last_output = time.monotonic()
+        self.stream = self.container.logs(
+            stdout=True, stderr=True, stream=True, follow=True, since=self.since
+        )
+        self.thread = threading.Thread(target=self._follow, daemon=True)
+        self.thread.start()
+        return self
+
+    def _follow(self):
+        try:
+            for chunk in self.stream:
+                with self.lock:
+                    self.log.write(chunk)
+                self.last_output = time.monotonic()
+        except Exception as e:  # noqa
+            logging.info(f"Stopped following the logs of {self.container.name}: {e}")
+
+    def is_quiet(self):
+        return time.monotonic() - self.last_output > self.quiet_for
+
+    def __exit__(self, type, value, traceback):
+        start = time.monotonic()
+        wait_until(
+            lambda: not self.thread.is_alive() or self.is_quiet(),
+            self.wait_before_exit,
+        )
+        self.waited = time.monotonic() - start
+        tracing.add("log_flush", self.waited)
+        try:
+            self.stream.close()
+        except Exception:  # noqa
+            pass  # the container is gone
+        self.thread.join(1)
+        with self.lock:
+            self.path = self.log.close(self.compress)
+        if self.log.skipped > 0:
+            logging.info(f"Skipped {self.log.skipped} bytes of logs in {self.path}")
@@ -1,20 +1,52 @@
+import datetime as dt
 import logging
 import os
+import queue
 import sys
+import threading
 import time
+from functools import partial
 
 import click
 import docker
 
-from pollinator import cog_handler, constants
-from pollinator.constants import supabase
-from pollinator.process_msg import process_message
+from pollinator import cog_handler, constants, metrics
+from pollinator.claim import ClaimUnavailable, SupabaseClaims
+from pollinator.discovery import Discovery, RealtimeNotifier
+from pollinator.metrics import Counter, Gauge
+from pollinator.prefetch import Prefetcher, forget_claim
+from pollinator.process_msg import (
+    finish_pollen,
+    journal,
+    postprocess,
+    postprocess_queue,
+    process_message,
+    publish_outputs,
+)
+from pollinator.scheduler import AffinityScheduler
+from pollinator.slots import find_slot, make_slots
+from pollinator.upgrade import UpdateWatcher, read_handover, write_handover
 
 logging.basicConfig(format="%(asctime)s %(levelname)s:%(message)s", level=logging.INFO)
 
-print(constants.hostname)
+discovery = None  # set up by start_discovery
+claims = None  # set up by main if atomic claims are enabled
+slots = []  # set up by main
+update_watcher = None  # set up by start_update_watcher
+scheduler = AffinityScheduler(
+    constants.swap_cost, constants.max_wait, cog_handler.setup_durations
+)
 
-docker_client = docker.from_env()
+claim_attempts = Counter(
+    "pollinator_claim_attempts_total",
+    "Attempts to claim a pollen by method and outcome (claimed, conflict, empty)",
+)
+queue_depth = Gauge(
+    "pollinator_queue_depth", "Pending pollen this worker can run, at the last scan"
+)
+idle_seconds = Counter(
+    "pollinator_idle_seconds_total", "Seconds spent waiting for new pollen"
+)
 
 
 @click.command()
@@ -22,75 +54,352 @@ docker_client = docker.from_env()
 def main(db_name):
     constants.db_name = db_name
     """First finish all existing tasks, then go into infinite loop"""
-    logging.info("Starting pollinator")
-    check_if_chrashed()
-    poll_for_some_time()
+    logging.info(f"Starting pollinator on {constants.hostname}")
+    # load the model index before the first pollen, then refresh it in the background
+    constants.model_registry.start()
+    if constants.metrics_port:
+        metrics.serve(constants.metrics_port)
+    global slots
+    slots = make_slots()
+    logging.info(f"Slots: {slots}")
+    for slot in slots:
+        check_if_chrashed(slot)
+        slot.pool.adopt_running_containers(read_handover(slot.handover_path))
+        if constants.prefetch:
+            slot.prefetcher = Prefetcher(
+                partial(claim_ahead, slot), release_message, slot.prefetch_cid_path
+            )
+    postprocess_queue.start()
+    resume_from_journal(slots)
+    start_discovery()
+    start_claims()
+    start_update_watcher()
+    run_slots(slots)
 
 
-def check_if_chrashed():
-    """If the worker crashed, the input cid is still in the file system.
-    In that case, we need to unlock the message in the db."""
+def run_slots(slots):
+    """Run one polling loop per slot, each in its own thread"""
+    if len(slots) == 1:
+        poll_for_some_time(slots[0])
+    else:
+        threads = [
+            threading.Thread(target=poll_for_some_time, args=(slot,), daemon=True)
+            for slot in slots
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if draining():
+        logging.info("Drained, handing over to the new pollinator")
+    else:
+        logging.info("Polling time is over, exiting")
+    shutdown_pollinator()
+
+
+def start_update_watcher():
+    """Check for a new pollinator image in the background. When there is
+    one, the slots finish their current pollen and stop claiming new ones."""
+    global update_watcher
+    update_watcher = UpdateWatcher(
+        pollinator_is_outdated, interval=constants.update_check_interval
+    )
+    update_watcher.start()
+
+
+def draining():
+    return update_watcher is not None and update_watcher.draining.is_set()
+
+
+def start_claims():
+    global claims
+    if constants.atomic_claim:
+        claims = SupabaseClaims(constants.supabase, constants.db_name)
+
+
+def start_discovery():
+    """Keep a local view of pending pollens that is updated by realtime events.
+    With POLLINATOR_DISCOVERY=poll, the table is scanned on every iteration instead."""
+    global discovery
+    if constants.discovery_mode != "realtime":
+        return
+    notifier = RealtimeNotifier(
+        constants.url, constants.supabase_api_key, constants.db_name
+    )
+    discovery = Discovery(
+        fetch_pending_pollens, notifier, resync_interval=constants.resync_interval
+    )
+    discovery.start()
+
+
+def check_if_chrashed(slot):
+    """If a worker without the journal crashed, the input cid is still in the
+    file system. In that case, we need to unlock the message in the db."""
+    release_prefetch_claim(slot)
     # check if done=False and input_cid is in file system
     try:
-        status_path = os.path.join(constants.output_path, "done")
+        status_path = os.path.join(slot.output_path, "done")
         with open(status_path, "r") as f:
             done = f.read()
-        if done == "true":
-            return
-    except FileNotFoundError:
-        return
-    # We crashed, unlock the message and increase the attempt counter
-    try:
-        with open(constants.input_cid_path, "r") as f:
+        with open(slot.input_cid_path, "r") as f:
             input_cid = f.read()
-        with open(constants.attempt_path, "r") as f:
+        with open(slot.attempt_path, "r") as f:
             attempt = int(f.read())
-        if attempt > constants.max_attempts:
-            logging.error(f"Too many attempts, giving up on {input_cid}")
-            supabase.table(constants.db_name).update({"success": False}).eq(
-                "input", input_cid
-            ).execute()
-            return
-        logging.info(f"Unlocking {input_cid}")
-        supabase.table(constants.db_name).update(
-            {
-                "processing_started": False,
-                "pollinator_group": None,
-                "worker": None,
-                "attempt": attempt + 1,
-            }
-        ).eq("input", input_cid).execute()
     except FileNotFoundError:
-        pass
+        return
+    if done != "true":
+        # We crashed, unlock the message and increase the attempt counter
+        unlock_crashed_pollen(input_cid, attempt)
+    # the journal knows about the pollen from now on
+    os.remove(slot.input_cid_path)
+    os.remove(slot.attempt_path)
+
+
+def unlock_crashed_pollen(input_cid, attempt):
+    if attempt > constants.max_attempts:
+        logging.error(f"Too many attempts, giving up on {input_cid}")
+        constants.supabase.table(constants.db_name).update({"success": False}).eq(
+            "input", input_cid
+        ).execute()
+        return
+    logging.info(f"Unlocking {input_cid}")
+    constants.supabase.table(constants.db_name).update(
+        {
+            "processing_started": False,
+            "pollinator_group": None,
+            "worker": None,
+            "attempt": attempt + 1,
+        }
+    ).eq("input", input_cid).execute()
+
+
+def resume_from_journal(slots):
+    """Continue the pollen of the previous run after their last durable step.
+    Outputs that were written are published and stored instead of being
+    predicted again, the others go back to the queue."""
+    for pollen in journal.in_flight():
+        try:
+            resume_pollen(pollen, find_slot(slots, pollen.get("slot")))
+        except Exception as e:  # noqa
+            logging.error(f"Could not resume {pollen['input']}: {e}")
+    journal.compact()
+
+
+def resume_pollen(pollen, slot):
+    input_cid, step = pollen["input"], pollen["step"]
+    if step == "db_updated":
+        logging.info(f"Resuming {input_cid}: queueing the post-processing")
+        postprocess(input_cid, pollen["output"])
+    elif (
+        step == "outputs_written"
+        and slot is not None
+        and journal.last_prepared(slot.index) == input_cid
+    ):
+        logging.info(f"Resuming {input_cid}: publishing the outputs of {slot}")
+        updated_message = {
+            "success": pollen["success"],
+            "end_time": dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        cid = publish_outputs(input_cid, slot)
+        if cid is not None:
+            updated_message["output"] = cid
+        finish_pollen(input_cid, updated_message)
+    else:
+        unlock_crashed_pollen(input_cid, pollen.get("attempt", 0))
+        journal.record(input_cid, "released")
 
 
-def poll_for_some_time():
+def poll_for_some_time(slot):
     start = time.time()
-    while time.time() - start < constants.polling_time:
+    while time.time() - start < constants.polling_time and not draining():
         try:
-            finish_all_tasks()
-            time.sleep(1)
+            finish_all_tasks(slot)
+            if not draining():
+                # nothing to do, a good moment to restart degraded models
+                slot.pool.recycle_degraded(slot.output_path)
+            wait_for_work()
         except Exception as e:
             logging.error(f"poll_for_some_time caught: {e}")
             time.sleep(5)
-    logging.info("Polling time is over, exiting")
-    shutdown_pollinator()
 
 
-def finish_all_tasks():
-    while (message := get_task_from_db()) is not None:
+def wait_for_work():
+    start = time.monotonic()
+    if discovery is None:
+        time.sleep(constants.poll_interval)
+    else:
+        discovery.wait_for_work(constants.poll_interval)
+    idle_seconds.inc(time.monotonic() - start)
+
+
+def finish_all_tasks(slot):
+    if claims is not None:
+        while not draining() and (message := claim_task(slot)) is not None:
+            logging.info(f"Claimed task {message['input']} in {slot}")
+            process(message, slot)
+            process_prefetched(slot)
+        return
+    while not draining() and (message := get_task_from_db(slot)) is not None:
         # After this iteraton, the task will be processed either by this worker or by another worker
         logging.info(f"Found task {message['input']}")
-        maybe_process(message)
+        maybe_process(message, slot)
+        process_prefetched(slot)
+
+
+def process(message, slot):
+    """Run the pollen, next to more pollen of its image if the model takes
+    several predictions at once"""
+    if constants.concurrency(message["image"]) > 1:
+        return process_concurrently(message, slot)
+    return process_message(message, slot)
+
+
+def process_concurrently(message, slot):
+    """Keep up to `concurrency` pollen of the image in flight to the container
+    of the slot, each in its own lane. More pollen are claimed as long as a
+    lane is free and the scheduler would pick the image anyway."""
+    image = message["image"]
+    lanes = queue.Queue()
+    for lane in slot.lanes(constants.concurrency(image)):
+        lanes.put(lane)
+
+    def run(message, lane):
+        try:
+            process_message(message, lane)
+        finally:
+            lanes.put(lane)
+
+    # the claimed pollen was remembered for the slot, which is the first lane
+    lane = lanes.get()
+    threads = []
+    while True:
+        logging.info(f"Processing {message['input']} in {lane}")
+        threads.append(threading.Thread(target=run, args=(message, lane)))
+        threads[-1].start()
+        lane = lanes.get()
+        message = claim_ahead(slot, image)
+        if message is None:
+            break
+        remember_locked_message(message, lane)
+    for thread in threads:
+        thread.join()
+
+
+def process_prefetched(slot):
+    """Process the pollen that were claimed ahead while the previous one ran"""
+    while slot.prefetcher is not None and (ahead := slot.prefetcher.take()):
+        logging.info(f"Processing prefetched task {ahead.message['input']}")
+        remember_locked_message(ahead.message, slot)
+        slot.prefetcher.forget()
+        process_message(ahead.message, slot, ahead.inputs)
+
+
+def claim_ahead(slot, image):
+    """Claim a pollen of the image that is running right now, if the scheduler
+    would pick that image next anyway. Returns None otherwise."""
+    if draining():
+        return None
+    if discovery is not None:
+        available = constants.available_models()
+        candidates = [c for c in discovery.candidates() if c["image"] in available]
+        if scheduler.choose_image(candidates, [image]) != image:
+            return None
+    if claims is not None:
+        message = claims.claim_next(
+            [image], [image], constants.hostname, constants.pollinator_group
+        )
+    else:
+        candidates = [c for c in fetch_pending_pollens() if c["image"] == image]
+        message = candidates[0] if len(candidates) > 0 else None
+        try:
+            if message is not None:
+                lock_message(message, slot, remember=False)
+        except LockError:
+            message = None
+    if message is not None and discovery is not None:
+        discovery.discard(message["input"])
+    return message
+
 
+def release_message(message):
+    """Unlock a pollen that this worker claimed but did not start"""
+    constants.supabase.table(constants.db_name).update(
+        {"processing_started": False, "pollinator_group": None, "worker": None}
+    ).eq("input", message["input"]).eq("worker", constants.hostname).execute()
 
-def get_task_from_db():
+
+def release_prefetch_claim(slot):
+    try:
+        with open(slot.prefetch_cid_path, "r") as f:
+            input_cid = f.read()
+    except FileNotFoundError:
+        return
+    logging.info(f"Releasing look-ahead claim {input_cid}")
+    release_message({"input": input_cid})
+    forget_claim(slot.prefetch_cid_path)
+
+
+def claim_task(slot):
+    """Select and lock the next pollen in one round trip, using the same
+    ordering as get_task_from_db. Returns None if there is nothing to do."""
+    global claims
+    if discovery is not None:
+        available = constants.available_models()
+        candidates = [c for c in discovery.candidates() if c["image"] in available]
+        queue_depth.set(len(candidates))
+        if len(candidates) == 0:
+            return None
+        preferred = [scheduler.choose_image(candidates, loaded_models(slot))]
+    else:
+        preferred = loaded_models(slot)
+    try:
+        message = claims.claim_next(
+            constants.available_models(),
+            preferred,
+            constants.hostname,
+            constants.pollinator_group,
+        )
+    except ClaimUnavailable as e:
+        logging.error(f"Atomic claim not available, using select and lock: {e}")
+        claims = None
+        return None
+    if message is None:
+        claim_attempts.inc(method="atomic", outcome="empty")
+        return None
+    claim_attempts.inc(method="atomic", outcome="claimed")
+    if discovery is not None:
+        discovery.discard(message["input"])
+    remember_locked_message(message, slot)
+    return message
+
+
+def get_task_from_db(slot):
     """Scan the db for tasks that are not in progress. If there are none, return None
     If there are many, return one with the maximal priority.
-    If there are still many, return one with the currently loaded model.
-    If there are still many, return one with the oldest request_submit_time."""
-    candidates = (
-        supabase.table(constants.db_name)
+    If there are still many, let the scheduler pick the image, which prefers the
+    currently loaded model unless another model has a long queue or old requests.
+    Of that image, return the one with the oldest request_submit_time."""
+    if discovery is None:
+        candidates = fetch_pending_pollens()
+    else:
+        available = constants.available_models()
+        candidates = [c for c in discovery.candidates() if c["image"] in available]
+    queue_depth.set(len(candidates))
+    if len(candidates) == 0:
+        return None
+    candidates = sorted(candidates, key=lambda c: c["request_submit_time"] or "")
+    candidates = sorted(candidates, key=lambda c: c["priority"] or 0, reverse=True)
+    image = scheduler.choose_image(candidates, loaded_models(slot))
+    return next(c for c in candidates if c["image"] == image)
+
+
+def loaded_models(slot):
+    return list(slot.pool.loaded_images())
+
+
+def fetch_pending_pollens():
+    return (
+        constants.supabase.table(constants.db_name)
         .select("*")
         .eq("processing_started", False)
         .in_("image", constants.available_models())
@@ -98,60 +407,62 @@ def get_task_from_db():
         .order("request_submit_time", desc=False)
         .execute()
     ).data
-    if len(candidates) == 0:
-        return None
-    priority = candidates[0]["priority"]
-    candidates = [c for c in candidates if c["priority"] == priority]
-    ready_candidates = [c for c in candidates if c["image"] == cog_handler.loaded_model]
-    if len(ready_candidates) > 0:
-        return ready_candidates[0]
-    else:
-        return candidates[0]
 
 
-def check_pollinator_updates():
+def pollinator_is_outdated():
     """Check if the image of the currently running container has the same
-    hash as the latest pollinator. If not, kill the running container"""
+    hash as the latest pollinator image"""
     try:
-        running_pollinator_image = docker_client.containers.get("pollinator").image
+        running_pollinator_image = constants.docker_client.containers.get(
+            "pollinator"
+        ).image
     except docker.errors.NotFound:
         logging.info(
             "No pollinator container running. This must be the dev environment."
         )
-        return
-    latest_pollinator_image = docker_client.images.get(constants.pollinator_image)
+        return False
+    latest_pollinator_image = constants.docker_client.images.get(
+        constants.pollinator_image
+    )
     if running_pollinator_image != latest_pollinator_image:
-        print("Pollinator image has changed, restarting container", flush=True)
-        shutdown_pollinator()
-    else:
-        logging.info("Pollinator is up to date")
+        return True
+    logging.info("Pollinator is up to date")
+    return False
 
 
 def shutdown_pollinator():
+    """Release the claims nobody started and leave the cog containers running
+    for the next pollinator, which adopts them from the handover files"""
+    for slot in slots:
+        if slot.prefetcher is not None:
+            slot.prefetcher.release()
+        try:
+            write_handover(slot.handover_path, slot.pool.handover_state())
+        except OSError as e:
+            logging.error(f"Could not write the handover of {slot}: {e}")
     try:
-        docker_client.containers.get("pollinator").kill()
+        constants.docker_client.containers.get("pollinator").kill()
     except docker.errors.NotFound:
         sys.exit(0)
 
 
-def maybe_process(message):
-    logging.info(f"Checking tasks for: {message['image']} - loaded model: {cog_handler.loaded_model}")
-    check_pollinator_updates()
+def maybe_process(message, slot):
+    loaded = loaded_models(slot)
+    logging.info(f"Checking tasks for: {message['image']} - loaded models: {loaded}")
     if message["image"] not in constants.available_models():
         logging.info(f"Ignoring message for {message['image']}")
         return None
-    if (
-        message["image"] != cog_handler.loaded_model
-        and cog_handler.loaded_model is not None
-    ):
+    if message["image"] not in loaded and len(loaded) > 0:
         time.sleep(1)
-    elif message["image"] != cog_handler.loaded_model:
+    elif message["image"] not in loaded:
         logging.info("No model loaded, wait 0.5s to give other workers a chance")
         time.sleep(0.5)
     try:
-        lock_message(message)
-        return process_message(message)
+        lock_message(message, slot)
+        return process(message, slot)
     except LockError:
+        if discovery is not None:
+            discovery.discard(message["input"])
         return None
 
 
@@ -159,10 +470,10 @@ class LockError(Exception):
     pass
 
 
-def lock_message(message):
+def lock_message(message, slot, remember=True):
     """Lock the message in the db and throw an error if it is already locked"""
     data = (
-        supabase.table(constants.db_name)
+        constants.supabase.table(constants.db_name)
         .update(
             {
                 "processing_started": True,
@@ -175,12 +486,18 @@ def lock_message(message):
         .execute()
     )
     if len(data.data) == 0:
+        claim_attempts.inc(method="lock", outcome="conflict")
         raise LockError(f"Message {message['input']} is already locked")
-    # write input cid to disk in case the worker crashes
-    with open(constants.input_cid_path, "w") as f:
-        f.write(message["input"])
-    with open(constants.attempt_path, "w") as f:
-        f.write(str(message["attempt"]))
+    claim_attempts.inc(method="lock", outcome="claimed")
+    if remember:
+        remember_locked_message(message, slot)
+
+
+def remember_locked_message(message, slot):
+    # journal the claim in case the worker crashes
+    journal.record(
+        message["input"], "claimed", slot=slot.index, attempt=message["attempt"]
+    )
 
 
 if __name__ == "__main__":
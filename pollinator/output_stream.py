@@ -0,0 +1,239 @@
+"""Write the outputs of a cog prediction response to files.
+
+Cog returns files as base64 data URIs inside the json response, e.g.
+{"status": "succeeded", "output": ["data:image/png;base64,iVBO...", ...]}.
+`write_http_response_files` parses the whole response in memory.
+`OutputStreamWriter` parses the response body chunk by chunk and decodes
+every data URI in `output` straight into `out_{i}{ext}`, so memory use does
+not depend on the size of the outputs.
+"""
+
+import base64
+import binascii
+import logging
+import os
+from mimetypes import guess_extension
+
+WHITESPACE = b" \t\r\n"
+ESCAPES = {
+    ord('"'): b'"',
+    ord("\\"): b"\\",
+    ord("/"): b"/",
+    ord("b"): b"\b",
+    ord("f"): b"\f",
+    ord("n"): b"\n",
+    ord("r"): b"\r",
+    ord("t"): b"\t",
+}
+
+
+def write_http_response_files(response, output_path):
+    try:
+        output = response.json()["output"]
+        if not isinstance(output, list):
+            output = [output]
+        for i, encoded_file in enumerate(output):
+            try:
+                encoded_file = encoded_file["file"]
+            except TypeError:
+                pass  # already a string
+            meta, encoded = encoded_file.split(";base64,")
+            extension = guess_extension(meta.split(":")[1])
+            with open(f"{output_path}/out_{i}{extension}", "wb") as f:
+                f.write(base64.b64decode(encoded))
+    except Exception as e:  # noqa
+        logging.info(f"http response not written to file: {type(e)} {e}")
+
+
+def stream_http_response_files(response, output_path, chunk_size=2**16):
+    """Streaming version of write_http_response_files. The request must
+    have been sent with stream=True. Returns the paths that were written."""
+    writer = OutputStreamWriter(output_path)
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            writer.feed(chunk)
+    except Exception as e:  # noqa
+        logging.info(f"http response not written to file: {type(e)} {e}")
+    finally:
+        writer.close()
+    return writer.written
+
+
+class DataURIFile:
+    """Decode one data URI that arrives in pieces into out_{index}{ext}"""
+
+    max_header = 512
+
+    def __init__(self, output_path, index):
+        self.output_path = output_path
+        self.index = index
+        self.header = b""
+        self.file = None
+        self.path = None
+        self.remainder = b""
+        self.ignored = False
+
+    def write(self, piece):
+        if self.ignored:
+            return
+        if self.file is None:
+            self.header += piece
+            if b";base64," not in self.header:
+                if len(self.header) > self.max_header:
+                    self.ignored = True  # not a data URI
+                return
+            meta, piece = self.header.split(b";base64,", 1)
+            if not meta.startswith(b"data:"):
+                self.ignored = True
+                return
+            extension = guess_extension(meta[5:].decode()) or ""
+            self.path = os.path.join(self.output_path, f"out_{self.index}{extension}")
+            self.file = open(self.path, "wb")
+        data = self.remainder + piece.translate(None, WHITESPACE)
+        usable = len(data) - len(data) % 4
+        self.file.write(base64.b64decode(data[:usable]))
+        self.remainder = data[usable:]
+
+    def close(self):
+        if self.file is None:
+            return None
+        try:
+            if self.remainder:
+                padding = b"=" * (-len(self.remainder) % 4)
+                self.file.write(base64.b64decode(self.remainder + padding))
+        except binascii.Error as e:
+            logging.info(f"Truncated base64 in {self.path}: {e}")
+        self.file.close()
+        return self.path
+
+
+class OutputStreamWriter:
+    """Incremental json scanner that only materializes the strings in
+    `output` (directly, in a list, or in {"file": ...} objects)."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.stack = []  # frames: [type, key or index, expecting a key]
+        self.carry = b""
+        self.in_string = False
+        self.string_is_key = False
+        self.key = b""
+        self.target = None  # DataURIFile of the string being read
+        self.written = []
+
+    def feed(self, chunk):
+        data = self.carry + chunk
+        self.carry = b""
+        position = 0
+        while position < len(data):
+            if self.in_string:
+                position = self._read_string(data, position)
+                if position is None:
+                    return
+            else:
+                position = self._read_structure(data, position)
+
+    def close(self):
+        if self.target is not None:
+            self._finish_target()
+
+    def _read_structure(self, data, position):
+        byte = data[position]
+        if byte == ord('"'):
+            self._start_string()
+        elif byte == ord("{"):
+            self.stack.append(["obj", None, True])
+        elif byte == ord("["):
+            self.stack.append(["arr", 0, False])
+        elif byte in (ord("}"), ord("]")):
+            self.stack.pop()
+        elif byte == ord(","):
+            frame = self.stack[-1]
+            if frame[0] == "arr":
+                frame[1] += 1
+            else:
+                frame[2] = True
+        return position + 1
+
+    def _start_string(self):
+        self.in_string = True
+        frame = self.stack[-1] if self.stack else None
+        self.string_is_key = frame is not None and frame[0] == "obj" and frame[2]
+        if self.string_is_key:
+            self.key = b""
+            return
+        index = self._output_index()
+        if index is not None:
+            self.target = DataURIFile(self.output_path, index)
+
+    def _output_index(self):
+        """Index of the output a string value at the current position
+        belongs to, or None if it is not part of `output`"""
+        path = [frame[1] for frame in self.stack]
+        if len(path) == 0 or path[0] != b"output":
+            return None
+        rest = path[1:]
+        if rest == [] or rest == [b"file"]:
+            return 0
+        if len(rest) in (1, 2) and isinstance(rest[0], int):
+            if len(rest) == 1 or rest[1] == b"file":
+                return rest[0]
+        return None
+
+    def _read_string(self, data, position):
+        """Consume string content until the closing quote. Returns the next
+        position, or None if the chunk ended in the middle of an escape"""
+        while position < len(data):
+            quote = data.find(b'"', position)
+            backslash = data.find(b"\\", position, None if quote < 0 else quote)
+            end = len(data) if quote < 0 else quote
+            if backslash >= 0:
+                end = backslash
+            self._string_piece(data[position:end])
+            if backslash >= 0:
+                escaped = self._unescape(data, backslash)
+                if escaped is None:
+                    self.carry = data[backslash:]
+                    return None
+                piece, position = escaped
+                self._string_piece(piece)
+                continue
+            if quote < 0:
+                return len(data)
+            self._end_string()
+            return quote + 1
+        return position
+
+    def _unescape(self, data, backslash):
+        if backslash + 1 >= len(data):
+            return None
+        code = data[backslash + 1]
+        if code == ord("u"):
+            if backslash + 6 > len(data):
+                return None
+            character = chr(int(data[backslash + 2 : backslash + 6], 16))
+            return character.encode("utf-8", "surrogatepass"), backslash + 6
+        return ESCAPES.get(code, bytes([code])), backslash + 2
+
+    def _string_piece(self, piece):
+        if len(piece) == 0:
+            return
+        if self.string_is_key:
+            self.key += piece
+        elif self.target is not None:
+            self.target.write(piece)
+
+    def _end_string(self):
+        self.in_string = False
+        if self.string_is_key:
+            # the next string in this object is the value of this key
+            self.stack[-1][1] = self.key
+            self.stack[-1][2] = False
+        elif self.target is not None:
+            self._finish_target()
+
+    def _finish_target(self):
+        path = self.target.close()
+        if path is not None:
+            self.written.append(path)
+        self.target = None
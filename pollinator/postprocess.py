@@ -0,0 +1,173 @@
+"""Background queue for the work that follows a pollen: pinning and social posts.
+
+Jobs are stored as one json file each in a folder on the /tmp/ipfs mount, so
+they survive a restart of the worker. A small pool of threads runs them with
+bounded concurrency and retries failed jobs with exponential backoff. Jobs
+that fail `max_attempts` times are moved to the `failed` subfolder, jobs that
+succeeded to the `done` subfolder for `keep_done` seconds. A job is identified
+by its kind and CID, so queueing it again, e.g. when a pollen is resumed after
+a crash, does not post the same outputs twice.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from pollinator import utils
+from pollinator.metrics import Histogram
+
+COMMANDS = {
+    "pin": "node /usr/local/bin/pinning-cli.js {cid}",
+    "social_post": "node /usr/local/bin/social-post-cli.js {cid}",
+}
+
+postprocess_seconds = Histogram(
+    "pollinator_postprocess_seconds", "Duration of post-processing jobs by kind"
+)
+
+
+class PostProcessQueue:
+    def __init__(
+        self,
+        path,
+        workers=2,
+        max_attempts=5,
+        backoff=10,
+        run=utils.system,
+        keep_done=7 * 24 * 3600,
+    ):
+        self.path = path
+        self.failed_path = os.path.join(path, "failed")
+        self.done_path = os.path.join(path, "done")
+        self.keep_done = keep_done
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.run = run
+        self.jobs = []  # heap of (not_before, sequence number, job)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.threads = []
+        self.busy = 0
+        self.stopped = False
+
+    def start(self):
+        """Load the jobs left over from a previous run and start the workers"""
+        os.makedirs(self.failed_path, exist_ok=True)
+        os.makedirs(self.done_path, exist_ok=True)
+        for filename in os.listdir(self.done_path):
+            done_path = os.path.join(self.done_path, filename)
+            if os.path.getmtime(done_path) < time.time() - self.keep_done:
+                os.remove(done_path)
+        for filename in sorted(os.listdir(self.path)):
+            if filename.endswith(".json"):
+                with open(os.path.join(self.path, filename)) as f:
+                    self._schedule(json.load(f))
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def enqueue(self, kind, cid):
+        """Queue the job, unless it is queued, done or failed already"""
+        job = {
+            "id": f"{kind}-{cid}",
+            "kind": kind,
+            "cid": cid,
+            "attempt": 0,
+            "not_before": 0,
+        }
+        filename = f"{job['id']}.json"
+        with self.condition:
+            for folder in (self.path, self.done_path, self.failed_path):
+                if os.path.exists(os.path.join(folder, filename)):
+                    logging.info(f"Not queueing {kind} {cid} again")
+                    return
+            self._save(job)
+        self._schedule(job)
+
+    def pending(self):
+        with self.condition:
+            return len(self.jobs) + self.busy
+
+    def wait_until_empty(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while len(self.jobs) + self.busy > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _job_path(self, job):
+        return os.path.join(self.path, f"{job['id']}.json")
+
+    def _save(self, job):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self._job_path(job) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job))
+
+    def _schedule(self, job):
+        with self.condition:
+            heapq.heappush(self.jobs, (job["not_before"], next(self.sequence), job))
+            self.condition.notify_all()
+
+    def _next_job(self):
+        with self.condition:
+            while not self.stopped:
+                if len(self.jobs) > 0 and self.jobs[0][0] <= time.time():
+                    self.busy += 1
+                    return heapq.heappop(self.jobs)[2]
+                timeout = self.jobs[0][0] - time.time() if self.jobs else None
+                self.condition.wait(timeout)
+        return None
+
+    def _work(self):
+        while (job := self._next_job()) is not None:
+            try:
+                self._run(job)
+            finally:
+                with self.condition:
+                    self.busy -= 1
+                    self.condition.notify_all()
+
+    def _run(self, job):
+        start = time.monotonic()
+        try:
+            success = self.run(COMMANDS[job["kind"]].format(cid=job["cid"])) == 0
+        except Exception as e:  # noqa
+            logging.error(f"Post-processing {job['kind']} {job['cid']} failed: {e}")
+            success = False
+        postprocess_seconds.observe(
+            time.monotonic() - start,
+            kind=job["kind"],
+            outcome="success" if success else "failure",
+        )
+        if success:
+            os.makedirs(self.done_path, exist_ok=True)
+            os.replace(
+                self._job_path(job), os.path.join(self.done_path, f"{job['id']}.json")
+            )
+            return
+        job["attempt"] += 1
+        if job["attempt"] >= self.max_attempts:
+            logging.error(f"Giving up on {job['kind']} {job['cid']}")
+            os.replace(
+                self._job_path(job), os.path.join(self.failed_path, f"{job['id']}.json")
+            )
+            return
+        job["not_before"] = time.time() + self.backoff * 2 ** (job["attempt"] - 1)
+        self._save(job)
+        self._schedule(job)
@@ -0,0 +1,98 @@
+"""Claim the next pollen and resolve its inputs while the current one runs.
+
+When a prediction starts, the prefetcher claims one more pollen of the same
+image in a background thread and fetches its inputs from the storage
+service. When the prediction is done, the worker takes that pollen and
+sends it to the still warm container right away instead of going back to
+the database.
+
+The id of the look-ahead claim is written to disk, so a crashed worker can
+release it on restart. `release` gives it back on a clean shutdown.
+"""
+
+import logging
+import os
+import threading
+
+from pollinator.storage import fetch_inputs
+
+
+class Prefetched:
+    def __init__(self, message):
+        self.message = message
+        self.inputs = None
+
+    def resolve(self):
+        try:
+            self.inputs = fetch_inputs(self.message["input"])
+        except Exception as e:  # noqa
+            # the inputs will be fetched again when the pollen is processed,
+            # which then reports the error on the pollen
+            logging.warning(
+                f"Prefetching inputs of {self.message['input']} failed: {e}"
+            )
+
+
+class Prefetcher:
+    def __init__(self, claim, release, claim_path):
+        """claim: function(image) that locks a pollen of that image or returns None
+        release: function(message) that unlocks a pollen we did not process
+        claim_path: file that remembers the look-ahead claim across crashes"""
+        self.claim = claim
+        self.release_message = release
+        self.claim_path = claim_path
+        self.thread = None
+        self.ahead = None
+        self.lock = threading.Lock()
+
+    def start(self, image):
+        """Claim and resolve the next pollen of `image` in the background"""
+        if self.thread is not None or self.ahead is not None:
+            return
+        self.thread = threading.Thread(target=self._prefetch, args=(image,))
+        self.thread.start()
+
+    def _prefetch(self, image):
+        try:
+            message = self.claim(image)
+        except Exception as e:  # noqa
+            logging.error(f"Claiming ahead failed: {e}")
+            return
+        if message is None:
+            return
+        with open(self.claim_path, "w") as f:
+            f.write(message["input"])
+        logging.info(f"Claimed {message['input']} ahead")
+        prefetched = Prefetched(message)
+        prefetched.resolve()
+        with self.lock:
+            self.ahead = prefetched
+
+    def take(self):
+        """Wait for a running prefetch and return its pollen, or None.
+        The claim file is kept until `forget` is called, which the caller
+        does once something else, like the journal, remembers the pollen."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            prefetched, self.ahead = self.ahead, None
+        return prefetched
+
+    def forget(self):
+        forget_claim(self.claim_path)
+
+    def release(self):
+        """Give the look-ahead claim back, e.g. when the worker shuts down"""
+        prefetched = self.take()
+        if prefetched is not None:
+            logging.info(f"Releasing look-ahead claim {prefetched.message['input']}")
+            self.release_message(prefetched.message)
+            self.forget()
+
+
+def forget_claim(claim_path):
+    try:
+        os.remove(claim_path)
+    except FileNotFoundError:
+        pass
@@ -3,24 +3,45 @@ import json
 import logging
 import traceback
 
-from pollinator import constants, utils
-from pollinator.cog_handler import RunningCogModel, send_to_cog_container
-from pollinator.constants import (available_models, input_path, ipfs_root,
-                                  output_path, supabase)
-from pollinator.storage import (BackgroundCommand, clean_folder, fetch_inputs,
-                                prepare_output_folder, write_folder)
+from pollinator import constants, tracing
+from pollinator.cog_handler import RunningCogModel
+from pollinator.journal import Journal
+from pollinator.postprocess import PostProcessQueue
+from pollinator.storage import (  # noqa: F401
+    BackgroundCommand,
+    clean_folder,
+    fetch_inputs,
+    prepare_output_folder,
+    write_folder,
+)
+from pollinator.sync import output_sync
 
+# started by main, so pinning and social posts don't block the next pollen
+postprocess_queue = PostProcessQueue(
+    constants.postprocess_queue_path, constants.postprocess_workers
+)
+journal = Journal(constants.journal_path)
 
-def process_message(message):
+
+def process_message(message, slot, inputs=None):
+    """Run the pollen in the slot. `inputs` can be passed if they were
+    already fetched, e.g. by the prefetcher."""
+    with tracing.start() as trace:
+        return _process_message(message, slot, inputs, trace)
+
+
+def _process_message(message, slot, inputs, trace):
     logging.info(f"processing message: {message}")
     updated_message = {}
     updated_message["start_time"] = dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
     response = None
     try:
-        response, success = start_container_and_perform_request_and_send_outputs(
-            message
+        response, success, cid = start_container_and_perform_request_and_send_outputs(
+            message, slot, inputs
         )
         updated_message["success"] = success
+        if cid is not None:
+            updated_message["output"] = cid
     except Exception as e:
         logging.error(f"process_message: caught {e}")
         updated_message["success"] = False
@@ -28,29 +49,65 @@ def process_message(message):
 
     try:
         updated_message["end_time"] = dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        if constants.trace_column:
+            updated_message[constants.trace_column] = trace.summary()
+        logging.info(f"Trace of {message['input']}: {trace.summary()}")
 
-        data = (
-            supabase.table(constants.db_name)
-            .update(updated_message)
-            .eq("input", message["input"])
-            .execute()
-            .data
-        )
-
-        assert len(data) == 1
-        cid = data[0]["output"]
-        # todo get cid from data
-        # run pinning and social post
-        utils.system(f"node /usr/local/bin/pinning-cli.js {cid}")
-        utils.system(f"node /usr/local/bin/social-post-cli.js {cid}")
-
+        finish_pollen(message["input"], updated_message)
     except Exception as e:  # noqa
         traceback.print_exc()
 
     return response
 
 
-def start_container_and_perform_request_and_send_outputs(message):
+def finish_pollen(input_cid, updated_message):
+    """Store the result in the db and queue pinning and social posts"""
+    data = update_pollen(input_cid, updated_message)
+    assert len(data) == 1
+    cid = data[0]["output"]
+    journal.record(input_cid, "db_updated", output=cid)
+    postprocess(input_cid, cid)
+
+
+def postprocess(input_cid, cid):
+    # run pinning and social post in the background
+    postprocess_queue.enqueue("pin", cid)
+    postprocess_queue.enqueue("social_post", cid)
+    journal.record(input_cid, "postprocessed")
+
+
+def publish_outputs(input_cid, slot):
+    """Sync the folder of the slot once, for outputs written before a restart.
+    Returns the CID of the folder."""
+    return output_sync(slot.ipfs_root, input_cid).sync(final=True)
+
+
+def update_pollen(input_cid, updated_message):
+    """Update the db row of the pollen. If the db has no trace column
+    (see sql/add_trace_column.sql), the update is repeated without it and
+    traces are no longer sent"""
+    from postgrest.exceptions import APIError
+
+    update = constants.supabase.table(constants.db_name).update
+    try:
+        return update(updated_message).eq("input", input_cid).execute().data
+    except APIError as e:
+        column = constants.trace_column
+        if column not in updated_message or not is_missing_column(e, column):
+            raise
+        logging.error(f"The db has no {column} column, traces are not stored: {e}")
+        constants.trace_column = None
+        updated_message = dict(updated_message)
+        del updated_message[column]
+        return update(updated_message).eq("input", input_cid).execute().data
+
+
+def is_missing_column(error, column):
+    # PGRST204: unknown column in the schema cache, 42703: undefined_column
+    return error.code in ("PGRST204", "42703") and column in str(error.message)
+
+
+def start_container_and_perform_request_and_send_outputs(message, slot, inputs=None):
     """Message example:
      {
         'end_time': None,
@@ -64,35 +121,40 @@ def start_container_and_perform_request_and_send_outputs(message):
     """
     # start process: pollinate --send --ipns --nodeid nodeid --path /content/ipfs
     image = message["image"]
-    if image not in available_models():
+    input_path, output_path = slot.input_path, slot.output_path
+    if image not in constants.available_models():
         raise ValueError(f"Model not found: {image}")
 
     clean_folder(input_path)
     prepare_output_folder(output_path)
-    inputs = fetch_inputs(message["input"])
+    if inputs is None:
+        with tracing.span("fetch_inputs"):
+            inputs = fetch_inputs(message["input"])
+    else:
+        tracing.tag("inputs", "prefetched")
     # Write inputs to /input
     for key, value in inputs.items():
         write_folder(input_path, key, json.dumps(value))
+    journal.record(message["input"], "inputs_fetched")
 
-    # Start IPFS syncing
-    with BackgroundCommand(
-        f"pollinate-cli.js --send --path {ipfs_root} --nodeid {message['input']}  --ipns --debounce 4000"
-    ):
-        with RunningCogModel(image, output_path) as cogmodel:
-            with BackgroundCommand(
-                f"docker logs cogmodel -f --since {cogmodel.pollen_start_time.isoformat()} > {output_path}/log",
-                wait_before_exit=3,
-            ):
-                response = send_to_cog_container(inputs, output_path)
+    # Sync the outputs while the model runs, and a last time once they are
+    # written. The pollen is done when that sync returned the CID.
+    with output_sync(slot.ipfs_root, message["input"]) as sync:
+        with RunningCogModel(image, slot) as cogmodel:
+            with cogmodel.follow_logs() as log_tail:
+                # the model is ready, claim the next pollen while it runs
+                if slot.prefetcher is not None:
+                    slot.prefetcher.start(image)
+                journal.record(message["input"], "predicting")
+                response = cogmodel.predict(inputs)
+                # a 500 means the cog server crashed or cannot be reached,
+                # a prediction that failed otherwise leaves it working
                 if response.status_code == 500:
                     cogmodel.shutdown()
-                    success = False
-                else:
-                    success = True
+                success = response.status_code == 200
         write_folder(output_path, "success", json.dumps(success))
-        # sleep for 5 seconds to make sure the log file is written
-        utils.system("sleep 5")
-    # utils.system(
-    #     f"/usr/local/bin/pollinate-cli.js --send --path {ipfs_root} --once --nodeid {message['input']} --ipns"
-    # )
-    return message, success
+        journal.record(message["input"], "outputs_written", success=success)
+        # published with the outputs, the final sync is only in the db summary
+        tracing.write(output_path)
+    logging.info(f"Waited {log_tail.waited:.2f}s for logs, published {sync.cid}")
+    return message, success, sync.cid
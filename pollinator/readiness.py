@@ -0,0 +1,139 @@
+"""Detect when a freshly started cog container is ready to take predictions.
+
+The health endpoint is polled with a backoff that starts at 50 ms, so fast
+models are picked up right away and slow ones are not hammered. In
+parallel, the docker event stream is watched for the container exiting, so
+a model that crashes during setup fails immediately instead of after the
+full timeout. The time each image took to become ready is recorded in a
+json file and used as the cost of swapping to that image.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import docker
+import requests
+
+from pollinator import http_client
+
+
+class UnhealthyCogContainer(Exception):
+    pass
+
+
+setup_durations = {}  # image -> seconds the last setup took
+
+
+def load_setup_durations(path):
+    try:
+        with open(path) as f:
+            setup_durations.update(json.load(f))
+    except (FileNotFoundError, ValueError):
+        pass
+
+
+def record_setup_duration(image, seconds, path=None):
+    setup_durations[image] = seconds
+    logging.info(f"Setup of {image} took {seconds:.1f}s")
+    if path is None:
+        return
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(setup_durations, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.error(f"Could not save setup durations: {e}")
+
+
+class ExitWatcher:
+    """Set `exited` as soon as docker reports that the container stopped"""
+
+    def __init__(self, docker_client, container_name):
+        self.docker_client = docker_client
+        self.container_name = container_name
+        self.exited = threading.Event()
+        self.events = None
+
+    def __enter__(self):
+        try:
+            self.events = self.docker_client.events(
+                decode=True,
+                filters={
+                    "container": self.container_name,
+                    "event": ["die", "oom", "destroy"],
+                },
+            )
+        except docker.errors.APIError as e:
+            logging.info(f"Can't watch docker events, relying on health checks: {e}")
+            return self
+        threading.Thread(target=self._watch, daemon=True).start()
+        # the container may have died before we subscribed
+        if not self.is_running():
+            self.exited.set()
+        return self
+
+    def _watch(self):
+        try:
+            for event in self.events:
+                logging.info(f"{self.container_name}: {event.get('status')}")
+                self.exited.set()
+                return
+        except Exception:  # noqa
+            pass  # stream closed
+
+    def is_running(self):
+        try:
+            container = self.docker_client.containers.get(self.container_name)
+        except docker.errors.NotFound:
+            return False
+        return container.status in ("created", "running", "restarting")
+
+    def __exit__(self, type, value, traceback):
+        if self.events is not None:
+            self.events.close()
+
+
+def health_status(url):
+    """READY, STARTING, SETUP_FAILED or None if the server does not respond.
+    Older cog versions have no /health-check, for them 200 on / means READY"""
+    try:
+        response = http_client.get("cog_health", f"{url}/health-check")
+        if response.status_code == 200:
+            return response.json().get("status", "READY")
+        if http_client.get("cog_health", f"{url}/").status_code == 200:
+            return "READY"
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return None
+
+
+def wait_until_ready(
+    docker_client,
+    container_name,
+    url,
+    timeout=40 * 60,
+    min_interval=0.05,
+    max_interval=2,
+):
+    """Block until the cog server in the container is ready.
+    Raises UnhealthyCogContainer if it exits, fails setup, or times out.
+    Returns the seconds it took."""
+    start = time.monotonic()
+    interval = min_interval
+    with ExitWatcher(docker_client, container_name) as watcher:
+        while time.monotonic() - start < timeout:
+            if watcher.exited.is_set():
+                raise UnhealthyCogContainer(f"{container_name} exited during setup")
+            status = health_status(url)
+            if status in ("READY", "BUSY"):
+                return time.monotonic() - start
+            if status in ("SETUP_FAILED", "DEFUNCT"):
+                raise UnhealthyCogContainer(f"Setup of {container_name} failed")
+            # sleep, but wake up right away if the container dies
+            watcher.exited.wait(interval)
+            interval = min(interval * 1.5, max_interval)
+    raise UnhealthyCogContainer(f"{container_name} not ready after {timeout}s")
@@ -0,0 +1,144 @@
+"""Decide when a cog container has degraded and should be restarted.
+
+Some models leak memory or slow down the longer their container runs. After
+every pollen the pool samples the container with `docker stats` (memory and
+CPU) and, with a GPU, the memory used on it, and records how long the
+prediction took. The samples after the first `warmup` pollen are the
+baseline; a container is flagged for recycling when it grew or slowed down
+beyond the thresholds of the `RecyclePolicy`. The pool restarts flagged
+containers while its slot is idle, so a waiting request never pays for it.
+"""
+
+import logging
+import statistics
+from collections import deque
+
+from pollinator import utils
+
+
+class Vitals:
+    """Resource samples and prediction latencies of one cog container"""
+
+    def __init__(self, warmup=3, window=10):
+        self.warmup = warmup
+        self.pollen = 0
+        self.baseline = None  # first sample after the warmup
+        self.latest = None
+        self.baseline_latencies = []  # the `window` pollen after the warmup
+        self.latencies = deque(maxlen=window)  # the last `window` pollen
+        self.window = window
+
+    def observe_latency(self, seconds):
+        self.pollen += 1
+        if self.pollen <= self.warmup:
+            return
+        if len(self.baseline_latencies) < self.window:
+            self.baseline_latencies.append(seconds)
+        else:
+            self.latencies.append(seconds)
+
+    def observe_sample(self, sample):
+        if self.baseline is None and self.pollen >= self.warmup:
+            self.baseline = sample
+        self.latest = sample
+
+
+class RecyclePolicy:
+    """Thresholds for recycling, 0 disables a check:
+    - `memory_growth`, `gpu_memory_growth`: growth over the baseline,
+      e.g. 0.5 recycles at 150% of the baseline
+    - `latency_drift`: ratio of the median latency of the last pollen to
+      the one of the baseline pollen
+    - `cpu_percent`: CPU use right after a prediction finished
+    - `max_pollen`: pollen served by the container"""
+
+    def __init__(
+        self,
+        memory_growth=0.5,
+        gpu_memory_growth=0.3,
+        latency_drift=1.5,
+        cpu_percent=0,
+        max_pollen=0,
+    ):
+        self.memory_growth = memory_growth
+        self.gpu_memory_growth = gpu_memory_growth
+        self.latency_drift = latency_drift
+        self.cpu_percent = cpu_percent
+        self.max_pollen = max_pollen
+
+    def reason(self, vitals):
+        """(kind, description) of why the container should be recycled, or None"""
+        if self.max_pollen and vitals.pollen >= self.max_pollen:
+            return "pollen", f"served {vitals.pollen} pollen"
+        baseline, latest = vitals.baseline, vitals.latest
+        if baseline is not None and latest is not None:
+            for key, growth in [
+                ("memory_mb", self.memory_growth),
+                ("gpu_memory_mb", self.gpu_memory_growth),
+            ]:
+                if not growth or not baseline.get(key) or latest.get(key) is None:
+                    continue
+                if latest[key] > baseline[key] * (1 + growth):
+                    return key[: -len("_mb")], (
+                        f"{key} grew from {baseline[key]:.0f} to {latest[key]:.0f}"
+                    )
+        if (
+            self.cpu_percent
+            and latest is not None
+            and latest.get("cpu_percent", 0) > self.cpu_percent
+        ):
+            return "cpu", f"uses {latest['cpu_percent']:.0f}% CPU while idle"
+        if self.latency_drift and len(vitals.latencies) == vitals.window:
+            drift = statistics.median(vitals.latencies) / statistics.median(
+                vitals.baseline_latencies
+            )
+            if drift > self.latency_drift:
+                return "latency", f"predictions got {drift:.1f}x slower"
+        return None
+
+
+def sample(container):
+    """Memory (MB) and CPU use (percent of one core) of a docker container"""
+    stats = container.stats(stream=False)
+    result = {"memory_mb": stats["memory_stats"]["usage"] / 2**20}
+    cpu = cpu_percent(stats)
+    if cpu is not None:
+        result["cpu_percent"] = cpu
+    return result
+
+
+def cpu_percent(stats):
+    """Like `docker stats`, from the two samples in one stats response"""
+    try:
+        cpu, previous = stats["cpu_stats"], stats["precpu_stats"]
+        cpu_delta = (
+            cpu["cpu_usage"]["total_usage"] - previous["cpu_usage"]["total_usage"]
+        )
+        system_delta = cpu["system_cpu_usage"] - previous["system_cpu_usage"]
+    except KeyError:
+        return None
+    if system_delta <= 0:
+        return None
+    return cpu_delta / system_delta * cpu.get("online_cpus", 1) * 100
+
+
+def gpu_memory_mb(device_ids=None, field="memory.used"):
+    """MB used on the GPUs `device_ids` (all by default), None if unknown.
+    `field="memory.total"` reads their size instead"""
+    try:
+        output = utils.popen(
+            f"nvidia-smi --query-gpu=index,{field} --format=csv,noheader,nounits"
+        ).read()
+    except OSError as e:
+        logging.error(f"Could not query the GPU memory: {e}")
+        return None
+    used = {}
+    for line in output.splitlines():
+        try:
+            index, memory = [value.strip() for value in line.split(",")]
+            used[index] = float(memory)
+        except ValueError:
+            continue
+    if device_ids is not None:
+        used = {index: mb for index, mb in used.items() if index in device_ids}
+    return sum(used.values()) if len(used) > 0 else None
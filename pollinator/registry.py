@@ -0,0 +1,130 @@
+"""Models this pollinator can run, kept up to date in the background.
+
+The model index is downloaded with conditional requests (ETag and
+If-Modified-Since), so an unchanged index costs one small request. The
+images present locally are listed once and then updated from the docker
+image events. `available` only reads the current state and never waits
+for the network or docker; if a refresh fails the last good list is kept.
+"""
+
+import logging
+import threading
+import time
+
+import docker
+import requests
+
+from pollinator import http_client
+
+IMAGE_EVENTS = ["pull", "tag", "untag", "delete", "load", "import"]
+
+
+def local_image_names(docker_client):
+    """All names local images can be referred to by"""
+    names = set()
+    for image in docker_client.images.list():
+        for tag in image.tags:
+            names.add(tag)
+            if tag.endswith(":latest"):
+                names.add(tag[: -len(":latest")])
+        names.update(image.attrs.get("RepoDigests") or [])
+    return names
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        index_url,
+        group,
+        docker_client,
+        always_available=(),
+        refresh_interval=300,
+    ):
+        self.index_url = index_url
+        self.group = group
+        self.docker_client = docker_client
+        self.always_available = list(always_available)
+        self.refresh_interval = refresh_interval
+        self.metadata = {}  # image -> entry in the model index
+        self.local_images = set()
+        self.etag = None
+        self.last_modified = None
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Load the index and the local images once, then keep them up to
+        date in the background. Safe to call more than once."""
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+            self.refresh_index()
+            self.refresh_local_images()
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+        threading.Thread(target=self._watch_images, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def available(self):
+        supported = [
+            image
+            for image, meta in self.metadata.items()
+            if self._in_group(meta) and image in self.local_images
+        ]
+        return supported + self.always_available
+
+    def _in_group(self, meta):
+        try:
+            return self.group in meta["meta"]["pollinator_group"]
+        except (KeyError, TypeError):
+            return False
+
+    def refresh_index(self):
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        try:
+            response = http_client.get("model_index", self.index_url, headers=headers)
+            if response.status_code == 304:
+                return
+            response.raise_for_status()
+            metadata = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Could not refresh the model index, keeping the last: {e}")
+            return
+        self.metadata = metadata
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        logging.info(f"Model index updated: {len(metadata)} models")
+
+    def refresh_local_images(self):
+        try:
+            self.local_images = local_image_names(self.docker_client)
+        except (docker.errors.APIError, requests.exceptions.RequestException) as e:
+            logging.error(f"Could not list local images, keeping the last: {e}")
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            self.refresh_index()
+            # events can be missed while the stream reconnects
+            self.refresh_local_images()
+
+    def _watch_images(self):
+        while not self.stopped.is_set():
+            try:
+                events = self.docker_client.events(
+                    decode=True, filters={"type": "image", "event": IMAGE_EVENTS}
+                )
+                for event in events:
+                    logging.info(f"Image {event.get('Action')}: {event.get('id')}")
+                    self.refresh_local_images()
+                    if self.stopped.is_set():
+                        return
+            except Exception as e:  # noqa
+                logging.info(f"Docker event stream closed: {e}")
+            time.sleep(5)
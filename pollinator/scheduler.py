@@ -0,0 +1,81 @@
+"""Choose which model to run next so that cog container swaps are rare.
+
+Starting a new cog container can take minutes, so when several images have
+pending pollen, it is cheaper to drain the loaded image before switching.
+The scheduler looks at the whole pending queue:
+
+- priorities are strict: only the highest pending priority is considered
+- within that priority, an image whose oldest pollen waited `max_wait`
+  seconds longer than the oldest pollen of the loaded images is served
+  first, so nothing starves. The wait is relative: under a backlog where
+  every pollen is older than `max_wait`, the loaded image keeps running
+  instead of swapping on every pollen
+- otherwise the pollen of the loaded images are drained, oldest first
+- only when none of them is pending, the image with the lowest expected
+  cost is chosen. The cost is the swap cost of the image spread over the
+  number of pollen that can be run after the swap, minus the time the
+  oldest of them already waited.
+"""
+
+import datetime as dt
+
+
+def waiting_seconds(row, now):
+    """Seconds since request_submit_time, 0 if the timestamp can't be parsed"""
+    try:
+        submitted = dt.datetime.fromisoformat(row["request_submit_time"][:19])
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return max(0, (now - submitted).total_seconds())
+
+
+class AffinityScheduler:
+    def __init__(self, swap_cost=60, max_wait=300, swap_costs=None):
+        """swap_cost: seconds a cold start costs if nothing was measured yet
+        max_wait: seconds a pollen may wait longer than the pollen of the
+            loaded images before it is served regardless of swaps
+        swap_costs: dict of measured cold start seconds per image"""
+        self.swap_cost = swap_cost
+        self.max_wait = max_wait
+        self.swap_costs = swap_costs if swap_costs is not None else {}
+
+    def cost_of_switching_to(self, image, loaded_images):
+        if image in loaded_images:
+            return 0
+        return self.swap_costs.get(image, self.swap_cost)
+
+    def choose_image(self, candidates, loaded_images, now=None):
+        """Return the image whose pollen should run next, or None if there
+        are no candidates. `now` is a naive UTC datetime."""
+        if len(candidates) == 0:
+            return None
+        now = now or dt.datetime.utcnow()
+        priority = max(c.get("priority") or 0 for c in candidates)
+        candidates = [c for c in candidates if (c.get("priority") or 0) == priority]
+
+        groups = {}
+        for c in candidates:
+            count, oldest = groups.get(c["image"], (0, 0))
+            groups[c["image"]] = (count + 1, max(oldest, waiting_seconds(c, now)))
+
+        loaded_wait = max(
+            (oldest for image, (_, oldest) in groups.items() if image in loaded_images),
+            default=0,
+        )
+        starving = [
+            (oldest, image)
+            for image, (_, oldest) in groups.items()
+            if oldest - loaded_wait > self.max_wait
+        ]
+        if len(starving) > 0:
+            return max(starving)[1]
+
+        loaded = [image for image in groups if image in loaded_images]
+        if len(loaded) > 0:
+            return max(loaded, key=lambda image: groups[image][1])
+
+        def expected_cost(image):
+            count, oldest = groups[image]
+            return self.cost_of_switching_to(image, loaded_images) / count - oldest
+
+        return min(groups, key=expected_cost)
@@ -0,0 +1,113 @@
+"""Worker slots: one pollinator process can run several pollen in parallel.
+
+Every slot has its own scratch directories, crash recovery files, GPU and
+cog container pool (container names and ports). With a single slot, the
+paths and names are the same as before slots existed (/tmp/ipfs/output,
+"cogmodel" on port 5000), so crash recovery and container reuse keep
+working across upgrades.
+"""
+
+import os
+
+from pollinator import constants, utils
+from pollinator.cog_handler import ContainerPool
+
+
+class Slot:
+    def __init__(self, index, gpu_id=None, num_slots=1):
+        self.index = index
+        self.gpu_id = gpu_id
+        if num_slots == 1:
+            self.ipfs_root = constants.ipfs_root
+            self.input_cid_path = constants.input_cid_path
+            self.attempt_path = constants.attempt_path
+            self.prefetch_cid_path = constants.prefetch_cid_path
+            container_name = "cogmodel"
+        else:
+            self.ipfs_root = os.path.join(constants.ipfs_root, f"slot{index}")
+            self.input_cid_path = os.path.join(self.ipfs_root, "input_cid")
+            self.attempt_path = os.path.join(self.ipfs_root, "attempt")
+            self.prefetch_cid_path = os.path.join(self.ipfs_root, "prefetch_cid")
+            container_name = f"cogmodel-slot{index}"
+        self.input_path = os.path.join(self.ipfs_root, "input")
+        self.output_path = os.path.join(self.ipfs_root, "output")
+        self.handover_path = os.path.join(self.ipfs_root, "handover.json")
+        self.pool = ContainerPool(
+            name=container_name,
+            base_port=5000 + index * constants.max_resident_models,
+            memory_budget_mb=constants.memory_budget_mb // num_slots,
+            device_ids=None if gpu_id is None else [str(gpu_id)],
+            gpu_memory_budget_mb=constants.gpu_memory_budget_mb,
+        )
+        self.prefetcher = None  # set by main if prefetching is enabled
+        self._lanes = {}
+
+    def __repr__(self):
+        device = "cpu" if self.gpu_id is None else f"gpu {self.gpu_id}"
+        return f"Slot({self.index}, {device}, {self.ipfs_root})"
+
+    def lane(self, index):
+        if index == 0:
+            return self
+        if index not in self._lanes:
+            self._lanes[index] = Lane(self, index)
+        return self._lanes[index]
+
+    def lanes(self, count):
+        """The slot itself and count - 1 lanes next to it"""
+        return [self.lane(index) for index in range(count)]
+
+
+class Lane:
+    """Another pollen in flight to the cog containers of a slot, for models
+    that take several predictions at once. A lane shares the container pool
+    of the slot but has its own folders, in a hidden folder of the slot that
+    the sync of the slot skips. Files the model writes to /outputs instead of
+    returning them land in the folder of whichever lane started the container,
+    so lanes are only safe for models that return their outputs."""
+
+    def __init__(self, slot, index):
+        self.slot = slot
+        self.index = f"{slot.index}-{index}"
+        self.gpu_id = slot.gpu_id
+        self.ipfs_root = os.path.join(slot.ipfs_root, f".lane{index}")
+        self.input_path = os.path.join(self.ipfs_root, "input")
+        self.output_path = os.path.join(self.ipfs_root, "output")
+        self.pool = slot.pool
+        self.prefetcher = None
+        os.makedirs(self.ipfs_root, exist_ok=True)
+
+    def __repr__(self):
+        return f"Lane({self.index}, {self.ipfs_root})"
+
+
+def find_slot(slots, index):
+    """The slot or lane with an index as recorded in the journal, or None"""
+    if isinstance(index, str):
+        slot_index, lane_index = (int(i) for i in index.split("-"))
+        slot = find_slot(slots, slot_index)
+        return None if slot is None else slot.lane(lane_index)
+    return next((slot for slot in slots if slot.index == index), None)
+
+
+def gpu_ids():
+    if not constants.has_gpu:
+        return []
+    output = utils.popen("nvidia-smi --query-gpu=index --format=csv,noheader").read()
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+
+def make_slots(num_slots=None):
+    """POLLINATOR_SLOTS slots spread round-robin over the GPUs, or one slot
+    per GPU if it is "auto". Without GPUs, all slots run on the CPU."""
+    gpus = gpu_ids()
+    if num_slots is None and constants.num_slots == "auto":
+        num_slots = max(1, len(gpus))
+    elif num_slots is None:
+        num_slots = int(constants.num_slots)
+    slots = []
+    for index in range(num_slots):
+        gpu_id = gpus[index % len(gpus)] if len(gpus) > 0 else None
+        slots.append(Slot(index, gpu_id, num_slots))
+        os.makedirs(slots[-1].ipfs_root, exist_ok=True)
+    return slots
@@ -9,13 +9,17 @@ import sys
 import time
 
 import psutil
-import requests
 import timeout_decorator
 
-from pollinator import constants, utils
+from pollinator import constants, http_client, utils
+from pollinator.cache import ContentCache
 
+content_cache = ContentCache(constants.cache_path, constants.cache_budget_mb)
 
-@timeout_decorator.timeout(20)
+
+# no timeout_decorator: it relies on signals, which only work in the main
+# thread, and every slot fetches the inputs of its pollen in its own thread.
+# The "storage" timeouts of http_client bound the request instead.
 def cid_to_json(cid: str):
     """Get a CID of a dir in IPFS and return a dict. Runs "node /usr/local/bin/getcid-cli.js [cid]
     with {filename: filecontent} structure, where
@@ -23,7 +27,7 @@ def cid_to_json(cid: str):
         - filecontents containing a filename are resolved to absolute URIs
     """
     logging.info(f"Fetching IPFS dir {cid}")
-    response = requests.get(f"{constants.storage_service_endpoint}/{cid}")
+    response = http_client.get("storage", f"{constants.storage_service_endpoint}/{cid}")
     content = response.json()
     return content
 
@@ -34,33 +38,17 @@ def write_folder(path, key, value, mode="w"):
         f.write(value)
 
 
-# we don't actually need to download referenced files
-# because cog does it and is happy with URLs
-# def download_referenced_files(data, target):
-#     # If it's a dict, recursively call this function
-#     # if a value is a URL, download it
-#     if isinstance(data, dict):
-#         for key, value in data.items():
-#             download_referenced_files(value, f"{target}/{key}")
-#     # If it's a list, recursively call this function
-#     elif isinstance(data, list):
-#         for i, value in enumerate(data):
-#             download_referenced_files(value, f"{target}/{key}/{i}")
-#     # If it's a URL, download it
-#     elif isinstance(data, str) and data.startswith("http"):
-#         os.makedirs(os.path.dirname(target), exist_ok=True)
-#         logging.info(f"Downloading {data} to {target}")
-#         urllib.request.urlretrieve(data, f"{target}")
-
-
 def fetch_inputs(cid: str):
     try:
-        data = cid_to_json(cid)
+        data = content_cache.get_json(
+            cid, cid_to_json, valid=lambda data: "input" in data
+        )
         inputs = data["input"]
     except KeyError:
         raise ValueError(f"CID {cid} could ot be resolved")
     logging.info(f"Fetched inputs from IPFS {cid}: {inputs}")
-    # download_referenced_files(inputs, constants.input_path)
+    if constants.cache_referenced_files:
+        inputs = content_cache.localize(inputs, constants.cache_mount_path)
     return inputs
 
 
@@ -86,6 +74,9 @@ def prepare_output_folder(output_path):
 
 
 class BackgroundCommand:
+    """Run a bash command while the context is open, e.g. a pollinator in
+    test/test_pollinator.py"""
+
     def __init__(self, cmd, on_exit=None, wait_before_exit=3):
         self.cmd = cmd
         self.on_exit = on_exit
@@ -98,7 +89,7 @@ class BackgroundCommand:
     def __exit__(self, type, value, traceback):
         logging.info(f"Killing background command: {self.cmd}")
         time.sleep(self.wait_before_exit)
-        tree_kill(self.proc.pid)        
+        tree_kill(self.proc.pid)
         # wait for the process to terminate
         self.proc.wait()
         if self.on_exit is not None:
@@ -108,14 +99,27 @@ class BackgroundCommand:
                 logging.error(f"Timeout while running on_exit command: {self.on_exit}")
 
 
+def wait_until(condition, timeout, interval=0.05):
+    """Poll `condition` until it returns True. Returns False on timeout"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
 def tree_kill(pid):
     print(f"Killing process {pid} and their complete family")
-    parent = psutil.Process(pid)
-    for child in parent.children(recursive=True):
-        print(f"Killing child: {child} {child.pid}")
-        # send SIGINT to the process
-        child.send_signal(signal.SIGINT)
-    parent.send_signal(signal.SIGINT)
+    try:
+        parent = psutil.Process(pid)
+        for child in parent.children(recursive=True):
+            print(f"Killing child: {child} {child.pid}")
+            # send SIGINT to the process
+            child.send_signal(signal.SIGINT)
+        parent.send_signal(signal.SIGINT)
+    except psutil.NoSuchProcess:
+        pass  # the command already exited
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+"""Publish the folder of a slot while a pollen runs, and once it is done.
+
+`OutputSync` hashes the files below the folder and hands only the new or
+changed ones to a storage backend, small files batched together. While the
+context is open it syncs every `interval` seconds, so the outputs of a
+running model show up early. On exit it syncs a last time and keeps the CID
+of the folder in `cid`, so the pollen ends when its outputs are published
+instead of after a debounce. If that last sync fails, the error is raised.
+
+Backends implement `upload(files)` with a list of (relative path, absolute
+path, digest) and `commit(name, manifest, final)`, which stores the folder
+and returns its CID. Only the final commit publishes it under `name`.
+`PollinateCliBackend` sends the files with pollinate-cli.js, `LocalBackend`
+is a content addressed store on disk for tests and benchmarks.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from pollinator import constants, tracing
+
+# CIDv0 (base58 "Qm...") or CIDv1 (base32 "b...")
+cid_pattern = re.compile(r"^(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})$")
+
+
+def file_digest(path, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputSync:
+    def __init__(self, root, backend, name, interval=4, batch_bytes=4 * 2**20):
+        self.root = root
+        self.backend = backend
+        self.name = name
+        self.interval = interval
+        self.batch_bytes = batch_bytes
+        self.manifest = {}  # relative path -> digest of the uploaded content
+        self.stats = {}  # relative path -> (size, mtime) when it was hashed
+        self.cid = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._sync_periodically, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        try:
+            with tracing.span("sync"):
+                self.sync(final=True)
+        except Exception as e:  # noqa
+            logging.error(f"Could not publish {self.root}: {e}")
+            # unpublished outputs fail the pollen, unless it failed already
+            if value is None:
+                raise
+
+    def _sync_periodically(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:  # noqa
+                logging.error(f"Could not sync {self.root}: {e}")
+
+    def files(self):
+        """Relative path -> absolute path, without hidden files and folders"""
+        files = {}
+        for root, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if not filename.startswith("."):
+                    path = os.path.join(root, filename)
+                    files[os.path.relpath(path, self.root)] = path
+        return files
+
+    def changes(self, files):
+        """Digests of the files, and the ones that differ from the manifest"""
+        digests, changed = {}, []
+        for relative_path, path in sorted(files.items()):
+            try:
+                stat = os.stat(path)
+                key = (stat.st_size, stat.st_mtime_ns)
+                if self.stats.get(relative_path, (None,))[0:2] == key:
+                    digest = self.stats[relative_path][2]
+                else:
+                    digest = file_digest(path)
+                    self.stats[relative_path] = (*key, digest)
+            except FileNotFoundError:
+                continue  # deleted while walking
+            digests[relative_path] = digest
+            if self.manifest.get(relative_path) != digest:
+                changed.append((relative_path, path, digest))
+        return digests, changed
+
+    def batches(self, changed):
+        """Groups of files of up to batch_bytes, large files on their own"""
+        batch, size = [], 0
+        for file in changed:
+            file_size = os.path.getsize(file[1])
+            if len(batch) > 0 and size + file_size > self.batch_bytes:
+                yield batch
+                batch, size = [], 0
+            batch.append(file)
+            size += file_size
+        if len(batch) > 0:
+            yield batch
+
+    def sync(self, final=False):
+        """Upload what changed and return the CID of the folder. The final
+        sync also publishes the folder under the name"""
+        with self.lock:
+            digests, changed = self.changes(self.files())
+            if len(changed) == 0 and digests.keys() == self.manifest.keys():
+                if self.cid is not None and not final:
+                    return self.cid
+            for batch in self.batches(changed):
+                self.backend.upload(batch)
+            self.manifest = digests
+            self.cid = self.backend.commit(self.name, dict(digests), final)
+            logging.info(
+                f"Synced {len(changed)} of {len(digests)} files of {self.root}: "
+                f"{self.cid}"
+            )
+            return self.cid
+
+
+class PollinateCliBackend:
+    """Sends the files of the manifest with pollinate-cli.js, which uploads
+    them to IPFS. The final commit also publishes them under the IPNS name of
+    the pollen. Uploaded files are hard linked into a hidden staging folder,
+    so the journal, the queues and the other lanes in the same folder are
+    never sent. IPFS skips the blocks it already has, so unchanged files cost
+    nothing. The send is only done once the CID of the folder is printed; any
+    other output is not a flush."""
+
+    def __init__(self, root, timeout=120):
+        self.root = root
+        self.staging_path = os.path.join(root, ".sync")
+        self.timeout = timeout
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    def upload(self, files):
+        for relative_path, path, _ in files:
+            target = os.path.join(self.staging_path, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.lexists(target):
+                os.remove(target)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+
+    def commit(self, name, manifest, final=False):
+        # drop the files that were deleted since they were uploaded
+        for root, _, filenames in os.walk(self.staging_path):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if os.path.relpath(path, self.staging_path) not in manifest:
+                    os.remove(path)
+        os.makedirs(self.staging_path, exist_ok=True)
+        command = [
+            "pollinate-cli.js",
+            "--send",
+            "--path",
+            self.staging_path,
+            "--once",
+            "--nodeid",
+            name,
+        ]
+        result = subprocess.run(
+            command + ["--ipns"] if final else command,
+            capture_output=True,
+            text=True,
+            timeout=self.timeout,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"pollinate-cli.js failed: {result.stderr[-1000:]}")
+        lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        if len(lines) == 0 or not cid_pattern.match(lines[-1]):
+            raise RuntimeError(f"pollinate-cli.js did not report a CID: {lines[-1:]}")
+        return lines[-1]
+
+
+class LocalBackend:
+    """Content addressed store in a local folder: files are stored by digest
+    and every commit stores the manifest, whose digest is the CID.
+    `uploads` lists the batches of relative paths."""
+
+    def __init__(self, path):
+        self.path = path
+        self.uploads = []
+        os.makedirs(path, exist_ok=True)
+
+    def upload(self, files):
+        for relative_path, path, digest in files:
+            target = os.path.join(self.path, digest)
+            if not os.path.exists(target):
+                shutil.copyfile(path, target)
+        self.uploads.append([relative_path for relative_path, _, _ in files])
+
+    def commit(self, name, manifest, final=False):
+        data = json.dumps({"name": name, "files": manifest}, sort_keys=True).encode()
+        cid = hashlib.sha256(data).hexdigest()
+        with open(os.path.join(self.path, cid), "wb") as f:
+            f.write(data)
+        return cid
+
+
+def make_backend(root):
+    """The backend configured by POLLINATOR_SYNC_BACKEND for the folder"""
+    if constants.sync_backend == "local":
+        return LocalBackend(constants.sync_local_path)
+    return PollinateCliBackend(root)
+
+
+def output_sync(root, name):
+    return OutputSync(
+        root,
+        make_backend(root),
+        name,
+        interval=constants.sync_interval,
+        batch_bytes=constants.sync_batch_bytes,
+    )
@@ -0,0 +1,118 @@
+"""Timings of the phases of a pollen.
+
+`process_message` starts a trace for the pollen it runs. Code further down
+records its phases with `span("name")` without having to pass the trace
+around: the trace is bound to the thread, and every slot runs its pollen in
+its own thread. Outside of a trace, spans cost nothing and record nothing.
+
+A trace is written as a compact json file next to the outputs,
+e.g. {"start": "2022-10-17T12:00:00", "spans": [["fetch_inputs", 0.0, 0.41], ...]}
+with the offset and duration of every span in seconds, and summarised as
+{phase: total seconds} on the db row. Spans can nest: `container` includes
+`health_wait` and `predict` includes `output_write`.
+"""
+
+import datetime as dt
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self):
+        self.start_time = dt.datetime.now()
+        self.start = time.monotonic()
+        self.spans = []  # [name, offset, duration]
+        self.attributes = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.add(name, time.monotonic() - start, start)
+
+    def add(self, name, seconds, start=None):
+        """Record a phase that was measured elsewhere"""
+        if start is None:
+            start = time.monotonic() - seconds
+        self.spans.append([name, round(start - self.start, 3), round(seconds, 3)])
+
+    def tag(self, key, value):
+        """Attach a fact about the pollen, e.g. whether the container was reused"""
+        self.attributes[key] = value
+
+    def summary(self):
+        totals = {}
+        for name, _, seconds in self.spans:
+            totals[name] = round(totals.get(name, 0) + seconds, 3)
+        totals["total"] = round(time.monotonic() - self.start, 3)
+        return {**totals, **self.attributes}
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "start": self.start_time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "spans": self.spans,
+                **self.attributes,
+            },
+            separators=(",", ":"),
+        )
+
+    def write(self, folder, filename="trace.json"):
+        try:
+            tmp_path = os.path.join(folder, f".{filename}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(self.to_json())
+            os.replace(tmp_path, os.path.join(folder, filename))
+        except OSError as e:
+            logging.error(f"Could not write trace: {e}")
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def start():
+    """Trace everything that happens in this thread until the context ends"""
+    trace = Trace()
+    previous, _local.trace = current(), trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name):
+    trace = current()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name):
+        yield trace
+
+
+def add(name, seconds):
+    trace = current()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def tag(key, value):
+    trace = current()
+    if trace is not None:
+        trace.tag(key, value)
+
+
+def write(folder):
+    trace = current()
+    if trace is not None:
+        trace.write(folder)
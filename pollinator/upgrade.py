@@ -0,0 +1,65 @@
+"""Upgrade the worker without dropping pollen or warm models.
+
+`UpdateWatcher` checks in the background whether a newer pollinator image
+was pulled, so the worker loop never waits for docker. Once there is one,
+the worker drains: it finishes the pollen it is running (and the ones it
+already claimed ahead), stops claiming, and writes a handover file per slot
+that lists its cog containers. The containers are left running. The
+update agent starts the new worker as soon as the old one exited, and the
+new worker adopts the warm containers from the handover file instead of
+starting them again.
+"""
+
+import json
+import logging
+import os
+import threading
+
+
+class UpdateWatcher:
+    def __init__(self, is_outdated, interval=60):
+        self.is_outdated = is_outdated
+        self.interval = interval
+        self.draining = threading.Event()
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def drain(self):
+        """Finish the current pollen, then hand over"""
+        self.draining.set()
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if self.is_outdated():
+                    logging.info("A new pollinator image is available, draining")
+                    self.drain()
+                    return
+            except Exception as e:  # noqa
+                logging.error(f"Could not check for pollinator updates: {e}")
+
+
+def write_handover(path, containers):
+    """Write the state of the warm containers for the next worker"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"containers": containers}, f)
+    os.replace(tmp_path, path)
+    logging.info(f"Handing over {[c['name'] for c in containers]} via {path}")
+
+
+def read_handover(path):
+    """Container name -> state written by the previous worker. The file is
+    removed, so a later crash recovery does not use stale state."""
+    try:
+        with open(path) as f:
+            containers = json.load(f)["containers"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+    os.remove(path)
+    return {container["name"]: container for container in containers}
@@ -0,0 +1,4 @@
+-- Phase timings of each pollen, written by pollinator.process_msg as
+-- {"fetch_inputs": 0.41, "container": 0.02, "predict": 12.3, ..., "total": 21.7}
+-- Replace "pollen" with the table the workers use (--db_name).
+alter table pollen add column if not exists trace jsonb;
@@ -0,0 +1,47 @@
+-- Atomically pick and lock the next pollen for a worker.
+--
+-- Ordering is the same as in pollinator.main.get_task_from_db:
+--   1. highest priority
+--   2. images in preferred_images (the models that are already loaded)
+--   3. oldest request_submit_time
+-- Rows that are locked by a concurrent claim are skipped instead of waited
+-- for, so many workers can call this at the same time and each gets a
+-- different row in a single round trip. Returns NULL if nothing is pending.
+create or replace function claim_next_pollen(
+    table_name text,
+    images text[],
+    preferred_images text[],
+    worker_name text,
+    group_name text
+) returns jsonb
+language plpgsql
+as $$
+declare
+    claimed jsonb;
+begin
+    execute format(
+        $query$
+        update %1$I
+        set processing_started = true,
+            worker = $3,
+            pollinator_group = $4
+        where input = (
+            select input from %1$I
+            where processing_started = false
+              and image = any($1)
+            order by coalesce(priority, 0) desc,
+                     (image = any($2)) desc,
+                     request_submit_time asc
+            limit 1
+            for update skip locked
+        )
+        and processing_started = false
+        returning to_jsonb(%1$I.*)
+        $query$,
+        table_name
+    )
+    using images, preferred_images, worker_name, group_name
+    into claimed;
+    return claimed;
+end;
+$$;
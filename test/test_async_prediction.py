@@ -0,0 +1,163 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from pollinator.async_prediction import AsyncPrediction, WebhookReceiver
+
+
+def data_uri(content):
+    return "data:text/plain;base64," + base64.b64encode(content).decode()
+
+
+class StubCog:
+    """Answers PUT /predictions/{id} and then sends the webhooks of a
+    prediction that yields two outputs"""
+
+    def __init__(self, supports_async=True, complete=True, status="succeeded"):
+        self.cancelled = threading.Event()
+        self.files_seen_before_completed = None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if not supports_async:
+                    self.send_response(405)
+                    self.end_headers()
+                    return
+                self.send_response(202)
+                self.end_headers()
+                threading.Thread(target=stub.run, args=(body,)).start()
+
+            def do_GET(self):
+                body = json.dumps(stub.state).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.send_response(200)
+                self.end_headers()
+                if self.path.endswith("/cancel"):
+                    stub.cancelled.set()
+                    requests.post(stub.webhook, json={"status": "canceled"})
+
+            def log_message(self, *args):
+                pass
+
+        self.complete = complete
+        self.status = status
+        self.lose_webhooks = False
+        self.state = {"status": "starting"}
+        self.webhook = None
+        self.server = HTTPServer(("localhost", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_port}"
+
+    def run(self, body):
+        self.webhook = body["webhook"]
+        self.send({"status": "processing", "output": None})
+        first = {"status": "processing", "output": [data_uri(b"first")], "logs": "1\n"}
+        self.send(first)
+        if not self.complete:
+            return
+        self.files_seen_before_completed = self.output_files()
+        outputs = [data_uri(b"first"), data_uri(b"second")]
+        self.send({"status": self.status, "output": outputs, "logs": "1\n2\n"})
+
+    def send(self, state):
+        self.state = state
+        if not self.lose_webhooks:
+            requests.post(self.webhook, json=state)
+
+    def output_files(self):
+        return None
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def test_outputs_are_written_while_the_prediction_runs(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog()
+    cog.output_files = lambda: sorted(p.name for p in tmp_path.iterdir())
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    assert prediction.start({"prompt": "a"})
+    assert prediction.wait(timeout=5) == "succeeded"
+    assert "out_0.txt" in cog.files_seen_before_completed
+    assert (tmp_path / "out_0.txt").read_bytes() == b"first"
+    assert (tmp_path / "out_1.txt").read_bytes() == b"second"
+    assert (tmp_path / "prediction_log").read_text() == "1\n2\n"
+    assert (tmp_path / "time_first_output").exists()
+    assert prediction.status_code == 200
+    cog.shutdown()
+    receiver.shutdown()
+
+
+def test_prediction_is_cancelled_on_timeout(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog(complete=False)
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    assert prediction.start({})
+    assert prediction.wait(timeout=0.5) == "canceled"
+    assert cog.cancelled.is_set()
+    # the cog server answered the cancel, so it is still working
+    assert prediction.status_code == 422
+    cog.shutdown()
+    receiver.shutdown()
+
+
+def test_cog_without_async_support_falls_back(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog(supports_async=False)
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    assert not prediction.start({})
+    assert prediction.id not in receiver.handlers
+    cog.shutdown()
+    receiver.shutdown()
+
+
+def test_failed_prediction_is_not_a_container_failure(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog(status="failed")
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    assert prediction.start({})
+    assert prediction.wait(timeout=5) == "failed"
+    assert prediction.status_code == 422
+    cog.shutdown()
+    receiver.shutdown()
+
+
+def test_lost_webhooks_are_replaced_by_polling(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog()
+    cog.lose_webhooks = True
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    prediction.poll_interval = 0.1
+    assert prediction.start({})
+    assert prediction.wait(timeout=5) == "succeeded"
+    assert (tmp_path / "out_1.txt").read_bytes() == b"second"
+    cog.shutdown()
+    receiver.shutdown()
+
+
+def test_unreachable_cog_ends_the_wait(tmp_path):
+    receiver = WebhookReceiver("localhost", public_host="localhost")
+    cog = StubCog(complete=False)
+    prediction = AsyncPrediction(cog.url, str(tmp_path), receiver)
+    prediction.poll_interval = 0.1
+    assert prediction.start({})
+    while prediction.outputs_written == 0:
+        time.sleep(0.01)
+    cog.shutdown()
+    cog.server.server_close()
+    start = time.monotonic()
+    assert prediction.wait(timeout=60) == "processing"
+    assert time.monotonic() - start < 5
+    assert prediction.status_code == 500
+    receiver.shutdown()
@@ -0,0 +1,34 @@
+from benchmarks import bench_e2e
+
+
+def test_workload_runs_against_the_fakes():
+    result = bench_e2e.run(
+        "interleaved",
+        pollens=4,
+        setup=0.05,
+        predict=0.01,
+        output_bytes=1000,
+        claims="atomic",
+        prefetch=False,
+        sync_interval=0.05,
+    )
+    assert result["succeeded"] == 4
+    # the scheduler runs all pollen of a model before it swaps
+    assert result["starts"] == 2
+    assert all("predict" in trace for trace in result["traces"])
+
+
+def test_slots_poll_in_parallel():
+    result = bench_e2e.run(
+        "mixed",
+        pollens=6,
+        setup=0.05,
+        predict=0.05,
+        output_bytes=1000,
+        claims="atomic",
+        prefetch=True,
+        sync_interval=0.05,
+        slots=2,
+    )
+    assert result["succeeded"] == 6
+    assert result["pollens"] == 6  # no pollen ran twice
@@ -0,0 +1,109 @@
+import os
+import re
+
+import update_agent
+from benchmarks.fakes import FakeDockerClient, free_port
+from pollinator import cache, cog_handler, constants, storage
+from pollinator.cache import ContentCache
+
+
+def test_input_documents_are_fetched_once(tmp_path):
+    content_cache = ContentCache(str(tmp_path), budget_mb=1)
+    fetched = []
+
+    def fetch(cid):
+        fetched.append(cid)
+        return {"input": {"Prompt": cid}}
+
+    hits = cache.cache_hits.value(kind="input")
+    assert content_cache.get_json("Qm1", fetch) == {"input": {"Prompt": "Qm1"}}
+    assert content_cache.get_json("Qm1", fetch) == {"input": {"Prompt": "Qm1"}}
+    assert fetched == ["Qm1"]
+    assert cache.cache_hits.value(kind="input") == hits + 1
+    # a new process picks up the entries on disk
+    assert ContentCache(str(tmp_path), 1).get_json("Qm1", fetch)["input"]
+    assert fetched == ["Qm1"]
+
+
+def test_invalid_documents_are_not_cached(tmp_path):
+    content_cache = ContentCache(str(tmp_path), budget_mb=1)
+    fetched = []
+
+    def fetch(cid):
+        fetched.append(cid)
+        return {"error": "not found"}
+
+    for _ in range(2):
+        content_cache.get_json("Qm1", fetch, valid=lambda data: "input" in data)
+    assert fetched == ["Qm1", "Qm1"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    content_cache = ContentCache(str(tmp_path), budget_mb=1)
+    content_cache.budget = 250
+
+    def write(content):
+        def write(path):
+            with open(path, "w") as f:
+                f.write(content)
+
+        return write
+
+    content_cache.store("a", write("a" * 100))
+    content_cache.store("b", write("b" * 100))
+    assert content_cache.lookup("a", "file") is not None
+    content_cache.store("c", write("c" * 100))
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert content_cache.size == 200
+
+
+def test_immutable_urls_are_replaced_by_cached_files(tmp_path, monkeypatch):
+    content_cache = ContentCache(str(tmp_path), budget_mb=1)
+    downloaded = []
+    monkeypatch.setattr(
+        content_cache, "get_file", lambda url: downloaded.append(url) or "f.png"
+    )
+    inputs = {
+        "image": "https://store.pollinations.ai/ipfs/Qm1/input.png",
+        "mask": "https://example.com/mask.png",
+        "prompt": "a cat",
+    }
+    assert content_cache.localize(inputs, "/cache") == {
+        "image": "/cache/f.png",
+        "mask": "https://example.com/mask.png",
+        "prompt": "a cat",
+    }
+    assert downloaded == ["https://store.pollinations.ai/ipfs/Qm1/input.png"]
+
+
+def test_cache_is_bound_from_a_folder_shared_with_the_host(monkeypatch, tmp_path):
+    profile = dict(setup_seconds=0, predict_seconds=0, output_bytes=1)
+    docker_client = FakeDockerClient({"r/model": profile})
+    volumes = {}
+    run = docker_client.containers.run
+
+    def record_volumes(image_name, **kwargs):
+        volumes.update(kwargs["volumes"])
+        return run(image_name, **kwargs)
+
+    monkeypatch.setattr(docker_client.containers, "run", record_volumes)
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setitem(vars(constants), "supabase_id", "test")
+    monkeypatch.setattr(constants, "setup_durations_path", str(tmp_path / "s.json"))
+    pool = cog_handler.ContainerPool(base_port=free_port())
+    pool.release(pool.acquire("r/model", str(tmp_path)))
+    docker_client.shutdown()
+    [host_path] = [
+        path
+        for path, bind in volumes.items()
+        if bind["bind"] == constants.cache_mount_path
+    ]
+    assert host_path == storage.content_cache.root
+    # the worker runs in a container: docker only finds the cached files on
+    # the host in a folder that update_agent mounts at the same path
+    commands = []
+    monkeypatch.setattr(update_agent, "system", commands.append)
+    update_agent.start_pollinator_if_not_running()
+    shared = re.findall(r"type=bind,source=([^,\s]+),target=\1\s", commands[0])
+    assert any(os.path.commonpath([host_path, root]) == root for root in shared)
@@ -0,0 +1,55 @@
+import threading
+
+from pollinator.claim import LocalClaims
+
+
+def pollen(input_cid, image="no-gpu-test-image", **kwargs):
+    return {"input": input_cid, "image": image, **kwargs}
+
+
+def test_claim_respects_priority_loaded_model_and_submit_time():
+    table = LocalClaims(
+        [
+            pollen("old", request_submit_time="2022-01-01"),
+            pollen("loaded", image="loaded-image", request_submit_time="2022-01-02"),
+            pollen("urgent", priority=1, request_submit_time="2022-01-03"),
+        ]
+    )
+    images = ["no-gpu-test-image", "loaded-image"]
+    claim = lambda: table.claim_next(images, ["loaded-image"], "w", "T4")  # noqa
+    assert claim()["input"] == "urgent"
+    assert claim()["input"] == "loaded"
+    assert claim()["input"] == "old"
+    assert claim() is None
+
+
+def test_claim_ignores_unavailable_images():
+    table = LocalClaims([pollen("a", image="other-image")])
+    assert table.claim_next(["no-gpu-test-image"], [], "w", "T4") is None
+
+
+def test_many_workers_never_claim_the_same_pollen():
+    num_pollen, num_workers = 500, 32
+    table = LocalClaims([pollen(f"cid-{i}") for i in range(num_pollen)])
+    claimed = [[] for _ in range(num_workers)]
+
+    def worker(i):
+        while (row := table.claim_next(["no-gpu-test-image"], [], i, "T4")) is not None:
+            assert row["worker"] == i
+            claimed[i].append(row["input"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    all_claimed = [cid for cids in claimed for cid in cids]
+    assert len(all_claimed) == num_pollen
+    assert len(set(all_claimed)) == num_pollen
+
+
+def test_released_pollen_can_be_claimed_again():
+    table = LocalClaims([pollen("a")])
+    assert table.claim_next(["no-gpu-test-image"], [], "w1", "T4")["input"] == "a"
+    table.release("a")
+    assert table.claim_next(["no-gpu-test-image"], [], "w2", "T4")["worker"] == "w2"
@@ -0,0 +1,115 @@
+import threading
+import time
+import types
+
+from benchmarks.fakes import FakeDockerClient, free_port
+from pollinator import constants, main
+from pollinator.cog_handler import ContainerPool, RunningCogModel
+from pollinator.logstream import NoLogs
+from pollinator.registry import ModelRegistry
+from pollinator.slots import Slot
+
+
+def registry_with(metadata):
+    registry = ModelRegistry(None, "test", None)
+    registry.metadata = metadata
+    return registry
+
+
+def test_concurrency_comes_from_the_model_index(monkeypatch):
+    registry = registry_with(
+        {
+            "r/text": {"meta": {"concurrency": 4}},
+            "r/greedy": {"meta": {"concurrency": 100}},
+            "r/image": {"meta": {}},
+        }
+    )
+    monkeypatch.setitem(vars(constants), "model_registry", registry)
+    assert constants.concurrency("r/text") == 4
+    assert constants.concurrency("r/greedy") == constants.max_concurrency
+    assert constants.concurrency("r/image") == 1
+    assert constants.concurrency("r/unknown") == 1
+
+
+def test_pollen_of_the_image_run_in_parallel_lanes(monkeypatch, tmp_path):
+    monkeypatch.setattr(constants, "ipfs_root", str(tmp_path))
+    monkeypatch.setattr(constants, "concurrency", lambda image: 3)
+    waiting = [{"input": f"Qm{i}", "image": "r/text", "attempt": 0} for i in range(7)]
+    monkeypatch.setattr(
+        main, "claim_ahead", lambda slot, image: waiting.pop(0) if waiting else None
+    )
+    monkeypatch.setattr(main, "remember_locked_message", lambda message, lane: None)
+    lock = threading.Lock()
+    in_flight, max_in_flight, lanes_used = [0], [0], {}
+
+    def process_message(message, lane):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            lanes_used[message["input"]] = lane.output_path
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+
+    monkeypatch.setattr(main, "process_message", process_message)
+    slot = Slot(0, num_slots=2)
+    main.process(waiting.pop(0), slot)
+    assert len(lanes_used) == 7
+    assert max_in_flight[0] == 3
+    assert len(set(lanes_used.values())) == 3
+
+
+def test_failed_container_is_stopped_by_the_last_lane(monkeypatch, tmp_path):
+    docker_client = FakeDockerClient(
+        {"r/text": dict(setup_seconds=0, predict_seconds=0, output_bytes=1)}
+    )
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setitem(vars(constants), "supabase_id", "test")
+    monkeypatch.setattr(constants, "setup_durations_path", str(tmp_path / "s.json"))
+    pool = ContainerPool(base_port=free_port())
+    cog = pool.acquire("r/text", str(tmp_path))
+    assert pool.acquire("r/text", str(tmp_path)) is cog
+    # one prediction crashed the server while the other is still running
+    pool.fail(cog)
+    pool.release(cog)
+    assert pool.containers["r/text"] is cog
+    pool.release(cog)
+    assert "r/text" not in pool.containers
+    assert pool.acquire("r/text", str(tmp_path)) is not cog
+    assert docker_client.started == ["r/text", "r/text"]
+    docker_client.shutdown()
+
+
+def test_failed_container_gets_no_new_pollen(monkeypatch, tmp_path):
+    docker_client = FakeDockerClient(
+        {"r/text": dict(setup_seconds=0, predict_seconds=0, output_bytes=1)}
+    )
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setitem(vars(constants), "supabase_id", "test")
+    monkeypatch.setattr(constants, "setup_durations_path", str(tmp_path / "s.json"))
+    pool = ContainerPool(base_port=free_port())
+    cog = pool.acquire("r/text", str(tmp_path))
+    pool.acquire("r/text", str(tmp_path))
+    pool.fail(cog)
+    pool.release(cog)
+    acquired = []
+    thread = threading.Thread(
+        target=lambda: acquired.append(pool.acquire("r/text", str(tmp_path)))
+    )
+    thread.start()
+    thread.join(0.2)
+    # the new pollen waits until the other lane stopped using the container
+    assert acquired == []
+    pool.release(cog)
+    thread.join(5)
+    assert acquired[0] is not cog
+    assert docker_client.started == ["r/text", "r/text"]
+    docker_client.shutdown()
+
+
+def test_logs_are_not_followed_in_a_shared_container(monkeypatch, tmp_path):
+    monkeypatch.setattr(constants, "concurrency", lambda image: 2)
+    slot = types.SimpleNamespace(pool=None, output_path=str(tmp_path))
+    assert isinstance(RunningCogModel("r/text", slot).follow_logs(), NoLogs)
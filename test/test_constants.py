@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+from pollinator import constants
+
+
+def test_import_has_no_side_effects():
+    # in a fresh interpreter, other tests may have loaded lazy values
+    check = (
+        "from pollinator import constants, main; "
+        "names = ('ip', 'hostname', 'supabase', 'has_gpu', 'docker_client'); "
+        "print([name for name in names if name in vars(constants)])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_lazy_values_are_created_once(monkeypatch):
+    calls = []
+    monkeypatch.setitem(constants._lazy, "ip", lambda: calls.append(1) or "1.2.3.4")
+    monkeypatch.delitem(vars(constants), "ip", raising=False)
+    assert constants.ip == "1.2.3.4"
+    assert constants.ip == "1.2.3.4"
+    assert calls == [1]
+    monkeypatch.delitem(vars(constants), "ip")
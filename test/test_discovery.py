@@ -0,0 +1,68 @@
+import threading
+import time
+
+from pollinator.discovery import Discovery, InMemoryNotifier
+
+
+def pollen(input_cid, **kwargs):
+    row = {"input": input_cid, "image": "no-gpu-test-image", "priority": 0}
+    row["processing_started"] = False
+    row.update(kwargs)
+    return row
+
+
+def test_events_update_local_view_without_querying():
+    queries = []
+
+    def fetch_rows():
+        queries.append(1)
+        return [pollen("a")]
+
+    notifier = InMemoryNotifier()
+    discovery = Discovery(fetch_rows, notifier, resync_interval=60)
+    discovery.start()
+    notifier.publish("INSERT", pollen("b"))
+    notifier.publish("UPDATE", pollen("a", processing_started=True))
+    notifier.publish("INSERT", pollen("c"))
+    notifier.publish("DELETE", old_record={"input": "c"})
+    assert [c["input"] for c in discovery.candidates()] == ["b"]
+    assert len(queries) == 1
+
+
+def test_released_pollen_becomes_visible_again():
+    notifier = InMemoryNotifier()
+    discovery = Discovery(lambda: [], notifier, resync_interval=60)
+    discovery.start()
+    notifier.publish("INSERT", pollen("a"))
+    notifier.publish("UPDATE", pollen("a", processing_started=True))
+    assert discovery.candidates() == []
+    notifier.publish("UPDATE", pollen("a", attempt=1))
+    assert [c["input"] for c in discovery.candidates()] == ["a"]
+
+
+def test_insert_wakes_up_waiting_worker():
+    notifier = InMemoryNotifier()
+    discovery = Discovery(lambda: [], notifier, resync_interval=60)
+    discovery.start()
+    discovery.wait_for_work()  # consume the wakeup of the initial resync
+    threading.Timer(0.1, notifier.publish, ("INSERT", pollen("a"))).start()
+    start = time.monotonic()
+    discovery.wait_for_work()
+    assert time.monotonic() - start < 5
+    assert len(discovery.candidates()) == 1
+
+
+def test_falls_back_to_polling_when_subscription_is_down():
+    queries = []
+
+    def fetch_rows():
+        queries.append(1)
+        return []
+
+    notifier = InMemoryNotifier()
+    discovery = Discovery(fetch_rows, notifier, resync_interval=60)
+    discovery.start()
+    notifier.stop()
+    discovery.candidates()
+    discovery.candidates()
+    assert len(queries) == 3
@@ -0,0 +1,50 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pollinator import http_client, metrics
+
+
+def start_server():
+    connections = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            connections.add(self.client_address)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", connections
+
+
+def test_requests_reuse_the_connection_and_are_counted():
+    server, url, connections = start_server()
+    before = http_client.requests_total.value(endpoint="storage", outcome="200")
+    for _ in range(5):
+        assert http_client.get("storage", url).text == "ok"
+    server.shutdown()
+    assert len(connections) == 1
+    after = http_client.requests_total.value(endpoint="storage", outcome="200")
+    assert after - before == 5
+    assert http_client.request_seconds.count(endpoint="storage") >= 5
+    assert 'pollinator_http_requests_total{endpoint="storage",outcome="200"}' in (
+        metrics.render()
+    )
+
+
+def test_failed_requests_are_counted_as_errors():
+    before = http_client.requests_total.value(endpoint="cog_health", outcome="error")
+    try:
+        http_client.get("cog_health", "http://127.0.0.1:9/")
+    except Exception:  # noqa
+        pass
+    after = http_client.requests_total.value(endpoint="cog_health", outcome="error")
+    assert after - before == 1
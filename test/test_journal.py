@@ -0,0 +1,86 @@
+from pollinator import main
+from pollinator.journal import Journal
+from pollinator.slots import Slot
+
+
+def test_replay_keeps_the_last_step_of_each_pollen(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    journal.record("a", "claimed", slot=0, attempt=1)
+    journal.record("b", "claimed", slot=1, attempt=0)
+    journal.record("a", "inputs_fetched")
+    journal.record("a", "outputs_written", success=True)
+    journal.record("b", "released")
+    with open(journal.path, "a") as f:
+        f.write('{"input": "c", "st')  # torn by a crash
+    pollens = journal.replay()
+    assert list(pollens) == ["a", "b"]
+    assert pollens["a"]["step"] == "outputs_written"
+    assert pollens["a"]["attempt"] == 1 and pollens["a"]["success"]
+    assert [p["input"] for p in journal.in_flight()] == ["a"]
+
+
+def test_only_the_last_prepared_pollen_owns_the_outputs(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    for cid in ["a", "b"]:
+        journal.record(cid, "claimed", slot=0, attempt=0)
+        journal.record(cid, "inputs_fetched")
+    journal.record("c", "claimed", slot=1, attempt=0)
+    assert journal.last_prepared(0) == "b"
+    assert journal.last_prepared(1) is None
+
+
+def test_compact_keeps_the_pollen_in_flight(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    journal.record("a", "claimed", slot=0, attempt=0)
+    journal.record("a", "inputs_fetched")
+    journal.record("b", "claimed", slot=0, attempt=0)
+    journal.record("b", "postprocessed")
+    journal.compact()
+    with open(journal.path) as f:
+        assert len(f.readlines()) == 1
+    assert journal.last_prepared(0) == "a"
+    assert journal.replay()["a"]["step"] == "inputs_fetched"
+
+
+def test_resume_continues_after_the_last_durable_step(monkeypatch, tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(main, "journal", journal)
+    calls = []
+    monkeypatch.setattr(main, "publish_outputs", lambda cid, slot: calls.append(cid))
+    monkeypatch.setattr(
+        main,
+        "finish_pollen",
+        lambda cid, update: calls.append((cid, update["success"])),
+    )
+    monkeypatch.setattr(main, "postprocess", lambda cid, out: calls.append(out))
+    monkeypatch.setattr(
+        main, "unlock_crashed_pollen", lambda cid, attempt: calls.append((cid, attempt))
+    )
+    # written by the slot, then stored but not post-processed, then only claimed
+    journal.record("done", "claimed", slot=0, attempt=0)
+    journal.record("done", "inputs_fetched")
+    journal.record("done", "outputs_written", success=True)
+    journal.record("stored", "claimed", slot=1, attempt=0)
+    journal.record("stored", "db_updated", output="bafy")
+    journal.record("waiting", "claimed", slot=0, attempt=2)
+
+    main.resume_from_journal([Slot(0, num_slots=2), Slot(1, num_slots=2)])
+    assert calls == ["done", ("done", True), "bafy", ("waiting", 2)]
+    # the released pollen is compacted away, the others were only mocked
+    assert [p["input"] for p in journal.in_flight()] == ["done", "stored"]
+
+
+def test_outputs_of_a_later_pollen_are_not_published(monkeypatch, tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(main, "journal", journal)
+    unlocked = []
+    monkeypatch.setattr(
+        main, "unlock_crashed_pollen", lambda cid, attempt: unlocked.append(cid)
+    )
+    journal.record("a", "claimed", slot=0, attempt=0)
+    journal.record("a", "inputs_fetched")
+    journal.record("a", "outputs_written", success=True)
+    journal.record("b", "claimed", slot=0, attempt=0)
+    journal.record("b", "inputs_fetched")
+    main.resume_from_journal([Slot(0, num_slots=2)])
+    assert unlocked == ["a", "b"]
@@ -0,0 +1,65 @@
+import gzip
+import queue
+
+from pollinator.logstream import CappedLog, LogFollower
+
+
+def test_log_keeps_head_and_tail(tmp_path):
+    log = CappedLog(str(tmp_path / "log"), max_bytes=20, flush_interval=0)
+    for i in range(10):
+        log.write(f"line {i}\n".encode())
+    log.close()
+    text = (tmp_path / "log").read_text()
+    assert text.startswith("line 0\nlin")
+    assert text.endswith(" 8\nline 9\n")
+    assert f"[... {log.skipped} bytes skipped ...]" in text
+    assert log.skipped == 70 - 20
+
+
+def test_log_is_written_incrementally(tmp_path):
+    log = CappedLog(str(tmp_path / "log"), max_bytes=100, flush_interval=0)
+    log.write(b"starting\n")
+    assert (tmp_path / "log").read_bytes() == b"starting\n"
+    log.write(b"x" * 100)
+    assert len((tmp_path / "log").read_bytes()) < 100 + 40
+    log.close()
+
+
+def test_compressed_log(tmp_path):
+    log = CappedLog(str(tmp_path / "log"))
+    log.write(b"hello\n")
+    assert log.close(compress=True) == str(tmp_path / "log.gz")
+    assert not (tmp_path / "log").exists()
+    assert gzip.open(tmp_path / "log.gz").read() == b"hello\n"
+
+
+class FakeStream:
+    def __init__(self):
+        self.chunks = queue.Queue()
+
+    def __iter__(self):
+        while (chunk := self.chunks.get()) is not None:
+            yield chunk
+
+    def close(self):
+        self.chunks.put(None)
+
+
+class FakeContainer:
+    name = "cogmodel"
+
+    def __init__(self):
+        self.stream = FakeStream()
+
+    def logs(self, **kwargs):
+        assert kwargs["stream"] and kwargs["follow"]
+        return self.stream
+
+
+def test_follower_waits_for_quiet_logs(tmp_path):
+    container = FakeContainer()
+    with LogFollower(container, str(tmp_path / "log"), quiet_for=0.1) as follower:
+        container.stream.chunks.put(b"loading\n")
+        container.stream.chunks.put(b"done\n")
+    assert (tmp_path / "log").read_bytes() == b"loading\ndone\n"
+    assert 0.1 <= follower.waited < 3
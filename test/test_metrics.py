@@ -0,0 +1,24 @@
+import requests
+
+from pollinator import metrics
+
+
+def test_gauge_keeps_the_last_value():
+    gauge = metrics.Gauge("test_queue_depth", "Pending pollen")
+    gauge.set(5)
+    gauge.set(3)
+    gauge.inc(-1)
+    assert gauge.value() == 2
+    assert "# TYPE test_queue_depth gauge\ntest_queue_depth 2\n" in metrics.render()
+
+
+def test_metrics_are_served_over_http():
+    counter = metrics.Counter("test_claims_total", "Claims")
+    counter.inc(method="lock", outcome="conflict")
+    server = metrics.serve(0, host="localhost")
+    url = f"http://localhost:{server.server_port}"
+    response = requests.get(f"{url}/metrics")
+    assert response.status_code == 200
+    assert 'test_claims_total{method="lock",outcome="conflict"} 1' in response.text
+    assert requests.get(f"{url}/other").status_code == 404
+    server.shutdown()
@@ -0,0 +1,64 @@
+import base64
+import json
+import os
+
+import pytest
+
+from pollinator.output_stream import OutputStreamWriter, write_http_response_files
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+
+def data_uri(content, mime="image/png"):
+    return f"data:{mime};base64,{base64.b64encode(content).decode()}"
+
+
+def stream(body, output_path, chunk_size):
+    writer = OutputStreamWriter(str(output_path))
+    for i in range(0, len(body), chunk_size):
+        writer.feed(body[i : i + chunk_size])
+    writer.close()
+    return {
+        name: open(os.path.join(output_path, name), "rb").read()
+        for name in os.listdir(output_path)
+    }
+
+
+RESPONSES = [
+    {"status": "succeeded", "output": [data_uri(b"first"), data_uri(b"second!")]},
+    {"output": data_uri(os.urandom(1000), "video/mp4"), "logs": 'a "quoted" log'},
+    {"logs": "output", "output": [{"file": data_uri(b"x" * 77)}], "metrics": [1, 2]},
+    {"input": {"output": "not this"}, "output": {"file": data_uri(b"\x00\xff")}},
+]
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 10**6])
+def test_streaming_matches_in_memory_decoder(tmp_path, response, chunk_size):
+    body = json.dumps(response).encode()
+    os.makedirs(tmp_path / "expected")
+    os.makedirs(tmp_path / "streamed")
+    write_http_response_files(FakeResponse(body), tmp_path / "expected")
+    expected = {
+        name: open(tmp_path / "expected" / name, "rb").read()
+        for name in os.listdir(tmp_path / "expected")
+    }
+    assert len(expected) > 0
+    assert stream(body, tmp_path / "streamed", chunk_size) == expected
+
+
+def test_escaped_slashes_and_non_data_outputs(tmp_path):
+    uri = data_uri(bytes(range(256)) * 4).replace("/", "\\/")
+    body = ('{"output": ["just text", "' + uri + '"]}').encode()
+    files = stream(body, tmp_path, 5)
+    assert files == {"out_1.png": bytes(range(256)) * 4}
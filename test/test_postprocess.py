@@ -0,0 +1,96 @@
+import threading
+import time
+
+from pollinator.postprocess import PostProcessQueue
+
+
+def test_jobs_run_in_the_background(tmp_path):
+    commands = []
+    queue = PostProcessQueue(str(tmp_path), run=lambda cmd: commands.append(cmd) or 0)
+    queue.start()
+    queue.enqueue("pin", "Qm1")
+    queue.enqueue("social_post", "Qm1")
+    assert queue.wait_until_empty(timeout=5)
+    assert sorted(commands) == [
+        "node /usr/local/bin/pinning-cli.js Qm1",
+        "node /usr/local/bin/social-post-cli.js Qm1",
+    ]
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_failed_jobs_are_retried_with_backoff(tmp_path):
+    attempts = []
+
+    def flaky(cmd):
+        attempts.append(time.monotonic())
+        return 0 if len(attempts) == 3 else 1
+
+    queue = PostProcessQueue(str(tmp_path), backoff=0.05, run=flaky)
+    queue.start()
+    queue.enqueue("pin", "Qm1")
+    assert queue.wait_until_empty(timeout=5)
+    assert len(attempts) == 3
+    assert attempts[2] - attempts[1] >= attempts[1] - attempts[0]
+
+
+def test_jobs_give_up_after_max_attempts(tmp_path):
+    queue = PostProcessQueue(str(tmp_path), max_attempts=2, backoff=0, run=lambda c: 1)
+    queue.start()
+    queue.enqueue("pin", "Qm1")
+    assert queue.wait_until_empty(timeout=5)
+    assert len(list((tmp_path / "failed").glob("*.json"))) == 1
+
+
+def test_jobs_survive_a_restart(tmp_path):
+    PostProcessQueue(str(tmp_path)).enqueue("pin", "Qm1")  # never started
+    done = threading.Event()
+    queue = PostProcessQueue(str(tmp_path), run=lambda cmd: done.set() or 0)
+    queue.start()
+    assert done.wait(5)
+    assert queue.wait_until_empty(timeout=5)
+
+
+def test_concurrency_is_bounded(tmp_path):
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(cmd):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return 0
+
+    queue = PostProcessQueue(str(tmp_path), workers=2, run=slow)
+    queue.start()
+    for i in range(10):
+        queue.enqueue("pin", f"Qm{i}")
+    assert queue.wait_until_empty(timeout=5)
+    assert peak[0] == 2
+
+
+def test_a_job_is_not_queued_twice(tmp_path):
+    commands = []
+    queue = PostProcessQueue(str(tmp_path), run=lambda cmd: commands.append(cmd) or 0)
+    queue.start()
+    queue.enqueue("social_post", "Qm1")
+    queue.enqueue("social_post", "Qm1")
+    assert queue.wait_until_empty(timeout=5)
+    # e.g. a pollen resumed after the job ran, but before it was journaled
+    restarted = PostProcessQueue(str(tmp_path), run=commands.append)
+    restarted.start()
+    restarted.enqueue("social_post", "Qm1")
+    assert restarted.wait_until_empty(timeout=5)
+    assert commands == ["node /usr/local/bin/social-post-cli.js Qm1"]
+
+
+def test_old_done_jobs_are_forgotten(tmp_path):
+    queue = PostProcessQueue(str(tmp_path), run=lambda cmd: 0)
+    queue.start()
+    queue.enqueue("pin", "Qm1")
+    assert queue.wait_until_empty(timeout=5)
+    assert (tmp_path / "done" / "pin-Qm1.json").exists()
+    PostProcessQueue(str(tmp_path), keep_done=-1).start()
+    assert not (tmp_path / "done" / "pin-Qm1.json").exists()
@@ -0,0 +1,64 @@
+from benchmarks.fakes import StorageStub
+from pollinator import constants, prefetch, storage
+from pollinator.cache import ContentCache
+from pollinator.claim import LocalClaims
+from pollinator.prefetch import Prefetcher
+
+
+def make_prefetcher(table, tmp_path):
+    return Prefetcher(
+        lambda image: table.claim_next([image], [image], "w", "T4"),
+        lambda message: table.release(message["input"]),
+        str(tmp_path / "prefetch_cid"),
+    )
+
+
+def test_prefetch_claims_next_pollen_and_resolves_inputs(monkeypatch, tmp_path):
+    monkeypatch.setattr(prefetch, "fetch_inputs", lambda cid: {"Prompt": cid})
+    table = LocalClaims([{"input": "a", "image": "x"}, {"input": "b", "image": "y"}])
+    prefetcher = make_prefetcher(table, tmp_path)
+    prefetcher.start("y")
+    ahead = prefetcher.take()
+    assert ahead.message["input"] == "b"
+    assert ahead.inputs == {"Prompt": "b"}
+    assert table.rows["b"]["processing_started"]
+    # until the caller journaled the pollen, a crash must release the claim
+    assert (tmp_path / "prefetch_cid").read_text() == "b"
+    prefetcher.forget()
+    assert not (tmp_path / "prefetch_cid").exists()
+    assert prefetcher.take() is None
+
+
+def test_release_gives_the_claim_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(prefetch, "fetch_inputs", lambda cid: {})
+    table = LocalClaims([{"input": "a", "image": "x"}])
+    prefetcher = make_prefetcher(table, tmp_path)
+    prefetcher.start("x")
+    prefetcher.release()
+    assert not table.rows["a"]["processing_started"]
+    assert not (tmp_path / "prefetch_cid").exists()
+
+
+def test_failed_input_fetch_keeps_the_claim(monkeypatch, tmp_path):
+    def fail(cid):
+        raise ValueError(cid)
+
+    monkeypatch.setattr(prefetch, "fetch_inputs", fail)
+    table = LocalClaims([{"input": "a", "image": "x"}])
+    prefetcher = make_prefetcher(table, tmp_path)
+    prefetcher.start("x")
+    ahead = prefetcher.take()
+    assert ahead.message["input"] == "a" and ahead.inputs is None
+
+
+def test_inputs_are_resolved_on_the_prefetch_thread(monkeypatch, tmp_path):
+    stub = StorageStub()
+    monkeypatch.setattr(constants, "storage_service_endpoint", stub.url.rstrip("/"))
+    monkeypatch.setattr(constants, "cache_referenced_files", False)
+    monkeypatch.setattr(storage, "content_cache", ContentCache(str(tmp_path), 1))
+    table = LocalClaims([{"input": "a", "image": "x"}])
+    prefetcher = make_prefetcher(table, tmp_path)
+    prefetcher.start("x")
+    ahead = prefetcher.take()
+    stub.stop()
+    assert ahead.inputs == {"Prompt": "a"}
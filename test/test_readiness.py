@@ -0,0 +1,81 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from pollinator.readiness import UnhealthyCogContainer, wait_until_ready
+
+
+class FakeEvents:
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while (event := self.queue.get()) is not None:
+            yield event
+
+    def close(self):
+        self.queue.put(None)
+
+
+class FakeContainer:
+    status = "running"
+
+
+class FakeContainers:
+    def get(self, name):
+        return FakeContainer()
+
+
+class FakeDockerClient:
+    def __init__(self):
+        self.stream = FakeEvents()
+        self.containers = FakeContainers()
+
+    def events(self, decode, filters):
+        return self.stream
+
+
+def start_cog_stub(ready_after):
+    started = time.monotonic()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            ready = time.monotonic() - started > ready_after
+            body = json.dumps({"status": "READY" if ready else "STARTING"})
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def test_fast_model_is_detected_quickly():
+    server, url = start_cog_stub(ready_after=0.2)
+    seconds = wait_until_ready(FakeDockerClient(), "cogmodel", url)
+    server.shutdown()
+    assert 0.2 <= seconds < 1
+
+
+def test_container_that_dies_fails_fast():
+    docker_client = FakeDockerClient()
+    server, url = start_cog_stub(ready_after=60)
+    threading.Timer(0.2, docker_client.stream.queue.put, ({"status": "die"},)).start()
+    start = time.monotonic()
+    with pytest.raises(UnhealthyCogContainer):
+        wait_until_ready(docker_client, "cogmodel", url, timeout=30)
+    server.shutdown()
+    assert time.monotonic() - start < 5
+
+
+def test_unreachable_model_times_out():
+    with pytest.raises(UnhealthyCogContainer):
+        wait_until_ready(FakeDockerClient(), "cogmodel", "http://127.0.0.1:9", 0.3)
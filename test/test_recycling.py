@@ -0,0 +1,170 @@
+import io
+import time
+import types
+
+from benchmarks.fakes import FakeDockerClient, free_port
+from pollinator import cog_handler, constants, recycling
+from pollinator.recycling import RecyclePolicy, Vitals
+
+
+def warmed_up(samples, latencies):
+    vitals = Vitals(warmup=1, window=3)
+    for memory, seconds in zip(samples, latencies):
+        vitals.observe_latency(seconds)
+        vitals.observe_sample({"memory_mb": memory})
+    return vitals
+
+
+def test_memory_growth_over_the_baseline():
+    policy = RecyclePolicy(memory_growth=0.5, latency_drift=0)
+    assert policy.reason(warmed_up([1000, 1200, 1400], [1, 1, 1])) is None
+    kind, _ = policy.reason(warmed_up([1000, 1200, 1600], [1, 1, 1]))
+    assert kind == "memory"
+
+
+def test_latency_drift():
+    policy = RecyclePolicy(memory_growth=0, latency_drift=1.5)
+    steady = warmed_up([1] * 7, [9, 1, 1, 1, 1, 1.2, 1])
+    assert policy.reason(steady) is None
+    slow = warmed_up([1] * 7, [9, 1, 1, 1, 2, 2, 1])
+    assert policy.reason(slow)[0] == "latency"
+
+
+def test_cpu_and_pollen_limits():
+    vitals = warmed_up([1, 1], [1, 1])
+    vitals.latest["cpu_percent"] = 95
+    assert RecyclePolicy().reason(vitals) is None
+    assert RecyclePolicy(cpu_percent=80).reason(vitals)[0] == "cpu"
+    assert RecyclePolicy(max_pollen=2).reason(vitals)[0] == "pollen"
+
+
+def test_cpu_percent_from_docker_stats():
+    stats = {
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 300},
+            "system_cpu_usage": 2000,
+            "online_cpus": 4,
+        },
+        "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+    }
+    assert recycling.cpu_percent(stats) == 80
+    assert recycling.cpu_percent({"memory_stats": {}}) is None
+
+
+def test_gpu_memory_of_the_slot(monkeypatch):
+    output = "0, 1200\n1, 300\n"
+    monkeypatch.setattr(recycling.utils, "popen", lambda cmd: io.StringIO(output))
+    assert recycling.gpu_memory_mb() == 1500
+    assert recycling.gpu_memory_mb(["1"]) == 300
+
+
+def test_degraded_container_is_restarted_while_idle(monkeypatch, tmp_path):
+    docker_client = FakeDockerClient(
+        {"r/model": dict(setup_seconds=0, predict_seconds=0, output_bytes=1)}
+    )
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setitem(vars(constants), "supabase_id", "test")
+    monkeypatch.setattr(constants, "recycle_defer_pollen", 2)
+    monkeypatch.setattr(constants, "setup_durations_path", str(tmp_path / "s.json"))
+    pool = cog_handler.ContainerPool(base_port=free_port())
+    pool.policy = RecyclePolicy(memory_growth=0, latency_drift=0, max_pollen=1)
+
+    cog = pool.acquire("r/model", str(tmp_path))
+    pool.release(cog)
+    pool.observe(cog, 1.0)
+    pool.check_vitals(cog)
+    assert cog.recycle_reason[0] == "pollen"
+    # with pollen waiting, the degraded container keeps serving for a while
+    assert pool.acquire("r/model", str(tmp_path)) is cog
+    # not while a pollen uses it
+    pool.recycle_degraded(str(tmp_path))
+    assert docker_client.started == ["r/model"]
+    pool.release(cog)
+    # the slot keeps polling while the container starts again
+    docker_client.profiles["r/model"]["setup_seconds"] = 3
+    start = time.monotonic()
+    pool.recycle_degraded(str(tmp_path))
+    assert time.monotonic() - start < 2
+    pool.restarting.join()
+    assert docker_client.started == ["r/model", "r/model"]
+    assert pool.containers["r/model"] is not cog
+    assert pool.containers["r/model"].recycle_reason is None
+    docker_client.shutdown()
+
+
+def pool_of(monkeypatch, tmp_path, images, **kwargs):
+    profile = dict(setup_seconds=0, predict_seconds=0, output_bytes=1)
+    docker_client = FakeDockerClient({image: profile for image in images})
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    monkeypatch.setitem(vars(constants), "supabase_id", "test")
+    monkeypatch.setattr(constants, "setup_durations_path", str(tmp_path / "s.json"))
+    monkeypatch.setattr(cog_handler, "memory_usage", {})
+    monkeypatch.setattr(cog_handler, "gpu_memory_usage", {})
+    return docker_client, cog_handler.ContainerPool(base_port=free_port(), **kwargs)
+
+
+def use(pool, image, tmp_path):
+    pool.release(pool.acquire(image, str(tmp_path)))
+
+
+def test_least_recently_used_container_is_evicted(monkeypatch, tmp_path):
+    docker_client, pool = pool_of(
+        monkeypatch, tmp_path, ["r/a", "r/b", "r/c"], memory_budget_mb=100000
+    )
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setattr(constants, "max_resident_models", 2)
+    for image in ["r/a", "r/b", "r/a", "r/c"]:
+        use(pool, image, tmp_path)
+    assert sorted(pool.containers) == ["r/a", "r/c"]
+    use(pool, "r/b", tmp_path)
+    assert sorted(pool.containers) == ["r/b", "r/c"]
+    assert docker_client.started == ["r/a", "r/b", "r/c", "r/b"]
+    docker_client.shutdown()
+
+
+def test_memory_budget_evicts_before_a_start(monkeypatch, tmp_path):
+    # every fake container uses 2048 MB
+    docker_client, pool = pool_of(
+        monkeypatch, tmp_path, ["r/a", "r/b", "r/c"], memory_budget_mb=5000
+    )
+    monkeypatch.setitem(vars(constants), "has_gpu", False)
+    monkeypatch.setattr(constants, "model_memory_mb", 2048)
+    for image in ["r/a", "r/b"]:
+        use(pool, image, tmp_path)
+    assert sorted(pool.containers) == ["r/a", "r/b"]
+    use(pool, "r/c", tmp_path)
+    assert sorted(pool.containers) == ["r/b", "r/c"]
+    docker_client.shutdown()
+
+
+def test_gpu_memory_budget_evicts_before_a_start(monkeypatch, tmp_path):
+    weights = {"r/a": 10000, "r/b": 10000, "r/c": 8000}
+    docker_client, pool = pool_of(
+        monkeypatch, tmp_path, list(weights), memory_budget_mb=100000
+    )
+    registry = types.SimpleNamespace(metadata={"r/b": {"meta": {}}})
+    monkeypatch.setitem(vars(constants), "model_registry", registry)
+    monkeypatch.setitem(vars(constants), "has_gpu", True)
+    monkeypatch.setattr(constants, "model_gpu_memory_mb", 12000)
+
+    def nvidia_smi(cmd):
+        if "memory.total" in cmd:
+            return io.StringIO("0, 24000\n")
+        running = docker_client.containers.running.values()
+        used = sum(weights[c.image.tags[0].split(":")[0]] for c in running)
+        return io.StringIO(f"0, {used}\n")
+
+    monkeypatch.setattr(recycling.utils, "popen", nvidia_smi)
+    for image in ["r/a", "r/b"]:
+        use(pool, image, tmp_path)
+    # host memory alone would keep all three, their weights do not fit the GPU
+    assert cog_handler.gpu_memory_usage == {"r/a": 10000, "r/b": 10000}
+    use(pool, "r/c", tmp_path)
+    assert sorted(pool.containers) == ["r/b", "r/c"]
+    assert cog_handler.gpu_memory_usage["r/c"] == 8000
+    # the declared GPU memory wins over the measured 10000 MB
+    registry.metadata["r/a"] = {"meta": {"gpu_memory_mb": 4000}}
+    use(pool, "r/a", tmp_path)
+    assert sorted(pool.containers) == ["r/a", "r/b", "r/c"]
+    docker_client.shutdown()
@@ -0,0 +1,101 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from pollinator.registry import ModelRegistry
+
+INDEX = {
+    "pollinations/a": {"meta": {"pollinator_group": ["T4"]}},
+    "pollinations/b": {"meta": {"pollinator_group": ["T4"]}},
+    "pollinations/c": {"meta": {"pollinator_group": ["A100"]}},
+}
+
+
+class IndexServer:
+    def __init__(self):
+        self.requests = []
+        self.fail = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if server.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                elif self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    body = json.dumps(INDEX).encode()
+                    self.send_response(200)
+                    self.send_header("ETag", '"v1"')
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("localhost", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_port}/metadata.json"
+
+
+class FakeImage:
+    def __init__(self, tag):
+        self.tags = [tag]
+        self.attrs = {}
+
+
+class FakeImages:
+    def __init__(self, tags):
+        self.tags = tags
+
+    def list(self):
+        return [FakeImage(tag) for tag in self.tags]
+
+
+class FakeDockerClient:
+    def __init__(self, tags):
+        self.images = FakeImages(tags)
+
+
+def test_available_models_are_served_from_memory():
+    index = IndexServer()
+    docker_client = FakeDockerClient(["pollinations/a:latest", "pollinations/c:latest"])
+    registry = ModelRegistry(index.url, "T4", docker_client, ["test-image"])
+    registry.refresh_index()
+    registry.refresh_local_images()
+    assert registry.available() == ["pollinations/a", "test-image"]
+    assert registry.available() == ["pollinations/a", "test-image"]
+    assert len(index.requests) == 1
+
+    docker_client.images.tags.append("pollinations/b:latest")
+    registry.refresh_local_images()
+    assert registry.available() == ["pollinations/a", "pollinations/b", "test-image"]
+    index.server.shutdown()
+
+
+def test_unchanged_index_is_not_downloaded_again():
+    index = IndexServer()
+    registry = ModelRegistry(index.url, "T4", FakeDockerClient([]))
+    registry.refresh_index()
+    registry.refresh_index()
+    assert index.requests[1]["If-None-Match"] == '"v1"'
+    assert len(registry.metadata) == 3
+    index.server.shutdown()
+
+
+def test_last_good_index_is_kept_when_a_refresh_fails():
+    index = IndexServer()
+    registry = ModelRegistry(
+        index.url, "T4", FakeDockerClient(["pollinations/a:latest"])
+    )
+    registry.refresh_index()
+    registry.refresh_local_images()
+    index.fail = True
+    registry.etag = None
+    registry.refresh_index()
+    assert registry.available() == ["pollinations/a"]
+    index.server.shutdown()
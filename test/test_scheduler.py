@@ -0,0 +1,58 @@
+import datetime as dt
+
+from pollinator.scheduler import AffinityScheduler
+
+NOW = dt.datetime(2022, 10, 1, 12, 0, 0)
+
+
+def pollen(image, waited=0, priority=0):
+    submitted = NOW - dt.timedelta(seconds=waited)
+    return {
+        "image": image,
+        "priority": priority,
+        "request_submit_time": submitted.isoformat(),
+    }
+
+
+def test_drains_loaded_image_before_switching():
+    scheduler = AffinityScheduler(swap_cost=120, max_wait=300)
+    candidates = [pollen("a", waited=60), pollen("b", waited=10), pollen("b", waited=5)]
+    assert scheduler.choose_image(candidates, ["b"], NOW) == "b"
+
+
+def test_higher_priority_always_wins():
+    scheduler = AffinityScheduler(swap_cost=120, max_wait=300)
+    candidates = [pollen("a", priority=1), pollen("b", waited=200), pollen("b")]
+    assert scheduler.choose_image(candidates, ["b"], NOW) == "a"
+
+
+def test_old_requests_do_not_starve():
+    scheduler = AffinityScheduler(swap_cost=120, max_wait=300)
+    candidates = [pollen("a", waited=400), pollen("b", waited=99)]
+    assert scheduler.choose_image(candidates, ["b"], NOW) == "a"
+
+
+def test_a_backlog_older_than_max_wait_does_not_swap_on_every_pollen():
+    scheduler = AffinityScheduler(swap_cost=120, max_wait=300)
+    # a and b requested in turns, all of them waiting for longer than max_wait
+    pending = [pollen("ab"[i % 2], waited=2000 - i * 10) for i in range(40)]
+    loaded, swaps = ["a"], 0
+    while len(pending) > 0:
+        image = scheduler.choose_image(pending, loaded, NOW)
+        swaps += image not in loaded
+        loaded = [image]
+        oldest = next(p for p in pending if p["image"] == image)
+        pending.remove(oldest)
+    assert swaps <= 4  # instead of 39 when serving strictly oldest first
+
+
+def test_switches_to_the_image_with_the_cheapest_swap_per_pollen():
+    scheduler = AffinityScheduler(swap_cost=120, max_wait=300, swap_costs={"b": 600})
+    candidates = [pollen("a"), pollen("a"), pollen("b"), pollen("b"), pollen("b")]
+    assert scheduler.choose_image(candidates, [], NOW) == "a"
+    candidates += [pollen("b") for _ in range(20)]
+    assert scheduler.choose_image(candidates, [], NOW) == "b"
+
+
+def test_no_candidates():
+    assert AffinityScheduler().choose_image([], ["a"]) is None
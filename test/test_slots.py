@@ -0,0 +1,46 @@
+import os
+
+from pollinator import constants
+from pollinator.slots import find_slot, make_slots
+
+
+def test_single_slot_keeps_legacy_paths(monkeypatch):
+    monkeypatch.setattr(constants, "has_gpu", False)
+    (slot,) = make_slots(1)
+    assert slot.output_path == constants.output_path
+    assert slot.input_path == constants.input_path
+    assert slot.input_cid_path == constants.input_cid_path
+    assert slot.pool.container_name(0) == "cogmodel"
+    assert slot.pool.base_port == 5000
+
+
+def test_cpu_slots_are_isolated(monkeypatch, tmp_path):
+    monkeypatch.setattr(constants, "has_gpu", False)
+    monkeypatch.setattr(constants, "ipfs_root", str(tmp_path))
+    slots = make_slots(3)
+    assert all(slot.gpu_id is None for slot in slots)
+    for attribute in ["output_path", "input_path", "input_cid_path", "attempt_path"]:
+        assert len({getattr(slot, attribute) for slot in slots}) == 3
+    assert len({slot.pool.container_name(0) for slot in slots}) == 3
+    ports = [
+        slot.pool.base_port + i
+        for slot in slots
+        for i in range(constants.max_resident_models)
+    ]
+    assert len(set(ports)) == len(ports)
+    assert all(os.path.isdir(slot.ipfs_root) for slot in slots)
+
+
+def test_lanes_share_the_pool_but_not_the_folders(monkeypatch, tmp_path):
+    monkeypatch.setattr(constants, "has_gpu", False)
+    monkeypatch.setattr(constants, "ipfs_root", str(tmp_path))
+    slots = make_slots(2)
+    lanes = slots[1].lanes(3)
+    assert lanes[0] is slots[1]
+    assert all(lane.pool is slots[1].pool for lane in lanes)
+    assert len({lane.output_path for lane in lanes}) == 3
+    # hidden, so the sync of the slot does not publish the outputs of its lanes
+    assert os.path.basename(lanes[2].ipfs_root) == ".lane2"
+    assert find_slot(slots, "1-2") is lanes[2]
+    assert find_slot(slots, 0) is slots[0]
+    assert find_slot(slots, 5) is None
@@ -0,0 +1,26 @@
+import subprocess
+import threading
+
+from benchmarks.fakes import StorageStub
+from pollinator import constants, storage
+from pollinator.cache import ContentCache
+from pollinator.storage import fetch_inputs, tree_kill
+
+
+def test_tree_kill_of_an_exited_command():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    tree_kill(proc.pid)
+
+
+def test_inputs_can_be_fetched_outside_the_main_thread(tmp_path, monkeypatch):
+    stub = StorageStub()
+    monkeypatch.setattr(constants, "storage_service_endpoint", stub.url.rstrip("/"))
+    monkeypatch.setattr(constants, "cache_referenced_files", False)
+    monkeypatch.setattr(storage, "content_cache", ContentCache(str(tmp_path), 1))
+    fetched = []
+    thread = threading.Thread(target=lambda: fetched.append(fetch_inputs("Qm1")))
+    thread.start()
+    thread.join()
+    stub.stop()
+    assert fetched == [{"Prompt": "Qm1"}]
@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+from pollinator.sync import LocalBackend, OutputSync, PollinateCliBackend
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_only_changed_files_are_uploaded(tmp_path):
+    root = str(tmp_path / "slot")
+    backend = LocalBackend(str(tmp_path / "store"))
+    sync = OutputSync(root, backend, "Qm1")
+    write(f"{root}/input/Prompt", '"a cat"')
+    write(f"{root}/output/out_0.png", "image")
+    write(f"{root}/.postprocess/job.json", "{}")
+    first = sync.sync()
+    assert backend.uploads == [["input/Prompt", "output/out_0.png"]]
+
+    assert sync.sync() == first
+    write(f"{root}/output/log", "done")
+    second = sync.sync()
+    assert backend.uploads[1:] == [["output/log"]]
+    assert second != first
+
+
+def test_small_files_are_batched(tmp_path):
+    root = str(tmp_path / "slot")
+    backend = LocalBackend(str(tmp_path / "store"))
+    for i in range(5):
+        write(f"{root}/output/out_{i}.txt", "x" * 40)
+    write(f"{root}/output/large.bin", "y" * 200)
+    OutputSync(root, backend, "Qm1", batch_bytes=100).sync()
+    assert [len(batch) for batch in backend.uploads] == [1, 2, 2, 1]
+
+
+def test_the_cid_depends_on_the_content(tmp_path):
+    cids = []
+    for attempt in range(2):
+        root = str(tmp_path / f"slot{attempt}")
+        write(f"{root}/output/out_0.png", "image")
+        cids.append(
+            OutputSync(root, LocalBackend(str(tmp_path / "store")), "Qm1").sync()
+        )
+    assert cids[0] == cids[1]
+
+
+def test_exit_publishes_the_final_outputs(tmp_path):
+    root = str(tmp_path / "slot")
+    backend = LocalBackend(str(tmp_path / "store"))
+    with OutputSync(root, backend, "Qm1", interval=0.01) as sync:
+        write(f"{root}/output/out_0.png", "image")
+    assert ["output/out_0.png"] in backend.uploads
+    assert os.path.exists(os.path.join(backend.path, sync.cid))
+
+
+def fake_pollinate_cli(monkeypatch, tmp_path, output):
+    """Prints `output`, and logs its arguments and the files it was given
+    to bin/calls"""
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    script = bin_path / "pollinate-cli.js"
+    calls = bin_path / "calls"
+    script.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {calls}\n'
+        f'(cd "$3" && find . -type f | sort) >> {calls}\n'
+        f"echo '{output}'\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_path}:{os.environ['PATH']}")
+    return calls
+
+
+def test_pollinate_cli_is_done_when_it_reports_the_cid(monkeypatch, tmp_path):
+    cid = "Qm" + "a" * 44
+    fake_pollinate_cli(monkeypatch, tmp_path, f"uploading\n{cid}")
+    assert PollinateCliBackend(str(tmp_path)).commit("Qm1", {}) == cid
+
+
+def test_pollinate_cli_output_without_a_cid_is_not_a_flush(monkeypatch, tmp_path):
+    fake_pollinate_cli(monkeypatch, tmp_path, "uploading")
+    with pytest.raises(RuntimeError):
+        PollinateCliBackend(str(tmp_path)).commit("Qm1", {})
+
+
+def test_pollinate_cli_only_sends_the_synced_files(monkeypatch, tmp_path):
+    calls = fake_pollinate_cli(monkeypatch, tmp_path, "Qm" + "a" * 44)
+    root = str(tmp_path / "slot")
+    write(f"{root}/input/Prompt", '"a cat"')
+    write(f"{root}/.journal.jsonl", "{}")
+    write(f"{root}/.lane1/output/out_0.png", "other pollen")
+    write(f"{root}/output/out_0.png", "image")
+    sync = OutputSync(root, PollinateCliBackend(root), "Qm1")
+    sync.sync()
+    os.remove(f"{root}/output/out_0.png")
+    write(f"{root}/output/out_1.png", "image")
+    sync.sync(final=True)
+    staging = os.path.join(root, ".sync")
+    assert calls.read_text().splitlines() == [
+        f"--send --path {staging} --once --nodeid Qm1",
+        "./input/Prompt",
+        "./output/out_0.png",
+        f"--send --path {staging} --once --nodeid Qm1 --ipns",
+        "./input/Prompt",
+        "./output/out_1.png",
+    ]
+
+
+class FailingBackend(LocalBackend):
+    def commit(self, name, manifest, final=False):
+        raise RuntimeError("storage is down")
+
+
+def test_a_failed_final_sync_is_raised(tmp_path):
+    root = str(tmp_path / "slot")
+    with pytest.raises(RuntimeError, match="storage is down"):
+        with OutputSync(root, FailingBackend(str(tmp_path / "store")), "Qm1"):
+            write(f"{root}/output/out_0.png", "image")
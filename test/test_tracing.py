@@ -0,0 +1,81 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from postgrest.exceptions import APIError
+
+from benchmarks.fakes import FakeSupabase, FakeTable
+from pollinator import constants, process_msg, tracing
+
+
+def test_spans_are_recorded_in_the_current_trace(tmp_path):
+    with tracing.start() as trace:
+        with tracing.span("fetch_inputs"):
+            time.sleep(0.01)
+        tracing.add("sync_wait", 0.5)
+        tracing.add("sync_wait", 0.25)
+        tracing.tag("container_state", "reused")
+        tracing.write(str(tmp_path))
+    summary = trace.summary()
+    assert summary["fetch_inputs"] >= 0.01
+    assert summary["sync_wait"] == 0.75
+    assert summary["container_state"] == "reused"
+    written = json.loads((tmp_path / "trace.json").read_text())
+    assert [span[0] for span in written["spans"]] == [
+        "fetch_inputs",
+        "sync_wait",
+        "sync_wait",
+    ]
+    assert written["container_state"] == "reused"
+
+
+def test_spans_outside_of_a_trace_are_ignored(tmp_path):
+    assert tracing.current() is None
+    with tracing.span("predict") as trace:
+        assert trace is None
+    tracing.add("log_flush", 1)
+    tracing.write(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_traces_are_dropped_once_the_column_is_missing(monkeypatch):
+    db = FakeSupabase()
+    cid = db.insert_pollen("pollen", "r/model")
+    table = db.table("pollen")
+    updates = []
+
+    def update(payload):
+        updates.append(sorted(payload))
+        if "trace" in payload:
+            raise APIError(
+                {
+                    "code": "PGRST204",
+                    "message": "Could not find the 'trace' column of 'pollen'",
+                }
+            )
+        return FakeTable.update(table, payload)
+
+    monkeypatch.setattr(table, "update", update)
+    monkeypatch.setattr(db, "table", lambda name: table)
+    monkeypatch.setitem(vars(constants), "supabase", db)
+    monkeypatch.setattr(constants, "db_name", "pollen")
+    monkeypatch.setattr(constants, "trace_column", "trace")
+    process_msg.update_pollen(cid, {"success": True, "trace": {}})
+    assert constants.trace_column is None
+    process_msg.update_pollen(cid, {"success": True})
+    assert updates == [["success", "trace"], ["success"], ["success"]]
+    assert db.unfinished("pollen") == []
+
+
+def test_other_db_errors_are_not_retried(monkeypatch):
+    def update(payload):
+        raise APIError({"code": "57014", "message": "statement timeout"})
+
+    db = FakeSupabase()
+    monkeypatch.setattr(db, "table", lambda name: SimpleNamespace(update=update))
+    monkeypatch.setitem(vars(constants), "supabase", db)
+    monkeypatch.setattr(constants, "trace_column", "trace")
+    with pytest.raises(APIError):
+        process_msg.update_pollen("Qm1", {"success": True, "trace": {}})
+    assert constants.trace_column == "trace"
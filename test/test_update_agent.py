@@ -0,0 +1,98 @@
+import threading
+import time
+
+import update_agent
+
+
+class FakeRegistry:
+    """Stand-in for DockerCLI: a registry with `remote` images and a local
+    docker with `local` images, both mapping names to image ids"""
+
+    def __init__(self, remote, local):
+        self.remote = remote
+        self.local = dict(local)
+        self.pulls = []
+        self.removed = []
+        self.pruned = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def login(self, registry):
+        pass
+
+    def local_id(self, image):
+        return self.local.get(image)
+
+    def remote_id(self, image):
+        return self.remote.get(image)
+
+    def pull(self, image):
+        with self.lock:
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        time.sleep(0.05)
+        with self.lock:
+            self.concurrent -= 1
+            self.pulls.append(image)
+        self.local[image] = self.remote[image]
+        return True
+
+    def tag(self, image, name):
+        self.local[name] = self.local[image]
+
+    def remove(self, name):
+        self.removed.append(name)
+        self.local.pop(name, None)
+
+    def prune_dangling(self):
+        self.pruned += 1
+
+
+def test_only_changed_images_are_pulled():
+    registry = FakeRegistry(
+        remote={"a:latest": "sha256:2", "b:latest": "sha256:1", "c@sha256:9": "x"},
+        local={"a:latest": "sha256:1", "b:latest": "sha256:1", "c@sha256:9": "x"},
+    )
+    images = ["a:latest", "b:latest", "c@sha256:9"]
+    assert update_agent.update_images(images, registry) == ["a:latest"]
+    assert registry.pulls == ["a:latest"]
+    assert update_agent.update_images(images, registry) == []
+
+
+def test_images_are_pulled_in_parallel_and_tagged():
+    remote = {f"m{i}@sha256:{i}": f"sha256:{i}" for i in range(6)}
+    registry = FakeRegistry(remote=remote, local={})
+    update_agent.update_images(list(remote), registry, parallelism=3)
+    assert sorted(registry.pulls) == sorted(remote)
+    assert registry.max_concurrent == 3
+    assert registry.local["m0"] == "sha256:0"
+
+
+def test_unknown_remote_digest_means_pull(monkeypatch):
+    registry = FakeRegistry(remote={}, local={"a:latest": "sha256:1"})
+    registry.remote_id = lambda image: None
+    registry.pull = lambda image: registry.pulls.append(image) or False
+    # pulled, but nothing new was downloaded, so nothing needs a restart
+    assert update_agent.update_images(["a:latest"], registry) == []
+    assert registry.pulls == ["a:latest"]
+    monkeypatch.setattr(update_agent, "pollinator_image", "a:latest")
+    assert not update_agent.fetch_pollinator(registry)
+
+
+def test_only_images_that_left_the_index_are_removed(tmp_path):
+    state = str(tmp_path / "images.json")
+    registry = FakeRegistry(remote={}, local={})
+    update_agent.remove_retired_images(
+        ["r/a@sha256:1", "r/b@sha256:2"], registry, state
+    )
+    assert registry.removed == []
+    update_agent.remove_retired_images(["r/a@sha256:3"], registry, state)
+    assert registry.removed == ["r/b"]
+    assert registry.pruned == 2
+
+
+def test_repository_strips_tag_and_digest():
+    assert update_agent.repository("host:5000/r/a:latest") == "host:5000/r/a"
+    assert update_agent.repository("host:5000/r/a@sha256:1") == "host:5000/r/a"
+    assert update_agent.repository("r/a") == "r/a"
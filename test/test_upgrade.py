@@ -0,0 +1,67 @@
+import threading
+
+from benchmarks.fakes import FakeDockerClient, free_port
+from pollinator import constants, main
+from pollinator.cog_handler import ContainerPool
+from pollinator.upgrade import UpdateWatcher, read_handover, write_handover
+
+
+def test_watcher_drains_once_a_new_image_is_there():
+    outdated = threading.Event()
+    watcher = UpdateWatcher(outdated.is_set, interval=0.01)
+    watcher.start()
+    assert not watcher.draining.wait(0.05)
+    outdated.set()
+    assert watcher.draining.wait(1)
+
+
+def test_watcher_survives_failing_checks():
+    checks = []
+
+    def is_outdated():
+        checks.append(1)
+        if len(checks) == 1:
+            raise RuntimeError("docker is not reachable")
+        return True
+
+    watcher = UpdateWatcher(is_outdated, interval=0.01)
+    watcher.start()
+    assert watcher.draining.wait(1)
+
+
+def test_handover_is_read_once(tmp_path):
+    path = str(tmp_path / "handover.json")
+    assert read_handover(path) == {}
+    write_handover(path, [{"name": "cogmodel", "pollen_since_container_start": 3}])
+    assert read_handover(path)["cogmodel"]["pollen_since_container_start"] == 3
+    assert read_handover(path) == {}
+
+
+def test_new_worker_takes_over_warm_containers(monkeypatch, tmp_path):
+    port = free_port()
+    docker_client = FakeDockerClient(
+        {"r/model": dict(setup_seconds=0, predict_seconds=0, output_bytes=1)}
+    )
+    monkeypatch.setitem(vars(constants), "docker_client", docker_client)
+    docker_client.containers.run("r/model", "cogmodel", ports={"5000/tcp": port})
+    old = ContainerPool(base_port=port)
+    old.adopt_running_containers()
+    old.containers["r/model"].pollen_since_container_start = 7
+    path = str(tmp_path / "handover.json")
+    write_handover(path, old.handover_state())
+
+    new = ContainerPool(base_port=port)
+    new.adopt_running_containers(read_handover(path))
+    assert new.containers["r/model"].pollen_since_container_start == 7
+    assert docker_client.started == ["r/model"]
+    docker_client.shutdown()
+
+
+def test_draining_worker_stops_claiming(monkeypatch):
+    watcher = UpdateWatcher(lambda: False)
+    watcher.drain()
+    monkeypatch.setattr(main, "update_watcher", watcher)
+    monkeypatch.setattr(main, "claims", object())
+    monkeypatch.setattr(main, "claim_task", lambda slot: 1 / 0)
+    main.finish_all_tasks(slot=None)
+    assert main.claim_ahead(slot=None, image="r/model") is None
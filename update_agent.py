@@ -2,11 +2,14 @@
 This script is executed from the host machine and not the container.
 It is responsible for keeping the instance in a healthy and updated state.
 This involves:
-- fetching the latest images referenced in model-index
+- fetching the latest images referenced in model-index: only images whose
+    digest changed are pulled, several at a time, after logging in once
 - fetching the latest version of pollinator
-- killing the container and restart the updated container as soon as an update is available and
-    the running pollinator is not busy anymore
+- restarting pollinator as soon as an update is available: the running pollinator notices the
+    new image, finishes its current pollen and exits, leaving the cog containers running, and
+    the agent starts the new one right away, which takes over the warm containers
 - run migrations: one-time bash scripts that change something about the host machine
+- removing the images of models that left the model index
 
 Host environment assumptions:
 - there is a ~/.env file with all secrets and environment variables
@@ -14,6 +17,8 @@ Host environment assumptions:
 import json
 import logging
 import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from urllib.request import urlopen
 
 import dotenv
@@ -57,31 +62,128 @@ def load_web_json(url):
     return json.loads(response.read())
 
 
-def pull(image):
-    pull_cmd = """
-    aws ecr get-login-password \
-        --region us-east-1 \
-    | docker login \
-        --username AWS \
-        --password-stdin 614871946825.dkr.ecr.us-east-1.amazonaws.com
-    docker pull {}
-    """.format(
-        image
-    )
-    response = system(pull_cmd)
-    is_updated = "Status: Downloaded newer image for" in response
-    return is_updated
+ECR_REGISTRY = "614871946825.dkr.ecr.us-east-1.amazonaws.com"
+pull_parallelism = int(os.environ.get("POLLINATOR_PULL_PARALLELISM", 3))
+# seconds the running pollinator gets to finish its pollen before it is killed
+drain_timeout = int(os.environ.get("POLLINATOR_DRAIN_TIMEOUT", 1800))
+# repositories pulled by earlier runs, to find the ones that left the index
+pulled_repositories_path = os.path.join(home_dir, ".pollinator_images.json")
 
 
-def fetch_images():
-    log("Fetching images")
-    images = load_web_json(
-        "https://raw.githubusercontent.com/pollinations/model-index/main/images.json"
-    )
-    metadata = load_web_json(
-        "https://raw.githubusercontent.com/pollinations/model-index/main/metadata.json"
-    )
+def run(cmd):
+    """Run a command without a shell, return (exit code, stdout)"""
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode, result.stdout
+
+
+class DockerCLI:
+    """The docker operations of the agent. The agent runs on the host with
+    nothing but python-dotenv installed, so it uses the docker CLI."""
+
+    def login(self, registry):
+        system(
+            f"aws ecr get-login-password --region us-east-1 "
+            f"| docker login --username AWS --password-stdin {registry}"
+        )
+
+    def local_id(self, image):
+        code, out = run(["docker", "image", "inspect", "--format", "{{.Id}}", image])
+        return out.strip() if code == 0 else None
+
+    def remote_id(self, image):
+        """Id (config digest) of the image in the registry, which is what
+        `local_id` returns once it is pulled. None if it can't be found out."""
+        code, out = run(["docker", "manifest", "inspect", "--verbose", image])
+        if code != 0:
+            return None
+        try:
+            manifests = json.loads(out)
+        except ValueError:
+            return None
+        if isinstance(manifests, dict):
+            manifests = [manifests]
+        for manifest in manifests:
+            platform = manifest.get("Descriptor", {}).get("platform", {})
+            if platform.get("architecture", "amd64") != "amd64":
+                continue
+            schema = manifest.get("SchemaV2Manifest") or manifest.get("OCIManifest")
+            try:
+                return schema["config"]["digest"]
+            except (KeyError, TypeError):
+                return None
+        return None
+
+    def pull(self, image):
+        response = system(f"docker pull {image}")
+        return "Status: Downloaded newer image for" in response
+
+    def tag(self, image, name):
+        system(f"docker tag {image} {name}")
+
+    def remove(self, name):
+        system(f"docker rmi {name}")
+
+    def wait_for_exit(self, container, timeout):
+        """True once the container exited (or does not exist), False on timeout"""
+        try:
+            subprocess.run(["docker", "wait", container], timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+    def kill(self, container):
+        system(f"docker kill {container}")
+
+    def prune_dangling(self):
+        # only untagged images, layers shared with tagged images are kept
+        system("docker image prune -f")
+
+
+def repository(image):
+    """Image name without tag and digest"""
+    name = image.split("@")[0]
+    if ":" in name.rsplit("/", 1)[-1]:
+        name = name.rsplit(":", 1)[0]
+    return name
 
+
+def is_up_to_date(image, docker):
+    """Images pinned by digest are up to date if the digest is present.
+    For tags, the local image id is compared with the one in the registry."""
+    local_id = docker.local_id(image)
+    if local_id is None:
+        return False
+    if "@" in image:
+        return True
+    remote_id = docker.remote_id(image)
+    return remote_id is not None and remote_id == local_id
+
+
+def update_images(images, docker, parallelism=pull_parallelism):
+    """Pull the images that changed, `parallelism` at a time.
+    Returns the images of which the pull downloaded a newer image."""
+    outdated = [image for image in images if not is_up_to_date(image, docker)]
+    for image in sorted(set(images) - set(outdated)):
+        log(f"# Up to date: {image}")
+    if len(outdated) == 0:
+        return []
+
+    def pull(image):
+        updated = docker.pull(image)
+        if "@" in image:
+            docker.tag(image, image.split("@")[0])
+        return updated
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        updated = list(executor.map(pull, outdated))
+    # an unknown remote digest counts as outdated, but the pull may find
+    # that nothing changed
+    return [image for image, downloaded in zip(outdated, updated) if downloaded]
+
+
+def model_images(images, metadata):
+    """Images of the model index that belong to our pollinator group"""
+    wanted = []
     for _, image in images.items():
         try:
             assert (
@@ -91,17 +193,55 @@ def fetch_images():
         except (AssertionError, KeyError):
             log(f"# Ignore {image}")
             continue
-        pull(image)
-        if "@" in image:
-            system(f"docker tag {image} {image.split('@')[0]}")
+        wanted.append(image)
+    return wanted
+
+
+def remove_retired_images(wanted, docker, state_path=pulled_repositories_path):
+    """Remove the images of repositories that were pulled by an earlier run
+    but are no longer in the model index, then dangling (replaced) images"""
+    try:
+        with open(state_path) as f:
+            previous = set(json.load(f))
+    except (FileNotFoundError, ValueError):
+        previous = set()
+    current = {repository(image) for image in wanted}
+    for name in sorted(previous - current):
+        log(f"# Removing {name}, it left the model index")
+        docker.remove(name)
+    with open(state_path, "w") as f:
+        json.dump(sorted(current), f)
+    docker.prune_dangling()
 
 
-def fetch_pollinator():
+def fetch_images(docker):
+    log("Fetching images")
+    images = load_web_json(
+        "https://raw.githubusercontent.com/pollinations/model-index/main/images.json"
+    )
+    metadata = load_web_json(
+        "https://raw.githubusercontent.com/pollinations/model-index/main/metadata.json"
+    )
+    wanted = model_images(images, metadata)
+    update_images(wanted, docker)
+    return wanted
+
+
+def fetch_pollinator(docker):
     log("Fetching pollinator")
-    needs_restart = pull(pollinator_image)
+    needs_restart = len(update_images([pollinator_image], docker)) > 0
     return needs_restart
 
 
+def hand_over_pollinator(docker, timeout=drain_timeout):
+    """Wait until the running pollinator drained, so the new one can be
+    started without waiting for the next run of the agent"""
+    log("Waiting for the running pollinator to finish its pollen")
+    if not docker.wait_for_exit("pollinator", timeout):
+        log(f"Pollinator did not exit within {timeout}s, killing it")
+        docker.kill("pollinator")
+
+
 def start_pollinator_if_not_running():
     pollinator_cmd = f"""docker run {gpu_flag} --rm \\
         --network host \\
@@ -115,10 +255,14 @@ def start_pollinator_if_not_running():
 
 
 def main():
-    fetch_pollinator()
+    docker = DockerCLI()
+    # once per run, needed to compare digests and to pull
+    docker.login(ECR_REGISTRY)
+    if fetch_pollinator(docker):
+        hand_over_pollinator(docker)
     start_pollinator_if_not_running()
-    fetch_images()
-    system("docker system prune -f")
+    wanted = fetch_images(docker)
+    remove_retired_images(wanted + [pollinator_image], docker)
 
 
 if __name__ == "__main__":